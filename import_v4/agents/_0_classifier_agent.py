@@ -1,25 +1,35 @@
 """Exam Type Classifier Agent"""
 
-import json
+import asyncio
+import base64
+import functools
+import hashlib
 import time
-from typing import Tuple, TYPE_CHECKING
+import weakref
+from io import BytesIO
+from typing import List, Literal, Optional, Tuple
 from loguru import logger
+from PIL import Image
+from pydantic import BaseModel, ConfigDict, ValidationError
 from agents import Usage
 
-if TYPE_CHECKING:
-    from . import UsageWithDuration
+from ._usage import UsageWithDuration
 
 from ..config.settings import settings
-from ..models.schemas import ExamTypeOutput
+from ..utils.usage_tracker import usage_from_response
+from ..utils.json_cache import cache_entry_path, read_json_entry, write_json_entry
 from ..clients.client_manager import ClientManager
-from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
+from ..clients.base import BaseModelClient, LLMMessage, MessageContent, MessageRole, ContentType
 
 
-def get_classifier_prompt() -> str:
-    """
-    分类器提示词（与 import_v3 一致）
-    """
-    return """Analyze the provided pages of this exam and determine its type.
+# 常用枚举值绑定为模块级常量，减少热路径上的属性查找
+_TEXT = ContentType.TEXT
+_IMAGE = ContentType.IMAGE
+_SYSTEM = MessageRole.SYSTEM
+_USER = MessageRole.USER
+
+# 分类器提示词（与 import_v3 一致），模块加载时构建一次
+_CLASSIFIER_PROMPT: str = """Analyze the provided pages of this exam and determine its type.
 
 **Type1** (Separate Answer Booklet):
 - Explicitly states "Use a SEPARATE writing booklet" or similar
@@ -52,8 +62,149 @@ Return JSON with:
 **Important**: Base your decision on multiple indicators, not just one feature.
 """
 
+# 提示词版本：修改 _CLASSIFIER_PROMPT 时递增，使旧的缓存结果失效
+_CLASSIFIER_PROMPT_VERSION = "v2"
+
+# 系统消息不随输入变化，复用同一个实例
+_SYSTEM_MESSAGE = LLMMessage(role=_SYSTEM, content=_CLASSIFIER_PROMPT)
+
+def get_classifier_prompt() -> str:
+    """
+    分类器提示词（与 import_v3 一致）
+    """
+    return _CLASSIFIER_PROMPT
+
+
+# 每个事件循环复用一个分类器客户端（底层 httpx 连接池绑定在事件循环上）
+_client_cache: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BaseModelClient]" = weakref.WeakKeyDictionary()
+
+
+def _get_client() -> BaseModelClient:
+    """获取当前事件循环的分类器客户端，首次调用时创建"""
+    loop = asyncio.get_running_loop()
+    client = _client_cache.get(loop)
+    if client is None:
+        client = ClientManager.create_classifier_client()
+        _client_cache[loop] = client
+    return client
+
+
+def _cache_key(selected_pages: List[dict], model: str) -> str:
+    """分类缓存键：提示词版本 + 模型 + 所有页面图片的哈希（直接哈希 base64 文本，无需解码）；更换分类模型时自动失效"""
+    hasher = hashlib.blake2b(f"{_CLASSIFIER_PROMPT_VERSION}|{model}".encode("utf-8"), digest_size=32)
+    for page in selected_pages:
+        hasher.update(page["image_base64"].encode("ascii"))
+    return hasher.hexdigest()
+
+
+async def _load_cached_result(cache_key: str) -> Optional[dict]:
+    """读取一条分类结果缓存（每个键一个 JSON 文件，在线程中读取，不阻塞事件循环）"""
+    return await asyncio.to_thread(read_json_entry, cache_entry_path(settings.classifier_cache_dir, cache_key))
+
+
+async def _save_cached_result(cache_key: str, result: dict) -> None:
+    """写入一条分类结果缓存（只写本条目，多进程并发写入不会覆盖彼此的结果）"""
+    try:
+        await asyncio.to_thread(write_json_entry, cache_entry_path(settings.classifier_cache_dir, cache_key), result)
+    except OSError as e:
+        logger.warning(f"Failed to write classifier cache: {e}")
+
+
+class _ClassifierResult(BaseModel):
+    """分类响应中实际用到的三个字段（其余字段直接忽略，缺省值与旧的 dict.get 一致）"""
+    model_config = ConfigDict(extra="ignore")
+    
+    exam_type: Literal["type1", "type2"] = "type1"
+    reasoning: str = ""
+    confidence: Optional[float] = None
+
+
+@functools.lru_cache(maxsize=64)
+def _header_text(page_numbers: Tuple[int, ...]) -> MessageContent:
+    """
+    用户消息开头的文本块（只取决于页码组合，按页码元组缓存）
+    
+    同一批试卷通常选中相同的页码（如倒数第 2、4、6 页），重复调用直接复用已构建的对象。
+    """
+    page_labels = " / ".join(f"Page {page_number}" for page_number in page_numbers)
+    return MessageContent(
+        type=_TEXT,
+        text=f"Analyze these pages to determine exam type ({page_labels}):"
+    )
+
+
+def _page_image_content(page: dict) -> MessageContent:
+    """
+    构造页面图片的消息内容
+    
+    尺寸已在 classifier_image_max_edge 以内的页面直接使用原始 base64（不解码、不重新编码）；
+    超出的页面才解码、缩小并重新编码为 JPEG。
+    """
+    max_edge = settings.classifier_image_max_edge
+    if max(page.get("width", max_edge + 1), page.get("height", max_edge + 1)) <= max_edge:
+        return MessageContent.model_construct(
+            type=_IMAGE,
+            image_base64=page["image_base64"],
+            image_media_type="image/png",
+            detail="low"
+        )
+    
+    shrunk = _shrink_bytes(
+        base64.b64decode(page["image_base64"]),
+        max_edge=max_edge,
+        quality=settings.classifier_image_quality
+    )
+    return MessageContent.model_construct(
+        type=_IMAGE,
+        image_base64=base64.b64encode(shrunk).decode("utf-8"),
+        image_media_type="image/jpeg",
+        detail="low"
+    )
+
+
+def _fast_exam_type(content: str) -> Optional[str]:
+    """
+    不解析 JSON，直接在 "exam_type" 键附近查找 "type1"/"type2"
+    
+    Returns:
+        唯一匹配时返回试卷类型；找不到或两者都出现时返回 None（交给完整解析）
+    """
+    idx = content.find('"exam_type"')
+    if idx < 0:
+        return None
+    tail = content[idx:idx + 40]
+    is_type1 = '"type1"' in tail
+    is_type2 = '"type2"' in tail
+    if is_type1 == is_type2:
+        return None
+    return "type1" if is_type1 else "type2"
+
+
+def _shrink_bytes(image_bytes: bytes, max_edge: int = 1024, quality: int = 75) -> bytes:
+    """
+    缩小并重新压缩页面图片（分类只需看清答题线等粗粒度特征）
+    
+    Args:
+        image_bytes: 原始图片字节
+        max_edge: 最长边像素上限
+        quality: JPEG 压缩质量
+    
+    Returns:
+        JPEG 图片字节
+    """
+    with Image.open(BytesIO(image_bytes)) as img:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        buffer = BytesIO()
+        img.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
 
-async def classify_exam_type_direct(classification_data: dict) -> Tuple[str, "UsageWithDuration"]:
+async def classify_exam_type_direct(
+    classification_data: dict,
+    fast_path: bool = False,
+    stream: bool = False,
+    want_usage: bool = True
+) -> Tuple[str, Optional[UsageWithDuration]]:
     """
     使用 clients 直接调用 API 进行试卷类型分类（不使用 agents 框架）
     
@@ -64,64 +215,63 @@ async def classify_exam_type_direct(classification_data: dict) -> Tuple[str, "Us
     
     Args:
         classification_data: 预处理数据，包含 selected_pages
+        fast_path: 是否绕过 SDK 直接 POST（client.aquery_direct）
+        stream: 是否使用流式响应（client.astream_query），边接收边拼接内容
+        want_usage: 是否需要使用统计；False 时跳过 Usage 构造和相关日志，返回 (试卷类型, None)
     
     Returns:
-        Tuple[str, UsageWithDuration]: (试卷类型, API使用统计含时间)
+        Tuple[str, Optional[UsageWithDuration]]: (试卷类型, API使用统计含时间)
     """
-    from . import UsageWithDuration
-    
     # 记录开始时间
-    start_time = time.time()
+    start_time = time.perf_counter()
     
-    # 创建客户端
-    client = ClientManager.create_classifier_client()
+    # 获取（复用）客户端
+    client = _get_client()
     
     selected_pages = classification_data["selected_pages"]
     page_numbers = [p["page_number"] for p in selected_pages]
     
-    logger.info(f"📊 Classifying exam type using pages (Direct API): {page_numbers}")
+    logger.info("📊 Classifying exam type using pages (Direct API): {}", page_numbers)
     
-    # 构建系统提示
-    system_prompt = get_classifier_prompt()
+    # 查询缓存（相同页面 + 相同提示词版本 + 相同模型的分类结果是确定的）
+    cache_key = None
+    if settings.classifier_cache_enabled:
+        cache_key = _cache_key(selected_pages, client.get_model_name())
+        cached = await _load_cached_result(cache_key)
+        if cached:
+            duration = time.perf_counter() - start_time
+            logger.info("✓ Classification result (Cached): {}", cached["exam_type"])
+            logger.opt(lazy=True).debug("   Reasoning: {}", lambda: cached.get("reasoning", ""))
+            if not want_usage:
+                return cached["exam_type"], None
+            return cached["exam_type"], UsageWithDuration(usage=Usage(), duration_seconds=duration)
     
     # 构建用户消息（包含3张图片）
+    # 页码合并到一个文本块中，图片按相同顺序紧随其后（不再逐页插入文本分隔）
+    # 字段均由本函数构造，使用 model_construct 跳过逐个对象的校验
     user_content = [
-        MessageContent(
-            type=ContentType.TEXT,
-            text="Analyze these pages to determine exam type:"
-        )
+        _header_text(tuple(page_numbers)),
+        *(_page_image_content(page) for page in selected_pages)
     ]
     
-    # 添加每个页面的图片
-    for page in selected_pages:
-        user_content.append(
-            MessageContent(
-                type=ContentType.TEXT,
-                text=f"\n\nPage {page['page_number']}:"
-            )
-        )
-        user_content.append(
-            MessageContent(
-                type=ContentType.IMAGE,
-                image_base64=page['image_base64']
-            )
-        )
-    
     # 构建消息列表
     messages = [
+        _SYSTEM_MESSAGE,
         LLMMessage(
-            role=MessageRole.SYSTEM,
-            content=system_prompt
-        ),
-        LLMMessage(
-            role=MessageRole.USER,
+            role=_USER,
             content=user_content
         )
     ]
     
     # 调用 API（使用 JSON 模式）
+    if stream:
+        query = client.astream_query
+    elif fast_path:
+        query = client.aquery_direct
+    else:
+        query = client.aquery
     try:
-        response = await client.aquery(
+        response = await query(
             messages=messages,
             temperature=0.0,
             max_tokens=2000,  # 增加限制以确保完整响应（分类任务简单，2000足够）
@@ -145,38 +295,63 @@ async def classify_exam_type_direct(classification_data: dict) -> Tuple[str, "Us
             else:
                 raise ValueError("API returned empty content. This may be due to a refusal or error.")
         
-        # 解析 JSON 响应
-        response_data = json.loads(response.content)
-        
-        # 提取分类结果
-        exam_type = response_data.get("exam_type", "type1")
-        reasoning = response_data.get("reasoning", "")
-        confidence = response_data.get("confidence")
+        # 快速路径：结果明确时直接取 exam_type，跳过 JSON 解析
+        exam_type = _fast_exam_type(response.content) if settings.fast_classify_parse else None
+        if exam_type:
+            reasoning = ""
+            confidence = None
+            logger.debug("Fast-parsed exam type from response: {}", exam_type)
+        else:
+            # 解析 JSON 响应（只提取需要的字段，不经过中间 dict）
+            parsed = _ClassifierResult.model_validate_json(response.content)
+            
+            # 提取分类结果
+            exam_type = parsed.exam_type
+            reasoning = parsed.reasoning
+            confidence = parsed.confidence
         
-        # 手动构造 Usage 对象
-        usage = Usage()
-        if response.usage:
-            usage.requests = 1
-            usage.input_tokens = response.usage.get("prompt_tokens", 0)
-            usage.output_tokens = response.usage.get("completion_tokens", 0)
-            usage.total_tokens = response.usage.get("total_tokens", 0)
+        # 写入缓存
+        if cache_key:
+            await _save_cached_result(cache_key, {
+                "exam_type": exam_type,
+                "reasoning": reasoning,
+                "confidence": confidence
+            })
         
-        # 计算耗时
-        duration = time.time() - start_time
+        # 计算耗时（流式调用时附带首 token 时间）
+        duration = time.perf_counter() - start_time
+        time_to_first_token = response.metadata.get("time_to_first_token") if response.metadata else None
         
-        # 输出日志
-        logger.info(f"✓ Classification result (Direct API): {exam_type}")
-        logger.info(f"   Reasoning: {reasoning}")
+        # 输出日志（格式化推迟到日志级别确认需要输出时；reasoning 可能很长，只在 DEBUG 输出）
+        logger.info("✓ Classification result (Direct API): {}", exam_type)
+        logger.opt(lazy=True).debug("   Reasoning: {}", lambda: reasoning)
         if confidence:
-            logger.info(f"   Confidence: {confidence:.2f}")
-        logger.info(f"   Duration: {duration:.2f}s")
-        logger.info(f"   API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
+            logger.info("   Confidence: {:.2f}", confidence)
+        logger.info("   Duration: {:.2f}s", duration)
+        if time_to_first_token is not None:
+            logger.info("   Time to first token: {:.2f}s", time_to_first_token)
+        
+        if not want_usage:
+            return exam_type, None
+        
+        # 构造 Usage 对象
+        usage = usage_from_response(response.usage)
+        logger.opt(lazy=True).info(
+            "   API Usage: {} input + {} output = {} tokens",
+            lambda: usage.input_tokens,
+            lambda: usage.output_tokens,
+            lambda: usage.total_tokens
+        )
         
         # 返回带时间的 usage
-        usage_with_duration = UsageWithDuration(usage=usage, duration_seconds=duration)
+        usage_with_duration = UsageWithDuration(
+            usage=usage,
+            duration_seconds=duration,
+            time_to_first_token_seconds=time_to_first_token
+        )
         return exam_type, usage_with_duration
         
-    except json.JSONDecodeError as e:
+    except ValidationError as e:
         logger.error(f"Failed to parse JSON response: {e}")
         logger.error(f"Response content: {response.content if response.content else '(empty)'}")
         logger.error(f"Response finish_reason: {response.finish_reason if hasattr(response, 'finish_reason') else 'N/A'}")
@@ -189,3 +364,42 @@ async def classify_exam_type_direct(classification_data: dict) -> Tuple[str, "Us
         logger.error(f"Classification failed: {e}")
         raise
 
+
+async def classify_exam_types_direct(
+    batch: List[dict],
+    fast_path: bool = False,
+    stream: bool = False,
+    want_usage: bool = True
+) -> List[Tuple[str, Optional[UsageWithDuration]]]:
+    """
+    并发分类多份试卷（使用 Semaphore 限制同时进行的请求数）
+    
+    第 i 个请求延迟 i * classifier_stagger_ms 启动，使各请求的图片上传/编码与推理阶段错开，
+    而不是同时挤在同一阶段。
+    
+    Args:
+        batch: 多份试卷的预处理数据（每项同 classify_exam_type_direct 的 classification_data）
+        fast_path: 同 classify_exam_type_direct
+        stream: 同 classify_exam_type_direct
+        want_usage: 同 classify_exam_type_direct
+    
+    Returns:
+        List[Tuple[str, Optional[UsageWithDuration]]]: 与 batch 顺序一致的分类结果
+    """
+    semaphore = asyncio.Semaphore(settings.classifier_concurrency)
+    
+    stagger_seconds = settings.classifier_stagger_ms / 1000
+    
+    async def _classify_one(index: int, classification_data: dict) -> Tuple[str, Optional[UsageWithDuration]]:
+        if stagger_seconds > 0:
+            await asyncio.sleep(index * stagger_seconds)
+        async with semaphore:
+            return await classify_exam_type_direct(
+                classification_data,
+                fast_path=fast_path,
+                stream=stream,
+                want_usage=want_usage
+            )
+    
+    logger.info("📊 Classifying {} exams (concurrency: {})", len(batch), settings.classifier_concurrency)
+    return await asyncio.gather(*(_classify_one(idx, data) for idx, data in enumerate(batch)))
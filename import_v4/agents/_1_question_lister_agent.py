@@ -1,23 +1,87 @@
 """Question Lister Agent - List all questions from paper PDF"""
 
 import asyncio
-import json
+import atexit
+import functools
+import heapq
 import re
+import sys
 import time
-from typing import List, Tuple, TYPE_CHECKING
+import weakref
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import httpx
 from loguru import logger
 from agents import Usage
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from pydantic import BaseModel, ConfigDict, ValidationError
 
-if TYPE_CHECKING:
-    from . import UsageWithDuration
+from ._usage import UsageWithDuration
 
 from ..config.settings import settings
 from ..models.schemas import QuestionList, QuestionItem
-from ..utils.usage_tracker import PRICING
+from ..utils.usage_tracker import PRICING, accumulate_usage, usage_from_response
+from ..utils.latex_cache import register_file_content
 from ..clients.client_manager import ClientManager
 from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
 
 
+# Type1: 应该包含 (a), (b), (c) 等小题格式
+# 格式: 10(a), 11(b), 12(c)
+_TYPE1_PATTERN = re.compile(r'^\d+\([a-z]\)$', re.IGNORECASE)
+
+# Type2: 应该是纯 "Question N" 格式，不应该有小题
+# 格式: Question 1, Question 10, Question 21
+_TYPE2_PATTERN = re.compile(r'^Question\s+\d+$', re.IGNORECASE)
+
+
+# 未标注页码时的默认值
+_NO_PAGES: Tuple[int, ...] = ()
+
+
+# 每个事件循环复用一个文件上传/删除用的 AsyncOpenAI 客户端（底层 httpx 连接池绑定在事件循环上）
+_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """获取当前事件循环的 AsyncOpenAI 客户端，首次调用时创建"""
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            max_retries=2,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        )
+        _openai_clients[loop] = client
+    return client
+
+
+# 同一进程内已上传的带标记 PDF：内容键 -> file_id（相同 PDF 的并发/重复运行复用同一个远端文件）
+_uploaded_file_ids: Dict[str, str] = {}
+
+# 每个事件循环、每个内容键一把锁，保证同一份 PDF 只上传一次
+_upload_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = weakref.WeakKeyDictionary()
+
+
+def _delete_uploaded_files() -> None:
+    """进程退出时删除复用缓存中的上传文件（atexit 回调，使用同步客户端）"""
+    from openai import OpenAI
+    
+    if not _uploaded_file_ids:
+        return
+    
+    client = OpenAI(api_key=settings.openai_api_key)
+    for file_id in _uploaded_file_ids.values():
+        try:
+            client.files.delete(file_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete uploaded file {file_id}: {e}")
+    _uploaded_file_ids.clear()
+
+
 def calculate_cost(usage: Usage, model: str = None) -> float:
     """
     计算 API 调用成本（参考 usage_tracker.py）
@@ -42,6 +106,29 @@ def calculate_cost(usage: Usage, model: str = None) -> float:
     return input_cost + output_cost
 
 
+def _scan_labels(questions: List[QuestionItem]) -> Tuple[int, List[str], List[str], int]:
+    """
+    单次遍历题目，统计 type1 格式题号
+    
+    Returns:
+        Tuple[int, List[str], List[str], int]: (type1 数量, 前5个 type1 题号, 前5个题号, 总数)
+    """
+    type1_count = 0
+    type1_samples = []
+    samples = []
+    total = 0
+    for q in questions:
+        label = q.question_label
+        total += 1
+        if len(samples) < 5:
+            samples.append(label)
+        if _TYPE1_PATTERN.match(label):
+            type1_count += 1
+            if len(type1_samples) < 5:
+                type1_samples.append(label)
+    return type1_count, type1_samples, samples, total
+
+
 def validate_question_list_format(question_list: QuestionList, exam_type: str) -> Tuple[bool, str]:
     """
     验证题目列表格式是否符合试卷类型
@@ -53,46 +140,35 @@ def validate_question_list_format(question_list: QuestionList, exam_type: str) -
     Returns:
         Tuple[bool, str]: (是否有效, 错误原因)
     """
-    labels = [q.question_label for q in question_list.questions]
+    if not question_list.questions:
+        return False, "Question list is empty"
     
-    # Type1: 应该包含 (a), (b), (c) 等小题格式
-    # 格式: 10(a), 11(b), 12(c)
-    type1_pattern = re.compile(r'^\d+\([a-z]\)$', re.IGNORECASE)
-    
-    # Type2: 应该是纯 "Question N" 格式，不应该有小题
-    # 格式: Question 1, Question 10, Question 21
-    type2_pattern = re.compile(r'^Question\s+\d+$', re.IGNORECASE)
+    type1_count, type1_samples, samples, total = _scan_labels(question_list.questions)
     
     if exam_type == "type1":
         # Type1 验证：至少要有一些 X(a), X(b) 格式的题目
-        type1_count = sum(1 for label in labels if type1_pattern.match(label))
-        
         if type1_count == 0:
             return False, (
                 f"Type1 exam should contain questions like '10(a)', '11(b)', but found none. "
-                f"Sample labels: {labels[:5]}"
+                f"Sample labels: {samples}"
             )
         
         # 如果少于 20% 的题目符合 type1 格式，也认为有问题
-        if len(labels) > 0 and type1_count / len(labels) < 0.2:
+        if type1_count / total < 0.2:
             return False, (
                 f"Type1 exam should have most questions in 'X(a)' format, "
-                f"but only {type1_count}/{len(labels)} ({type1_count/len(labels)*100:.1f}%) match. "
-                f"Sample labels: {labels[:5]}"
+                f"but only {type1_count}/{total} ({type1_count/total*100:.1f}%) match. "
+                f"Sample labels: {samples}"
             )
         
         return True, ""
     
     elif exam_type == "type2":
         # Type2 验证：不应该有 X(a), X(b) 这样的独立题目
-        type1_count = sum(1 for label in labels if type1_pattern.match(label))
-        
         if type1_count > 0:
-            # 找出所有 type1 格式的题目
-            type1_labels = [label for label in labels if type1_pattern.match(label)]
             return False, (
                 f"Type2 exam should NOT have questions like '10(a)', '11(b)' as separate questions, "
-                f"but found {type1_count}: {type1_labels[:5]}"
+                f"but found {type1_count}: {type1_samples}"
             )
         
         return True, ""
@@ -100,6 +176,7 @@ def validate_question_list_format(question_list: QuestionList, exam_type: str) -
     return True, ""
 
 
+@functools.lru_cache(maxsize=4)
 def get_question_lister_prompt(exam_type: str, emphasize: bool = False) -> str:
     """
     生成Question Lister的prompt
@@ -239,8 +316,8 @@ Begin scanning now using the file_search tool. Be thorough and accurate!
 async def list_all_questions_direct(
     exam_type: str,
     paper_file_id: str,  # 直接使用 file_id（通过 files.create 上传）
-    retry_count: int = 0  # 新增参数：重试次数
-) -> Tuple[QuestionList, "UsageWithDuration"]:
+    max_attempts: int = 2  # 格式验证失败时最多尝试的次数（含首次）
+) -> Tuple[QuestionList, UsageWithDuration]:
     """
     使用 Chat Completions API 直接调用（不使用 agents 框架）
     使用 file 类型传递文件
@@ -248,76 +325,77 @@ async def list_all_questions_direct(
     Args:
         exam_type: 试卷类型 ("type1" or "type2")
         paper_file_id: 已上传的 paper 文件 ID (通过 files.create 获取)
-        retry_count: 当前重试次数（内部使用）
+        max_attempts: 格式验证失败时最多尝试的次数（重试时强调规则）
     
     Returns:
-        Tuple[QuestionList, UsageWithDuration]: (题目清单, API使用统计含时间)
+        Tuple[QuestionList, UsageWithDuration]: (题目清单, API使用统计含时间，累计所有尝试)
     """
-    from . import UsageWithDuration
-    
     # 记录开始时间
-    start_time = time.time()
-    
-    # 创建客户端
-    client = ClientManager.create_agent_client()
+    start_time = time.perf_counter()
     
-    emphasize = retry_count > 0  # 重试时强调规则
+    # 创建客户端（所有尝试共用）
+    client = ClientManager.get_agent_client()
     
     logger.info(f"📋 Listing all questions from paper (Direct API)...")
     logger.info(f"   Exam type: {exam_type}")
     logger.info(f"   Paper file ID: {paper_file_id}")
-    if emphasize:
-        logger.info(f"   ⚠️  Retry attempt {retry_count} - Emphasizing splitting rules")
-    
-    # 构建系统提示（重试时强调规则）
-    system_prompt = get_question_lister_prompt(exam_type, emphasize=emphasize)
     
     # 构建用户消息（包含文件引用）
-    user_content = [
-        MessageContent(
-            type=ContentType.TEXT,
-            text="List all questions from the paper PDF. Be systematic and thorough. Return your response as JSON."
-        ),
-        MessageContent(
-            type=ContentType.FILE,
-            file_id=paper_file_id  # ⭐ 使用 file 类型
-        )
-    ]
+    user_message = LLMMessage(
+        role=MessageRole.USER,
+        content=[
+            MessageContent(
+                type=ContentType.TEXT,
+                text="List all questions from the paper PDF. Be systematic and thorough. Return your response as JSON."
+            ),
+            MessageContent(
+                type=ContentType.FILE,
+                file_id=paper_file_id  # ⭐ 使用 file 类型
+            )
+        ]
+    )
     
-    # 构建消息列表
-    messages = [
-        LLMMessage(
-            role=MessageRole.SYSTEM,
-            content=system_prompt
-        ),
-        LLMMessage(
-            role=MessageRole.USER,
-            content=user_content
-        )
-    ]
+    usage = Usage()
     
-    # 调用 API（使用 JSON 模式）
-    try:
-        response = await client.aquery(
-            messages=messages,
-            temperature=0.0,
-            max_tokens=4000,  # Question list 可能较长
-            response_format={"type": "json_object"}
-        )
-        
-        # 解析 JSON 响应
-        response_data = json.loads(response.content)
-        
-        # 构造 QuestionList 对象
-        question_list = QuestionList(**response_data)
+    for retry_count in range(max_attempts):
+        emphasize = retry_count > 0  # 重试时强调规则
+        if emphasize:
+            logger.info(f"🔄 Retrying with emphasized rules...")
+            logger.info(f"   ⚠️  Retry attempt {retry_count} - Emphasizing splitting rules")
+        
+        # 构建消息列表（系统提示仅在重试时不同）
+        messages = [
+            LLMMessage(
+                role=MessageRole.SYSTEM,
+                content=get_question_lister_prompt(exam_type, emphasize=emphasize)
+            ),
+            user_message
+        ]
+        
+        # 调用 API（使用 JSON 模式）
+        try:
+            response = await client.aquery(
+                messages=messages,
+                temperature=0.0,
+                max_tokens=4000,  # Question list 可能较长
+                response_format={"type": "json_object"}
+            )
+            
+            # 解析 JSON 响应并直接构造 QuestionList 对象（一次完成解析与校验）
+            try:
+                question_list = QuestionList.model_validate_json(response.content)
+            except ValidationError as e:
+                logger.error(f"Failed to parse JSON response: {e}")
+                logger.error(f"Response content: {response.content}")
+                raise
+            
+        except Exception as e:
+            logger.error(f"Failed to list questions (Direct API): {e}")
+            raise
         
-        # 手动构造 Usage 对象
-        usage = Usage()
-        if response.usage:
-            usage.requests = 1
-            usage.input_tokens = response.usage.get("prompt_tokens", 0)
-            usage.output_tokens = response.usage.get("completion_tokens", 0)
-            usage.total_tokens = response.usage.get("total_tokens", 0)
+        # 构造 Usage 对象（累计所有尝试）
+        attempt_usage = usage_from_response(response.usage)
+        usage.add(attempt_usage)
         
         # 验证一致性
         if not question_list.validate_consistency():
@@ -328,7 +406,7 @@ async def list_all_questions_direct(
         
         # 输出日志
         logger.info(f"✓ Found {question_list.total_questions} questions (Direct API)")
-        logger.info(f"   API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
+        logger.info(f"   API Usage: {attempt_usage.input_tokens} input + {attempt_usage.output_tokens} output = {attempt_usage.total_tokens} tokens")
         
         # 显示前几道题
         preview_count = min(5, len(question_list.questions))
@@ -342,42 +420,75 @@ async def list_all_questions_direct(
         # ✨ 新增：验证题目格式
         is_valid, error_reason = validate_question_list_format(question_list, exam_type)
         
-        if not is_valid:
-            logger.warning(f"⚠️  Question list validation failed!")
-            logger.warning(f"   Reason: {error_reason}")
-            
-            # 如果还没有重试过，则重试一次
-            if retry_count == 0:
-                logger.info(f"🔄 Retrying with emphasized rules...")
-                return await list_all_questions_direct(
-                    exam_type=exam_type,
-                    paper_file_id=paper_file_id,
-                    retry_count=retry_count + 1
-                )
-            else:
-                # 已经重试过一次，记录警告但继续（避免无限循环）
-                logger.error(
-                    f"❌ Validation failed after retry. Proceeding with potentially incorrect results.\n"
-                    f"   Reason: {error_reason}"
-                )
-        else:
+        if is_valid:
             logger.info(f"✓ Question list format validated successfully for {exam_type}")
-        
-        # 计算耗时
-        duration = time.time() - start_time
-        logger.info(f"   Duration: {duration:.2f}s")
-        
-        # 返回带时间的 usage
-        usage_with_duration = UsageWithDuration(usage=usage, duration_seconds=duration)
-        return question_list, usage_with_duration
-        
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON response: {e}")
-        logger.error(f"Response content: {response.content}")
-        raise
-    except Exception as e:
-        logger.error(f"Failed to list questions (Direct API): {e}")
-        raise
+            break
+        
+        logger.warning(f"⚠️  Question list validation failed!")
+        logger.warning(f"   Reason: {error_reason}")
+    else:
+        # 已用完所有尝试，记录错误但继续（避免无限循环）
+        logger.error(
+            f"❌ Validation failed after retry. Proceeding with potentially incorrect results.\n"
+            f"   Reason: {error_reason}"
+        )
+    
+    # 计算耗时
+    duration = time.perf_counter() - start_time
+    logger.info(f"   Duration: {duration:.2f}s")
+    
+    # 返回带时间的 usage
+    usage_with_duration = UsageWithDuration(usage=usage, duration_seconds=duration)
+    return question_list, usage_with_duration
+
+
+async def _run_annotations(paper_coro, solution_coro) -> Tuple[Tuple[dict, Usage], Tuple[dict, Usage]]:
+    """
+    并发执行 paper / solution 页码标注
+    
+    Python 3.11+ 使用 TaskGroup：任一标注失败时立即取消另一个，不再等待其完成；
+    更早的版本退回 asyncio.gather。
+    
+    Returns:
+        ((paper_pages_map, paper_usage), (solution_pages_map, solution_usage))
+    
+    Raises:
+        RuntimeError: 任一标注失败（消息中包含各自的失败原因）
+    """
+    names = ("Paper", "Solution")
+    
+    if sys.version_info >= (3, 11):
+        tasks = []
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(paper_coro), tg.create_task(solution_coro)]
+        except Exception as eg:
+            # ExceptionGroup：只报告真正失败的任务（被取消的兄弟任务忽略）
+            errors = [
+                f"{name} annotation failed: {task.exception()}"
+                for name, task in zip(names, tasks)
+                if not task.cancelled() and task.exception() is not None
+            ]
+            if not errors:
+                raise
+            error_msg = "; ".join(errors)
+            logger.error(f"❌ Parallel execution failed: {error_msg}")
+            raise RuntimeError(error_msg) from eg
+        return tasks[0].result(), tasks[1].result()
+    
+    results = await asyncio.gather(paper_coro, solution_coro, return_exceptions=True)
+    
+    # 检查每个任务的结果
+    errors = [
+        f"{name} annotation failed: {result}"
+        for name, result in zip(names, results)
+        if isinstance(result, Exception)
+    ]
+    if errors:
+        error_msg = "; ".join(errors)
+        logger.error(f"❌ Parallel execution failed: {error_msg}")
+        raise RuntimeError(error_msg)
+    return results[0], results[1]
 
 
 async def list_all_questions_with_pages_direct(
@@ -411,85 +522,75 @@ async def list_all_questions_with_pages_direct(
     logger.info("Step 1/3: Listing all questions...")
     logger.info("="*80)
     
-    # Upload paper PDF for Step 1
-    import tempfile
-    from pathlib import Path
-    from openai import AsyncOpenAI
-    from ..config.settings import settings
+    openai_client = get_openai_client()
     
-    openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
-    with open(paper_pdf_path, 'rb') as f:
-        paper_file_temp = await openai_client.files.create(file=f, purpose="assistants")
-    logger.info(f"  Uploaded temp paper file: {paper_file_temp.id}")
+    # 带页码标记的 paper PDF 同时用于 Step 1 和 Step 2（只渲染、上传一次）；
+    # solution 的准备工作只依赖 PDF，与 Step 1 并行执行
+    paper_prep_task = asyncio.create_task(_prepare_marked_upload(openai_client, paper_pdf_path, "paper"))
+    solution_prep_task = asyncio.create_task(_prepare_marked_upload(openai_client, solution_pdf_path, "solution"))
     
     try:
+        paper_file_id = await paper_prep_task
+        
         question_list, step1_usage = await list_all_questions_direct(
             exam_type=exam_type,
-            paper_file_id=paper_file_temp.id
+            paper_file_id=paper_file_id
         )
         # step1_usage is UsageWithDuration, extract the Usage object
         total_usage.add(step1_usage.usage)
         
         logger.info(f"✓ Step 1 complete - Found {question_list.total_questions} questions")
         
-    finally:
-        await openai_client.files.delete(paper_file_temp.id)
-        logger.info("  Cleaned up temp paper file")
-    
-    # Step 2 & 3: Annotate pages in parallel
-    logger.info("\n" + "="*80)
-    logger.info("Step 2&3/3: Annotating paper and solution pages (parallel)...")
-    logger.info("="*80)
-    
-    # 并发执行
-    logger.info("  → Starting parallel execution...")
-    try:
-        results = await asyncio.gather(
-            annotate_paper_pages(question_list, paper_pdf_path),
-            annotate_solution_pages(question_list, solution_pdf_path),
-            return_exceptions=True  # 捕获异常而不是立即失败
-        )
+        # Step 2 & 3: Annotate pages in parallel
+        logger.info("\n" + "="*80)
+        logger.info("Step 2&3/3: Annotating paper and solution pages (parallel)...")
+        logger.info("="*80)
         
-        # 检查每个任务的结果
-        errors = []
-        if isinstance(results[0], Exception):
-            errors.append(f"Paper annotation failed: {results[0]}")
-        if isinstance(results[1], Exception):
-            errors.append(f"Solution annotation failed: {results[1]}")
+        # paper 和 solution 标注共用同一个期望题号集合
+        expected_labels = frozenset(q.question_label for q in question_list.questions)
         
-        if errors:
-            error_msg = "; ".join(errors)
-            logger.error(f"❌ Parallel execution failed: {error_msg}")
-            raise RuntimeError(error_msg)
+        async def _annotate_after_prep(prep_task: asyncio.Task, which: str) -> Tuple[dict, Usage]:
+            # shield：标注被取消时不取消上传任务，finally 中仍能拿到 file_id 清理
+            file_id = await asyncio.shield(prep_task)
+            return await _annotate_with_file(question_list, file_id, which, expected_labels)
         
-        # 解包结果
-        (paper_pages_map, step2_usage), (solution_pages_map, step3_usage) = results
+        # 并发执行
+        logger.info("  → Starting parallel execution...")
+        (paper_pages_map, step2_usage), (solution_pages_map, step3_usage) = await _run_annotations(
+            _annotate_after_prep(paper_prep_task, "paper"),
+            _annotate_after_prep(solution_prep_task, "solution")
+        )
         
         # 累加usage
-        total_usage.add(step2_usage)
-        total_usage.add(step3_usage)
+        accumulate_usage(total_usage, (step2_usage, step3_usage))
         
         logger.info(f"✓ Step 2&3 complete (parallel execution)")
         
-    except Exception as e:
-        logger.error(f"❌ Unexpected error in parallel execution: {e}")
-        raise
+    finally:
+        # 清理 Step 2&3 上传的文件（Step 1 失败时也需要等待准备任务结束后清理）
+        for prep_task, which in ((paper_prep_task, "paper"), (solution_prep_task, "solution")):
+            try:
+                file_id = await prep_task
+            except Exception as e:
+                logger.warning(f"{_ANNOTATION_TAGS[which]}   Preparation failed, nothing to clean up: {e}")
+                continue
+            await _release_uploaded_file(openai_client, file_id, which)
     
     # Merge results
     logger.info("\n" + "="*80)
     logger.info("Merging results...")
     logger.info("="*80)
     
-    questions_with_pages = []
-    for q in question_list.questions:
-        questions_with_pages.append(
-            QuestionItemWithPages(
-                question_index=q.question_index,
-                question_label=q.question_label,
-                paper_pages=paper_pages_map.get(q.question_label, []),
-                solution_pages=solution_pages_map.get(q.question_label, [])
-            )
+    # 未标注的题目共用同一个空元组（Pydantic 校验 List[int] 时会生成新的列表）
+    questions_with_pages = [
+        QuestionItemWithPages(
+            question_index=q.question_index,
+            question_label=q.question_label,
+            paper_pages=paper_pages_map.get(q.question_label, _NO_PAGES),
+            solution_pages=solution_pages_map.get(q.question_label, _NO_PAGES)
         )
+        for q in question_list.questions
+    ]
     
     result = QuestionListWithPages(
         exam_type=question_list.exam_type,
@@ -556,49 +657,51 @@ async def list_all_questions_with_pages_direct(
     return result, total_usage, usage_breakdown
 
 
-async def annotate_paper_pages(
-    question_list: QuestionList,
-    paper_pdf_path: str
-) -> Tuple[dict, Usage]:
+class _PageAnnotation(BaseModel):
+    """单个题目的页码标注（paper 或 solution 其中之一）"""
+    model_config = ConfigDict(extra="ignore")
+    
+    question_label: str
+    paper_pages: Optional[List[int]] = None
+    solution_pages: Optional[List[int]] = None
+
+
+class _AnnotationBatch(BaseModel):
+    """页码标注响应"""
+    model_config = ConfigDict(extra="ignore")
+    
+    annotations: List[_PageAnnotation]
+
+
+# 标注步骤的日志前缀
+_ANNOTATION_TAGS = {
+    "paper": "[Step 2/Paper]",
+    "solution": "[Step 3/Solution]",
+}
+
+
+@functools.lru_cache(maxsize=16)
+def _questions_block(questions: Tuple[Tuple[int, str], ...]) -> str:
+    """题目列表文本（paper 与 solution 标注共用同一批题目，只拼接一次）"""
+    return "\n".join(f"{index}. {label}" for index, label in questions)
+
+
+@functools.lru_cache(maxsize=32)
+def _build_annotation_prompt(questions: Tuple[Tuple[int, str], ...], which: str) -> str:
     """
-    为已有的题目清单标注 paper 页码
+    生成页码标注的 system prompt（按题目批次缓存）
     
     Args:
-        question_list: 已有的题目清单
-        paper_pdf_path: Paper PDF 路径
+        questions: 需要标注的题目 (question_index, question_label)，完整清单或其中一批
+        which: "paper" or "solution"
     
     Returns:
-        Tuple[Dict[question_label -> paper_pages], Usage]
-        例如: ({"10(a)": [5, 6], "10(b)": [7]}, usage)
+        Prompt string
     """
-    import tempfile
-    from pathlib import Path
-    from openai import AsyncOpenAI
-    from ..preprocessing.pdf_renderer import add_page_markers_to_pdf
+    questions_str = _questions_block(questions)
     
-    logger.info("[Step 2/Paper] 📄 Annotating paper pages...")
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Add page markers
-        marked_paper_path = Path(temp_dir) / "paper_marked.pdf"
-        add_page_markers_to_pdf(paper_pdf_path, str(marked_paper_path), zero_based=True)
-        
-        # Upload marked PDF
-        from ..config.settings import settings
-        openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
-        
-        with open(marked_paper_path, 'rb') as f:
-            paper_file = await openai_client.files.create(file=f, purpose="assistants")
-        logger.info(f"[Step 2/Paper]   Uploaded paper: {paper_file.id}")
-        
-        try:
-            # Build prompt
-            questions_str = "\n".join([
-                f"{q.question_index}. {q.question_label}"
-                for q in question_list.questions
-            ])
-            
-            system_prompt = f"""You are analyzing a paper PDF with page markers.
+    if which == "paper":
+        return f"""You are analyzing a paper PDF with page markers.
 
 The PDF has visible PAGE_INDEX_N markers (0-based) at the top-right of each page.
 
@@ -620,129 +723,10 @@ CRITICAL:
 - paper_pages is ALWAYS an array, even for single-page questions
 - Page indices are 0-based
 - Include ALL pages if question spans multiple pages
-- Return annotations for ALL {len(question_list.questions)} questions
+- Return annotations for ALL {len(questions)} questions
 """
-            
-            client = ClientManager.create_agent_client()
-            
-            messages = [
-                LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
-                LLMMessage(
-                    role=MessageRole.USER,
-                    content=[
-                        MessageContent(type=ContentType.TEXT, text="Annotate pages for all questions. Return JSON."),
-                        MessageContent(type=ContentType.FILE, file_id=paper_file.id)
-                    ]
-                )
-            ]
-            
-            response = await client.aquery(
-                messages=messages,
-                temperature=0.0,
-                max_tokens=16000,  # 增加限制以支持更多题目
-                response_format={"type": "json_object"}
-            )
-            
-            # 检查响应是否为空
-            if not response.content or not response.content.strip():
-                logger.error(f"❌ Empty response from API (Paper Pages)!")
-                logger.error(f"   Usage: {response.usage}")
-                logger.error(f"   This may indicate the response was truncated due to token limits.")
-                raise ValueError(
-                    f"API returned empty response for paper pages annotation. "
-                    f"Completion tokens: {response.usage.get('completion_tokens', 0)}, "
-                    f"Max allowed: 16000. "
-                    f"The response may have been truncated."
-                )
-            
-            result = json.loads(response.content)
-            
-            # 调试：显示 API 返回的原始结构
-            logger.debug(f"   API returned {len(result.get('annotations', []))} annotations")
-            if result.get('annotations'):
-                first_few = result['annotations'][:3]
-                last_few = result['annotations'][-3:] if len(result['annotations']) > 3 else []
-                logger.debug(f"   First annotations: {[a.get('question_label') for a in first_few]}")
-                if last_few:
-                    logger.debug(f"   Last annotations: {[a.get('question_label') for a in last_few]}")
-            
-            # Convert to dict
-            paper_pages_map = {
-                item["question_label"]: item["paper_pages"]
-                for item in result["annotations"]
-            }
-            
-            # Create Usage object
-            usage = Usage()
-            if response.usage:
-                usage.requests = 1
-                usage.input_tokens = response.usage.get("prompt_tokens", 0)
-                usage.output_tokens = response.usage.get("completion_tokens", 0)
-                usage.total_tokens = response.usage.get("total_tokens", 0)
-            
-            logger.info(f"[Step 2/Paper] ✓ Annotated {len(paper_pages_map)} questions with paper pages")
-            logger.info(f"[Step 2/Paper]   API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
-            
-            # 调试：检查是否所有题目都被标注
-            expected_labels = {q.question_label for q in question_list.questions}
-            annotated_labels = set(paper_pages_map.keys())
-            missing_labels = expected_labels - annotated_labels
-            
-            if missing_labels:
-                logger.warning(f"[Step 2/Paper] ⚠️  {len(missing_labels)} questions missing paper page annotations!")
-                logger.warning(f"[Step 2/Paper]   Missing labels: {sorted(missing_labels)[:10]}")  # 显示前10个
-                logger.warning(f"[Step 2/Paper]   Expected {len(expected_labels)} labels, got {len(annotated_labels)} annotations")
-            
-            return paper_pages_map, usage
-            
-        finally:
-            await openai_client.files.delete(paper_file.id)
-            logger.info("[Step 2/Paper]   Cleaned up paper file")
-
-
-async def annotate_solution_pages(
-    question_list: QuestionList,
-    solution_pdf_path: str
-) -> Tuple[dict, Usage]:
-    """
-    为已有的题目清单标注 solution 页码
     
-    Args:
-        question_list: 已有的题目清单
-        solution_pdf_path: Solution PDF 路径
-    
-    Returns:
-        Tuple[Dict[question_label -> solution_pages], Usage]
-        例如: ({"10(a)": [2], "10(b)": [3, 4]}, usage)
-    """
-    import tempfile
-    from pathlib import Path
-    from openai import AsyncOpenAI
-    from ..preprocessing.pdf_renderer import add_page_markers_to_pdf
-    
-    logger.info("[Step 3/Solution] 📄 Annotating solution pages...")
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Add page markers
-        marked_solution_path = Path(temp_dir) / "solution_marked.pdf"
-        add_page_markers_to_pdf(solution_pdf_path, str(marked_solution_path), zero_based=True)
-        
-        # Upload marked PDF
-        from ..config.settings import settings
-        openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
-        
-        with open(marked_solution_path, 'rb') as f:
-            solution_file = await openai_client.files.create(file=f, purpose="assistants")
-        logger.info(f"[Step 3/Solution]   Uploaded solution: {solution_file.id}")
-        
-        try:
-            # Build prompt
-            questions_str = "\n".join([
-                f"{q.question_index}. {q.question_label}"
-                for q in question_list.questions
-            ])
-            
-            system_prompt = f"""You are analyzing a solution PDF with page markers.
+    return f"""You are analyzing a solution PDF with page markers.
 
 The PDF has visible PAGE_INDEX_N markers (0-based) at the top-right of each page.
 
@@ -764,73 +748,272 @@ CRITICAL:
 - solution_pages is ALWAYS an array, even for single-page answers
 - Page indices are 0-based
 - Include ALL pages if answer spans multiple pages
-- Return annotations for ALL {len(question_list.questions)} questions
+- Return annotations for ALL {len(questions)} questions
 """
-            
-            client = ClientManager.create_agent_client()
-            
-            messages = [
-                LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
-                LLMMessage(
-                    role=MessageRole.USER,
-                    content=[
-                        MessageContent(type=ContentType.TEXT, text="Annotate pages for all answers. Return JSON."),
-                        MessageContent(type=ContentType.FILE, file_id=solution_file.id)
-                    ]
-                )
+
+
+async def _prepare_marked_upload(openai_client: AsyncOpenAI, pdf_path: str, which: str) -> str:
+    """
+    给 PDF 添加页码标记并上传
+    
+    页码标记渲染是 CPU 密集操作，放到线程中执行，避免阻塞事件循环，
+    从而可以与 Step 1 的 LLM 调用重叠。带标记的 PDF 按源文件内容哈希缓存，
+    重复运行同一份 PDF 时不再重新渲染。
+    
+    Args:
+        openai_client: AsyncOpenAI 客户端（见 get_openai_client）
+        pdf_path: 原始 PDF 路径
+        which: "paper" or "solution"
+    
+    Returns:
+        上传后的 file_id
+    """
+    from ..preprocessing.pdf_renderer import add_page_markers_cached
+    
+    tag = _ANNOTATION_TAGS[which]
+    
+    # Add page markers（命中缓存时直接复用）
+    marked_path = Path(await asyncio.to_thread(add_page_markers_cached, pdf_path, True))
+    
+    if not settings.reuse_uploaded_files:
+        return await _upload_marked_pdf(openai_client, marked_path, which)
+    
+    # 缓存文件名已包含源文件的 SHA-256，直接作为内容键
+    content_key = marked_path.stem
+    locks = _upload_locks.setdefault(asyncio.get_running_loop(), {})
+    async with locks.setdefault(content_key, asyncio.Lock()):
+        file_id = _uploaded_file_ids.get(content_key)
+        if file_id is not None:
+            logger.info(f"{tag}   Reusing uploaded {which}: {file_id}")
+            return file_id
+        
+        file_id = await _upload_marked_pdf(openai_client, marked_path, which)
+        if not _uploaded_file_ids:
+            atexit.register(_delete_uploaded_files)
+        _uploaded_file_ids[content_key] = file_id
+    return file_id
+
+
+async def get_marked_file_id(pdf_path: str, which: str) -> str:
+    """
+    获取带页码标记 PDF 的 file_id（与 Step 1/2 共用渲染缓存和上传缓存）
+    
+    settings.reuse_uploaded_files 开启时，同一份 PDF 在进程内只上传一次，
+    由进程退出时统一删除，调用方不要自行删除返回的文件。
+    """
+    return await _prepare_marked_upload(get_openai_client(), pdf_path, which)
+
+
+async def _upload_marked_pdf(openai_client: AsyncOpenAI, marked_path: Path, which: str) -> str:
+    """上传带标记的 PDF（在线程中读取文件，避免阻塞事件循环）"""
+    data = await asyncio.to_thread(marked_path.read_bytes)
+    uploaded = await openai_client.files.create(
+        file=(f"{which}_marked.pdf", data, "application/pdf"),
+        purpose="assistants"
+    )
+    logger.info(f"{_ANNOTATION_TAGS[which]}   Uploaded {which}: {uploaded.id}")
+    # 缓存文件名包含源 PDF 的 SHA-256，作为 LaTeX 缓存的内容标识（跨运行不变）
+    register_file_content(uploaded.id, marked_path.stem)
+    return uploaded.id
+
+
+async def _release_uploaded_file(openai_client: AsyncOpenAI, file_id: str, which: str) -> None:
+    """删除上传的文件；复用缓存中的文件保留到进程退出时统一删除"""
+    if settings.reuse_uploaded_files:
+        return
+    await openai_client.files.delete(file_id)
+    logger.info(f"{_ANNOTATION_TAGS[which]}   Cleaned up {which} file")
+
+
+async def _annotate_chunk(
+    questions: List[QuestionItem],
+    file_id: str,
+    which: str
+) -> Tuple[dict, Usage]:
+    """
+    为一批题目标注页码（单次 LLM 调用）
+    
+    Args:
+        questions: 本批题目
+        file_id: 带页码标记的 PDF 的 file_id
+        which: "paper" or "solution"
+    
+    Returns:
+        Tuple[Dict[question_label -> pages], Usage]
+    """
+    pages_key = f"{which}_pages"
+    subject = "questions" if which == "paper" else "answers"
+    label = "Paper Pages" if which == "paper" else "Solution Pages"
+    
+    system_prompt = _build_annotation_prompt(
+        tuple((q.question_index, q.question_label) for q in questions),
+        which
+    )
+    
+    client = ClientManager.get_agent_client()
+    
+    messages = [
+        LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+        LLMMessage(
+            role=MessageRole.USER,
+            content=[
+                MessageContent(type=ContentType.TEXT, text=f"Annotate pages for all {subject}. Return JSON."),
+                MessageContent(type=ContentType.FILE, file_id=file_id)
             ]
-            
-            response = await client.aquery(
-                messages=messages,
-                temperature=0.0,
-                max_tokens=16000,  # 增加限制以支持更多题目
-                response_format={"type": "json_object"}
+        )
+    ]
+    
+    response = await client.aquery(
+        messages=messages,
+        temperature=0.0,
+        max_tokens=16000,  # 增加限制以支持更多题目
+        response_format={"type": "json_object"}
+    )
+    
+    # 检查响应是否为空
+    if not response.content or not response.content.strip():
+        logger.error(f"❌ Empty response from API ({label})!")
+        logger.error(f"   Usage: {response.usage}")
+        logger.error(f"   This may indicate the response was truncated due to token limits.")
+        raise ValueError(
+            f"API returned empty response for {which} pages annotation. "
+            f"Completion tokens: {response.usage.get('completion_tokens', 0)}, "
+            f"Max allowed: 16000. "
+            f"The response may have been truncated."
+        )
+    
+    annotations = _AnnotationBatch.model_validate_json(response.content).annotations
+    
+    # 调试：显示 API 返回的原始结构（仅在 DEBUG 级别启用时计算）
+    logger.debug("   API returned {} annotations", len(annotations))
+    if annotations:
+        logger.opt(lazy=True).debug(
+            "   First annotations: {}",
+            lambda: [a.question_label for a in annotations[:3]]
+        )
+        if len(annotations) > 3:
+            logger.opt(lazy=True).debug(
+                "   Last annotations: {}",
+                lambda: [a.question_label for a in annotations[-3:]]
             )
-            
-            # 检查响应是否为空
-            if not response.content or not response.content.strip():
-                logger.error(f"❌ Empty response from API (Solution Pages)!")
-                logger.error(f"   Usage: {response.usage}")
-                logger.error(f"   This may indicate the response was truncated due to token limits.")
-                raise ValueError(
-                    f"API returned empty response for solution pages annotation. "
-                    f"Completion tokens: {response.usage.get('completion_tokens', 0)}, "
-                    f"Max allowed: 16000. "
-                    f"The response may have been truncated."
-                )
-            
-            result = json.loads(response.content)
-            
-            # Convert to dict
-            solution_pages_map = {
-                item["question_label"]: item["solution_pages"]
-                for item in result["annotations"]
-            }
-            
-            # Create Usage object
-            usage = Usage()
-            if response.usage:
-                usage.requests = 1
-                usage.input_tokens = response.usage.get("prompt_tokens", 0)
-                usage.output_tokens = response.usage.get("completion_tokens", 0)
-                usage.total_tokens = response.usage.get("total_tokens", 0)
-            
-            logger.info(f"[Step 3/Solution] ✓ Annotated {len(solution_pages_map)} questions with solution pages")
-            logger.info(f"[Step 3/Solution]   API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
-            
-            # 调试：检查是否所有题目都被标注
-            expected_labels = {q.question_label for q in question_list.questions}
-            annotated_labels = set(solution_pages_map.keys())
-            missing_labels = expected_labels - annotated_labels
-            
-            if missing_labels:
-                logger.warning(f"[Step 3/Solution] ⚠️  {len(missing_labels)} questions missing solution page annotations!")
-                logger.warning(f"[Step 3/Solution]   Missing labels: {sorted(missing_labels)[:10]}")  # 显示前10个
-                logger.warning(f"[Step 3/Solution]   Expected {len(expected_labels)} labels, got {len(annotated_labels)} annotations")
-            
-            return solution_pages_map, usage
-            
-        finally:
-            await openai_client.files.delete(solution_file.id)
-            logger.info("[Step 3/Solution]   Cleaned up solution file")
+    
+    # Convert to dict（缺少对应页码字段的条目按未标注处理）
+    pages_map = {}
+    for item in annotations:
+        pages = getattr(item, pages_key)
+        if pages is not None:
+            pages_map[item.question_label] = pages
+    
+    return pages_map, usage_from_response(response.usage)
+
+
+async def _annotate_with_file(
+    question_list: QuestionList,
+    file_id: str,
+    which: str,
+    expected_labels: Optional[FrozenSet[str]] = None
+) -> Tuple[dict, Usage]:
+    """
+    使用已上传的带标记 PDF 为题目清单标注页码
+    
+    题目较多时按 settings.annotation_chunk_size 分批，并发调用（受
+    settings.annotation_concurrency 限制），避免单次输出触及 max_tokens 被截断。
+    
+    Args:
+        question_list: 已有的题目清单
+        file_id: 带页码标记的 PDF 的 file_id
+        which: "paper" or "solution"
+        expected_labels: 期望的题号集合（调用方已计算时传入，避免重复构建）
+    
+    Returns:
+        Tuple[Dict[question_label -> pages], Usage]
+    """
+    tag = _ANNOTATION_TAGS[which]
+    questions = question_list.questions
+    chunk_size = max(1, settings.annotation_chunk_size)
+    chunks = [questions[i:i + chunk_size] for i in range(0, len(questions), chunk_size)] or [questions]
+    
+    if len(chunks) > 1:
+        logger.info(f"{tag}   Splitting {len(questions)} questions into {len(chunks)} chunks")
+    
+    semaphore = asyncio.Semaphore(max(1, settings.annotation_concurrency))
+    
+    async def _run(chunk: List[QuestionItem]) -> Tuple[dict, Usage]:
+        async with semaphore:
+            return await _annotate_chunk(chunk, file_id, which)
+    
+    results = await asyncio.gather(*[_run(chunk) for chunk in chunks])
+    
+    # 合并各批结果
+    pages_map = {}
+    for chunk_map, _ in results:
+        pages_map.update(chunk_map)
+    usage = accumulate_usage(Usage(), (chunk_usage for _, chunk_usage in results))
+    
+    logger.info(f"{tag} ✓ Annotated {len(pages_map)} questions with {which} pages")
+    logger.info(f"{tag}   API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
+    
+    # 调试：检查是否所有题目都被标注
+    if expected_labels is None:
+        expected_labels = frozenset(q.question_label for q in question_list.questions)
+    missing_labels = expected_labels - pages_map.keys()
+    
+    if missing_labels:
+        logger.warning(f"{tag} ⚠️  {len(missing_labels)} questions missing {which} page annotations!")
+        logger.warning(f"{tag}   Missing labels: {heapq.nsmallest(10, missing_labels)}")  # 显示前10个
+        logger.warning(f"{tag}   Expected {len(expected_labels)} labels, got {len(pages_map)} annotations")
+    
+    return pages_map, usage
+
 
+async def _annotate_pages(
+    question_list: QuestionList,
+    pdf_path: str,
+    which: str
+) -> Tuple[dict, Usage]:
+    """准备带标记的 PDF、标注页码并清理上传文件"""
+    tag = _ANNOTATION_TAGS[which]
+    logger.info(f"{tag} 📄 Annotating {which} pages...")
+    
+    openai_client = get_openai_client()
+    file_id = await _prepare_marked_upload(openai_client, pdf_path, which)
+    try:
+        return await _annotate_with_file(question_list, file_id, which)
+    finally:
+        await _release_uploaded_file(openai_client, file_id, which)
+
+
+async def annotate_paper_pages(
+    question_list: QuestionList,
+    paper_pdf_path: str
+) -> Tuple[dict, Usage]:
+    """
+    为已有的题目清单标注 paper 页码
+    
+    Args:
+        question_list: 已有的题目清单
+        paper_pdf_path: Paper PDF 路径
+    
+    Returns:
+        Tuple[Dict[question_label -> paper_pages], Usage]
+        例如: ({"10(a)": [5, 6], "10(b)": [7]}, usage)
+    """
+    return await _annotate_pages(question_list, paper_pdf_path, "paper")
+
+
+async def annotate_solution_pages(
+    question_list: QuestionList,
+    solution_pdf_path: str
+) -> Tuple[dict, Usage]:
+    """
+    为已有的题目清单标注 solution 页码
+    
+    Args:
+        question_list: 已有的题目清单
+        solution_pdf_path: Solution PDF 路径
+    
+    Returns:
+        Tuple[Dict[question_label -> solution_pages], Usage]
+        例如: ({"10(a)": [2], "10(b)": [3, 4]}, usage)
+    """
+    return await _annotate_pages(question_list, solution_pdf_path, "solution")
@@ -1,55 +1,68 @@
 """Question LaTeX Generator Agent"""
 
+import asyncio
+import functools
 import json
+import re
 import time
-from typing import List, Tuple, Optional, TYPE_CHECKING
+from typing import List, Tuple, Optional, Union
 from loguru import logger
+from pydantic import ValidationError
 from agents import Usage
 
-if TYPE_CHECKING:
-    from . import UsageWithDuration
+from ._usage import UsageWithDuration
 
 from ..config.settings import settings
 from ..models.schemas import QuestionLatexOutput, ImageInfo
 from ..clients.client_manager import ClientManager
 from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
+from ..clients.rate_limiter import get_rate_limiter
+from ..utils.concurrency import get_shared_semaphore
+from ..utils.latex_cache import latex_cache_key, get_cached_latex, put_cached_latex, coalesce_in_flight
+from ..utils.usage_tracker import usage_from_response
 
 
-def get_question_latex_prompt(question_label: str, paper_pages: List[int], question_index: int) -> str:
-    """生成题目 LaTeX 提示词"""
-    
-    pages_str = ", ".join(map(str, paper_pages))
-    
-    return f"""You are a professional LaTeX converter for exam questions.
+# 提示词版本：修改 get_question_latex_prompt 时递增，使旧的 LaTeX 缓存失效
+_PROMPT_VERSION = "v3"
+
+# 生成 LaTeX 使用的模型（也是 LaTeX 缓存键的一部分）
+_MODEL = "gpt-5"
+
+# 从题目标签中提取第一个数字（如 "Question 6" -> 6, "10(a)" -> 10）
+_LABEL_DIGIT_RE = re.compile(r'\d+')
+
+
+# 静态 system prompt（所有题目逐字节相同，放在消息最前面以命中服务端的前缀缓存；题目相关信息放在 Task 段）
+# 默认只带 Example 1；其余示例只在重试时加入（_FULL 版本）
+_QUESTION_PROMPT_HEAD = """You are a professional LaTeX converter for exam questions.
 
 === Your Task ===
-Convert question **{question_label}** from the PDF pages to clean, compilable LaTeX code.
+Convert the question given in the === Task === section from the PDF pages to clean, compilable LaTeX code.
 
 === Question Location ===
-- Question Label: {question_label}
-- Paper Pages: [{pages_str}] (0-based page indexing)
+- The question label, paper pages (0-based page indexing) and image index are given in the === Task === section
 - **Note**: These page numbers are for reference. The actual question content may appear on nearby pages or span across adjacent pages.
 
 === Conversion Guidelines ===
 
 1. **Read Question Content**:
-   - The question is expected around page(s) {pages_str}
+   - The question is expected around the given paper page(s)
    - Check nearby pages if the question spans multiple pages or starts/ends on adjacent pages
    - Read ALL content across these pages
    - Include all sub-parts like (i), (ii), (iii) OR multiple choice options like A, B, C, D
 
 2. **Convert to LaTeX**:
-   - Use standard math environments: $...$ for inline, \\[...\\] or \\begin{{align*}}...\\end{{align*}} for display
+   - Use standard math environments: $...$ for inline, \\[...\\] or \\begin{align*}...\\end{align*} for display
    - Keep structure clear and organized
-   - Use \\textbf{{}} for emphasis
+   - Use \\textbf{} for emphasis
    - Convert all mathematical symbols accurately
    - Preserve all formatting (fractions, powers, roots, etc.)
-   - **For multiple choice questions (A, B, C, D options), use \\begin{{enumerate}}[label=\\Alph*.] format**
+   - **For multiple choice questions (A, B, C, D options), use \\begin{enumerate}[label=\\Alph*.] format**
 
 3. **Handle Images/Diagrams**:
    - If you see an image, graph, or diagram, note its position
-   - Use placeholder: \\includegraphics[width=0.5\\textwidth]{{Figures/idPLACEHOLDER{question_index}_1.png}}
-   - For multiple images, use: Figures/idPLACEHOLDER{question_index}_1.png, Figures/idPLACEHOLDER{question_index}_2.png, etc.
+   - Use placeholder: \\includegraphics[width=0.5\\textwidth]{Figures/idPLACEHOLDER<IMAGE_INDEX>_1.png}, where <IMAGE_INDEX> is the Image Index from the === Task === section
+   - For multiple images, use: Figures/idPLACEHOLDER<IMAGE_INDEX>_1.png, Figures/idPLACEHOLDER<IMAGE_INDEX>_2.png, etc.
    - For each image, record:
      * page_number: which page the image appears on (0-based)
      * bbox: bounding box [x1, y1, x2, y2] (origin at top-left corner)
@@ -57,141 +70,169 @@ Convert question **{question_label}** from the PDF pages to clean, compilable La
 
 4. **Formatting Rules**:
    - **MUST start with: \\item** (do NOT include the question label)
-   - **For sub-parts (i), (ii), (iii), MUST use \\begin{{enumerate}}[label=(\\roman*)] and \\item**
-   - **For multiple choice questions (A, B, C, D), MUST use \\begin{{enumerate}}[label=\\Alph*.] and \\item**
+   - **For sub-parts (i), (ii), (iii), MUST use \\begin{enumerate}[label=(\\roman*)] and \\item**
+   - **For multiple choice questions (A, B, C, D), MUST use \\begin{enumerate}[label=\\Alph*.] and \\item**
    - Keep consistent spacing
    - Don't add extra section titles
 
 5. **Quality Check**:
-   - Verify all math brackets match: (), [], \\{{\\}}
+   - Verify all math brackets match: (), [], \\{\\}
    - Check all LaTeX commands are spelled correctly
    - Ensure completeness - don't miss any part
 
 === Output Format ===
 Return ONLY valid JSON (no markdown, no code blocks):
-{{
-    "question_label": "{question_label}",
+{
+    "question_label": "<Question Label from the === Task === section>",
     "question_latex": "...complete LaTeX code...",
     "question_images": [
-        {{
+        {
             "page_number": 5,
             "bbox": [100.5, 200.3, 400.7, 500.2],
             "description": "Graph showing quadratic function"
-        }}
+        }
     ],
     "compilation_success": true,
     "error_message": null
-}}
+}
 
 === Examples ===
 
 Example 1 (simple):
-{{
+{
     "question_label": "10(a)",
     "question_latex": "\\\\item Solve the equation $x^2 + 3x - 4 = 0$.",
     "question_images": [],
     "compilation_success": true,
     "error_message": null
-}}
+}
 
-Example 2 (with sub-parts):
-{{
+"""
+
+_QUESTION_EXTRA_EXAMPLES = """Example 2 (with sub-parts):
+{
     "question_label": "Question 11",
-    "question_latex": "\\\\item Consider the function $f(x) = x^2 - 4x + 3$.\\n\\\\begin{{enumerate}}[label=(\\\\roman*)]\\n\\\\item Find the vertex.\\n\\\\item Sketch the graph.\\n\\\\end{{enumerate}}",
+    "question_latex": "\\\\item Consider the function $f(x) = x^2 - 4x + 3$.\\n\\\\begin{enumerate}[label=(\\\\roman*)]\\n\\\\item Find the vertex.\\n\\\\item Sketch the graph.\\n\\\\end{enumerate}",
     "question_images": [],
     "compilation_success": true,
     "error_message": null
-}}
+}
 
 Example 3 (with images):
-{{
+{
     "question_label": "Question 8",
-    "question_latex": "\\\\item The diagram shows a triangle ABC.\\n\\\\includegraphics[width=0.5\\\\textwidth]{{Figures/idPLACEHOLDER8_1.png}}\\n\\\\begin{{enumerate}}[label=(\\\\roman*)]\\n\\\\item Calculate the area.\\n\\\\item Find the perimeter.\\n\\\\end{{enumerate}}",
+    "question_latex": "\\\\item The diagram shows a triangle ABC.\\n\\\\includegraphics[width=0.5\\\\textwidth]{Figures/idPLACEHOLDER8_1.png}\\n\\\\begin{enumerate}[label=(\\\\roman*)]\\n\\\\item Calculate the area.\\n\\\\item Find the perimeter.\\n\\\\end{enumerate}",
     "question_images": [
-        {{
+        {
             "page_number": 3,
             "bbox": [150.0, 250.0, 450.0, 500.0],
             "description": "Triangle ABC with sides labeled: AB = 5cm, BC = 4cm, AC = 3cm"
-        }}
+        }
     ],
     "compilation_success": true,
     "error_message": null
-}}
+}
 
 Example 4 (multiple choice - MUST use this format):
-{{
+{
     "question_label": "Question 3",
-    "question_latex": "\\\\item What is the derivative of $\\\\dfrac{{\\\\sin x}}{{e^x}}$?\\n\\\\begin{{enumerate}}[label=\\\\Alph*.]\\n\\\\item $\\\\dfrac{{\\\\sin x + \\\\cos x}}{{e^x}}$\\n\\\\item $\\\\dfrac{{\\\\sin x - \\\\cos x}}{{e^x}}$\\n\\\\item $-\\\\dfrac{{\\\\sin x + \\\\cos x}}{{e^x}}$\\n\\\\item $\\\\dfrac{{\\\\cos x - \\\\sin x}}{{e^x}}$\\n\\\\end{{enumerate}}",
+    "question_latex": "\\\\item What is the derivative of $\\\\dfrac{\\\\sin x}{e^x}$?\\n\\\\begin{enumerate}[label=\\\\Alph*.]\\n\\\\item $\\\\dfrac{\\\\sin x + \\\\cos x}{e^x}$\\n\\\\item $\\\\dfrac{\\\\sin x - \\\\cos x}{e^x}$\\n\\\\item $-\\\\dfrac{\\\\sin x + \\\\cos x}{e^x}$\\n\\\\item $\\\\dfrac{\\\\cos x - \\\\sin x}{e^x}$\\n\\\\end{enumerate}",
     "question_images": [],
     "compilation_success": true,
     "error_message": null
-}}
+}
 
 Example 5 (short answer with sub-parts - MUST use this format for sub-parts):
-{{
+{
     "question_label": "Question 15",
-    "question_latex": "\\\\item The standard normal distribution function is given by $\\\\varphi(x) = \\\\dfrac{{1}}{{\\\\sqrt{{2\\\\pi}}}} e^{{-\\\\frac{{1}}{{2}}x^2}}$.\\n\\\\begin{{enumerate}}[label=(\\\\roman*)]\\n\\\\item Write down the equation of the normal distribution function, $f(x)$, for a distribution with mean of 20 and variance of 3.\\n\\\\item Find the value of $f(20)$ and state its graphical significance.\\n\\\\item State the coordinates of the points of inflection of the graph $y=f(x)$ of the distribution.\\n\\\\end{{enumerate}}",
+    "question_latex": "\\\\item The standard normal distribution function is given by $\\\\varphi(x) = \\\\dfrac{1}{\\\\sqrt{2\\\\pi}} e^{-\\\\frac{1}{2}x^2}$.\\n\\\\begin{enumerate}[label=(\\\\roman*)]\\n\\\\item Write down the equation of the normal distribution function, $f(x)$, for a distribution with mean of 20 and variance of 3.\\n\\\\item Find the value of $f(20)$ and state its graphical significance.\\n\\\\item State the coordinates of the points of inflection of the graph $y=f(x)$ of the distribution.\\n\\\\end{enumerate}",
     "question_images": [],
     "compilation_success": true,
     "error_message": null
-}}
+}
+
+"""
 
-Now convert the question.
+_QUESTION_PROMPT_TAIL = """Now convert the question.
 """
 
+_QUESTION_SYSTEM_PROMPT = _QUESTION_PROMPT_HEAD + _QUESTION_PROMPT_TAIL
+_QUESTION_SYSTEM_PROMPT_FULL = _QUESTION_PROMPT_HEAD + _QUESTION_EXTRA_EXAMPLES + _QUESTION_PROMPT_TAIL
 
-async def generate_question_latex_direct(
+# 系统消息不随题目变化，复用同一个实例
+_QUESTION_SYSTEM_MESSAGE = LLMMessage(role=MessageRole.SYSTEM, content=_QUESTION_SYSTEM_PROMPT)
+_QUESTION_SYSTEM_MESSAGE_FULL = LLMMessage(role=MessageRole.SYSTEM, content=_QUESTION_SYSTEM_PROMPT_FULL)
+
+
+@functools.lru_cache(maxsize=64)
+def _file_content(file_id: str) -> MessageContent:
+    """文件引用块（同一份 PDF 的所有题目复用同一个对象）"""
+    return MessageContent(type=ContentType.FILE, file_id=file_id)
+
+
+# 每道题的 Task 段（动态字段为 {question_label} / {pages_str} / {question_index}）
+_QUESTION_TASK_TEMPLATE = """=== Task ===
+Convert question **{question_label}** to LaTeX. Return JSON.
+- Question Label: {question_label}
+- Paper Pages: [{pages_str}] (0-based page indexing)
+- Image Index: {question_index}"""
+
+
+def get_question_latex_task(question_label: str, paper_pages: List[int], question_index: int) -> str:
+    """生成题目 LaTeX 的 Task 段（放在 user 消息中，system prompt 保持静态）"""
+    return _QUESTION_TASK_TEMPLATE.format_map({
+        "question_label": question_label,
+        "pages_str": ", ".join(map(str, paper_pages)),
+        "question_index": question_index,
+    })
+
+
+def get_question_latex_prompt(question_label: str, paper_pages: List[int], question_index: int, verbose: bool = False) -> str:
+    """生成题目 LaTeX 完整提示词（静态部分 + Task 段）；verbose=True 时包含全部示例"""
+    system_prompt = _QUESTION_SYSTEM_PROMPT_FULL if verbose else _QUESTION_SYSTEM_PROMPT
+    return f"{system_prompt}\n{get_question_latex_task(question_label, paper_pages, question_index)}"
+
+
+async def _generate_question_latex_direct(
     question_label: str,
     paper_pages: List[int],
     paper_file_id: str,
-    question_index: Optional[int] = None
-) -> Tuple[QuestionLatexOutput, "UsageWithDuration"]:
-    """
-    生成单道题目的 LaTeX 代码（直接 API 调用）
-    
-    Args:
-        question_label: 题目标签（如 "10(a)", "Question 21"）
-        paper_pages: 题目所在页码列表（0-based）
-        paper_file_id: 已上传的 paper 文件 ID
-        question_index: 题目索引（可选，用于生成图片占位符）
-    
-    Returns:
-        Tuple[QuestionLatexOutput, UsageWithDuration]: (LaTeX输出, API使用统计含时间)
-    """
-    from . import UsageWithDuration
-    
+    question_index: int,
+    cache_key: str
+) -> Tuple[QuestionLatexOutput, UsageWithDuration]:
+    """generate_question_latex_direct 的实际实现（question_index 已解析，cache_key 已计算）"""
     # 记录开始时间
-    start_time = time.time()
+    start_time = time.perf_counter()
     
-    # 如果 question_index 为 None，尝试从 question_label 提取数字，否则使用默认值 0
-    if question_index is None:
-        import re
-        # 尝试从 label 中提取数字（如 "Question 6" -> 6, "10(a)" -> 10）
-        match = re.search(r'\d+', question_label)
-        question_index = int(match.group()) if match else 0
+    # 缓存命中时直接返回（不调用 API）
+    cached = await get_cached_latex(cache_key)
+    if cached is not None:
+        latex_output = QuestionLatexOutput.model_validate(cached)
+        duration = time.perf_counter() - start_time
+        logger.info("[Q] ✓ Cache hit for {}", question_label)
+        return latex_output, UsageWithDuration(usage=Usage(), duration_seconds=duration)
     
-    client = ClientManager.create_agent_client()
+    client = ClientManager.get_agent_client(_MODEL)
     
-    logger.info(f"[Q] 📝 Generating LaTeX for question {question_label} (index: {question_index})")
-    logger.info(f"[Q]    Pages: {paper_pages}, File: {paper_file_id}")
+    logger.info("[Q] 📝 Generating LaTeX for question {} (index: {})", question_label, question_index)
+    logger.info("[Q]    Pages: {}, File: {}", paper_pages, paper_file_id)
     
-    # 构建 prompt
-    system_prompt = get_question_latex_prompt(question_label, paper_pages, question_index)
+    # 构建 prompt：system prompt 静态，题目相关的 Task 段放在文件之后；
+    # 同一份 PDF 的所有题目共享 system + 文件这段前缀，可命中服务端的 prompt 缓存
+    system_prompt = _QUESTION_SYSTEM_PROMPT
+    task_prompt = get_question_latex_task(question_label, paper_pages, question_index)
     
     # 构建消息
     user_content = [
+        _file_content(paper_file_id),
         MessageContent(
             type=ContentType.TEXT,
-            text=f"Convert question {question_label} to LaTeX. Return JSON."
-        ),
-        MessageContent(
-            type=ContentType.FILE,
-            file_id=paper_file_id
+            text=task_prompt
         )
     ]
     
     messages = [
-        LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+        _QUESTION_SYSTEM_MESSAGE,
         LLMMessage(role=MessageRole.USER, content=user_content)
     ]
     
@@ -199,9 +240,16 @@ async def generate_question_latex_direct(
     max_retries = 2
     current_max_tokens = 8000
     
+    limiter = get_rate_limiter()
+    # 流式接收：长 LaTeX 输出在生成过程中就开始传输，而不是等整个响应完成后再一次性下载
+    query = client.astream_query_with_fallback if settings.latex_stream_responses else client.aquery
+    # 预估输入 token：prompt 按 4 字符/token 估算，另加 PDF 文件内容的估计值
+    estimated_input_tokens = (len(system_prompt) + len(task_prompt)) // 4 + 2000
+    
     for retry in range(max_retries):
         try:
-            response = await client.aquery(
+            await limiter.acquire(estimated_input_tokens + current_max_tokens)
+            response = await query(
                 messages=messages,
                 temperature=0.0,
                 max_tokens=current_max_tokens,
@@ -216,8 +264,9 @@ async def generate_question_latex_direct(
                 logger.error(f"[Q] usage: {response.usage}")
                 
                 # 如果是因为长度限制且还有重试机会
-                if response.finish_reason == 'length' and retry < max_retries - 1:
-                    current_max_tokens = int(current_max_tokens * 1.5)  # 增加 50%
+                if response.finish_reason == 'length' and retry < max_retries - 1 and current_max_tokens < settings.latex_max_output_tokens:
+                    current_max_tokens = min(int(current_max_tokens * 1.5), settings.latex_max_output_tokens)  # 增加 50%
+                    messages[0] = _QUESTION_SYSTEM_MESSAGE_FULL  # 重试时带上全部示例
                     logger.warning(f"[Q] Response truncated. Retrying with max_tokens={current_max_tokens}")
                     continue
                 else:
@@ -226,40 +275,41 @@ async def generate_question_latex_direct(
                         f"tokens={response.usage.get('completion_tokens', 0) if response.usage else 0}"
                     )
             
-            # 解析响应
-            response_data = json.loads(response.content)
-            
-            # 构造输出对象
-            latex_output = QuestionLatexOutput(**response_data)
+            # 解析并校验响应（pydantic-core 一次完成，不生成中间 dict）；
+            # JSON 非法或字段不符都抛出 ValidationError，走下面的重试分支
+            latex_output = QuestionLatexOutput.model_validate_json(response.content)
             
             # 构造 Usage
-            usage = Usage()
-            if response.usage:
-                usage.requests = 1
-                usage.input_tokens = response.usage.get("prompt_tokens", 0)
-                usage.output_tokens = response.usage.get("completion_tokens", 0)
-                usage.total_tokens = response.usage.get("total_tokens", 0)
+            usage = usage_from_response(response.usage)
             
             # 计算耗时
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             
-            logger.info(f"[Q] ✓ Generated LaTeX for {question_label}")
-            logger.info(f"[Q]    LaTeX length: {len(latex_output.question_latex)} chars")
-            logger.info(f"[Q]    Images: {len(latex_output.question_images)}")
-            logger.info(f"[Q]    Duration: {duration:.2f}s")
-            logger.info(f"[Q]    Usage: {usage.total_tokens} tokens")
+            # 汇总为一条日志，参数延迟格式化（日志级别被关闭时不构造字符串）
+            logger.info(
+                "[Q] ✓ Generated LaTeX for {} | {} chars, images: {}, {:.2f}s, {} tokens",
+                question_label, len(latex_output.question_latex), len(latex_output.question_images), duration, usage.total_tokens
+            )
+            if response.metadata and response.metadata.get("time_to_first_token") is not None:
+                logger.info("[Q]    Time to first token: {:.2f}s", response.metadata["time_to_first_token"])
+            
+            # 写入缓存
+            await put_cached_latex(cache_key, latex_output.model_dump())
             
             # 返回带时间的 usage
             usage_with_duration = UsageWithDuration(usage=usage, duration_seconds=duration)
             return latex_output, usage_with_duration
             
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, ValidationError) as e:
             logger.error(f"[Q] Failed to parse JSON (attempt {retry + 1}/{max_retries}): {e}")
             logger.error(f"[Q] Response: {response.content[:500] if response.content else '(empty)'}")
             
             # 如果还有重试机会且疑似长度问题
-            if retry < max_retries - 1:
-                current_max_tokens = int(current_max_tokens * 1.5)
+            # 已经是 token 上限仍被截断时，再重试一次注定失败
+            at_ceiling = response.finish_reason == 'length' and current_max_tokens >= settings.latex_max_output_tokens
+            if retry < max_retries - 1 and not at_ceiling:
+                current_max_tokens = min(int(current_max_tokens * 1.5), settings.latex_max_output_tokens)
+                messages[0] = _QUESTION_SYSTEM_MESSAGE_FULL  # 重试时带上全部示例
                 logger.warning(f"[Q] Retrying with max_tokens={current_max_tokens}")
                 continue
             else:
@@ -268,3 +318,72 @@ async def generate_question_latex_direct(
             logger.error(f"Failed to generate LaTeX for {question_label}: {e}")
             raise
 
+
+async def generate_question_latex_direct(
+    question_label: str,
+    paper_pages: List[int],
+    paper_file_id: str,
+    question_index: Optional[int] = None
+) -> Tuple[QuestionLatexOutput, UsageWithDuration]:
+    """
+    生成单道题目的 LaTeX 代码（直接 API 调用）
+    
+    Args:
+        question_label: 题目标签（如 "10(a)", "Question 21"）
+        paper_pages: 题目所在页码列表（0-based）
+        paper_file_id: 已上传的 paper 文件 ID
+        question_index: 题目索引（可选，用于生成图片占位符）
+    
+    Returns:
+        Tuple[QuestionLatexOutput, UsageWithDuration]: (LaTeX输出, API使用统计含时间)
+    """
+    start_time = time.perf_counter()
+    
+    # 如果 question_index 为 None，尝试从 question_label 提取数字，否则使用默认值 0
+    if question_index is None:
+        # 尝试从 label 中提取数字（如 "Question 6" -> 6, "10(a)" -> 10）
+        match = _LABEL_DIGIT_RE.search(question_label)
+        question_index = int(match.group()) if match else 0
+    
+    cache_key = latex_cache_key("question", paper_file_id, question_label, question_index, paper_pages, _PROMPT_VERSION, _MODEL)
+    
+    # 相同请求（重复题目、重叠批次）正在生成时直接等待其结果，只调用一次 LLM
+    (latex_output, usage_with_duration), shared = await coalesce_in_flight(
+        cache_key,
+        lambda: _generate_question_latex_direct(question_label, paper_pages, paper_file_id, question_index, cache_key)
+    )
+    if shared:
+        logger.info("[Q] ✓ Reused in-flight result for {}", question_label)
+        return latex_output.model_copy(deep=True), UsageWithDuration(usage=Usage(), duration_seconds=time.perf_counter() - start_time)
+    return latex_output, usage_with_duration
+
+
+async def generate_question_latex_batch(
+    tasks: List[Tuple[str, List[int], str, Optional[int]]],
+    max_concurrent: Optional[int] = None
+) -> List[Union[Tuple[QuestionLatexOutput, UsageWithDuration], BaseException]]:
+    """
+    批量并发生成题目 LaTeX
+    
+    与 question / answer 生成共用同一个 "latex" Semaphore，总并发不超过
+    settings.latex_max_concurrent。
+    
+    Args:
+        tasks: [(question_label, paper_pages, paper_file_id, question_index), ...]
+        max_concurrent: 最大并发数（默认 settings.latex_max_concurrent，仅首次创建 Semaphore 时生效）
+    
+    Returns:
+        与 tasks 顺序一致的结果列表；失败的任务返回对应异常
+    """
+    semaphore = get_shared_semaphore("latex", max_concurrent or settings.latex_max_concurrent)
+    
+    async def _run(question_label: str, paper_pages: List[int], paper_file_id: str, question_index: Optional[int]):
+        async with semaphore:
+            return await generate_question_latex_direct(
+                question_label=question_label,
+                paper_pages=paper_pages,
+                paper_file_id=paper_file_id,
+                question_index=question_index
+            )
+    
+    return await asyncio.gather(*[_run(*task) for task in tasks], return_exceptions=True)
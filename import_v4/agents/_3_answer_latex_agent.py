@@ -1,48 +1,61 @@
 """Answer LaTeX Generator Agent"""
 
+import asyncio
+import functools
 import json
+import re
 import time
-from typing import List, Tuple, Optional, TYPE_CHECKING
+from typing import List, Tuple, Optional, Union
 from loguru import logger
+from pydantic import ValidationError
 from agents import Usage
 
-if TYPE_CHECKING:
-    from . import UsageWithDuration
+from ._usage import UsageWithDuration
 
 from ..config.settings import settings
 from ..models.schemas import AnswerLatexOutput, ImageInfo
 from ..clients.client_manager import ClientManager
 from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
+from ..clients.rate_limiter import get_rate_limiter
+from ..utils.concurrency import get_shared_semaphore
+from ..utils.latex_cache import latex_cache_key, get_cached_latex, put_cached_latex, coalesce_in_flight
+from ..utils.usage_tracker import usage_from_response
 
 
-def get_answer_latex_prompt(question_label: str, solution_pages: List[int], question_index: int) -> str:
-    """生成答案 LaTeX 提示词"""
-    
-    pages_str = ", ".join(map(str, solution_pages))
-    
-    return f"""You are a professional LaTeX converter for exam answers/solutions.
+# 提示词版本：修改 get_answer_latex_prompt 时递增，使旧的 LaTeX 缓存失效
+_PROMPT_VERSION = "v3"
+
+# 生成 LaTeX 使用的模型（也是 LaTeX 缓存键的一部分）
+_MODEL = "gpt-5"
+
+# 从题目标签中提取第一个数字（如 "Question 6" -> 6, "10(a)" -> 10）
+_LABEL_DIGIT_RE = re.compile(r'\d+')
+
+
+# 静态 system prompt（所有题目逐字节相同，放在消息最前面以命中服务端的前缀缓存；题目相关信息放在 Task 段）
+# 默认只带 Example 1；其余示例只在重试时加入（_FULL 版本）
+_ANSWER_PROMPT_HEAD = """You are a professional LaTeX converter for exam answers/solutions.
 
 === Your Task ===
-Convert the answer for question **{question_label}** from the solution PDF to clean, compilable LaTeX code.
+Convert the answer for the question given in the === Task === section from the solution PDF to clean, compilable LaTeX code.
 
 === Answer Location ===
-- Question Label: {question_label}
-- Solution Pages: [{pages_str}] (0-based page indexing)
+- The question label, solution pages (0-based page indexing) and image index are given in the === Task === section
 - **Note**: These page numbers are for reference. The actual answer content may appear on nearby pages or span across adjacent pages.
 
 === Conversion Guidelines ===
 
 1. **Read Solution Content**:
-   - The answer is expected around page(s) {pages_str}
+   - The answer is expected around the given solution page(s)
    - Check nearby pages if the solution spans multiple pages or starts/ends on adjacent pages
    - Read ALL working and steps
    - Include complete solution process
 
 2. **Convert to LaTeX**:
    - Show all working steps clearly
-   - Use \\begin{{align*}}...\\end{{align*}} for multi-step calculations
+   - Use \\begin{align*}...\\end{align*} for multi-step calculations
    - Use \\therefore, \\implies for logical connections
-   - Highlight final answer with \\boxed{{}} or \\textbf{{Answer:}}
+   - Highlight final answer with \\boxed{} or \\textbf{Answer:}
    - Include text explanations between steps
 
 3. **Extract Marks**:
@@ -51,8 +64,8 @@ Convert the answer for question **{question_label}** from the solution PDF to cl
 
 4. **Handle Images**:
    - Note any solution diagrams or graphs
-   - Use placeholder: \\includegraphics[width=0.5\\textwidth]{{Figures/idPLACEHOLDER{question_index}_sol_1.png}}
-   - For multiple images, use: Figures/idPLACEHOLDER{question_index}_sol_1.png, Figures/idPLACEHOLDER{question_index}_sol_2.png, etc.
+   - Use placeholder: \\includegraphics[width=0.5\\textwidth]{Figures/idPLACEHOLDER<IMAGE_INDEX>_sol_1.png}, where <IMAGE_INDEX> is the Image Index from the === Task === section
+   - For multiple images, use: Figures/idPLACEHOLDER<IMAGE_INDEX>_sol_1.png, Figures/idPLACEHOLDER<IMAGE_INDEX>_sol_2.png, etc.
    - For each image, record:
      * page_number: which page the image appears on (0-based)
      * bbox: bounding box [x1, y1, x2, y2] (origin at top-left corner)
@@ -60,123 +73,151 @@ Convert the answer for question **{question_label}** from the solution PDF to cl
 
 5. **Formatting Rules**:
    - **MUST start with: \\item** (do NOT include the question label)
-   - **For answers with sub-parts (i), (ii), (iii), MUST use \\begin{{enumerate}}[label=(\\roman*)] and \\item for each sub-part**
+   - **For answers with sub-parts (i), (ii), (iii), MUST use \\begin{enumerate}[label=(\\roman*)] and \\item for each sub-part**
    - Clear step-by-step presentation
-   - Use \\text{{}} for English within math mode
+   - Use \\text{} for English within math mode
    - Show intermediate steps
    - Emphasize final answer
 
 === Output Format ===
 Return ONLY valid JSON:
-{{
-    "question_label": "{question_label}",
+{
+    "question_label": "<Question Label from the === Task === section>",
     "answer_latex": "...complete LaTeX solution...",
     "answer_images": [
-        {{
+        {
             "page_number": 0,
             "bbox": [100.5, 200.3, 400.7, 500.2],
             "description": "Solution diagram showing triangles"
-        }}
+        }
     ],
     "marks": 3,
     "compilation_success": true,
     "error_message": null
-}}
+}
 
 === Examples ===
 
 Example 1 (without images):
-{{
+{
     "question_label": "10(a)",
-    "answer_latex": "\\\\item \\\\begin{{align*}}\\nx^2 + 3x - 4 &= 0 \\\\\\\\\\n(x + 4)(x - 1) &= 0 \\\\\\\\\\nx &= -4 \\\\text{{ or }} x = 1\\n\\\\end{{align*}}\\n\\\\textbf{{Answer:}} $x = -4$ or $x = 1$",
+    "answer_latex": "\\\\item \\\\begin{align*}\\nx^2 + 3x - 4 &= 0 \\\\\\\\\\n(x + 4)(x - 1) &= 0 \\\\\\\\\\nx &= -4 \\\\text{ or } x = 1\\n\\\\end{align*}\\n\\\\textbf{Answer:} $x = -4$ or $x = 1$",
     "answer_images": [],
     "marks": 2,
     "compilation_success": true,
     "error_message": null
-}}
+}
 
-Example 2 (with images):
-{{
+"""
+
+_ANSWER_EXTRA_EXAMPLES = """Example 2 (with images):
+{
     "question_label": "Question 5",
-    "answer_latex": "\\\\item \\\\includegraphics[width=0.5\\\\textwidth]{{Figures/idPLACEHOLDER5_sol_1.png}}\\n\\\\begin{{align*}}\\nArea &= \\\\frac{{1}}{{2}} \\\\times base \\\\times height \\\\\\\\\\n&= \\\\frac{{1}}{{2}} \\\\times 4 \\\\times 3 \\\\\\\\\\n&= 6 \\\\text{{ cm}}^2\\n\\\\end{{align*}}",
+    "answer_latex": "\\\\item \\\\includegraphics[width=0.5\\\\textwidth]{Figures/idPLACEHOLDER5_sol_1.png}\\n\\\\begin{align*}\\nArea &= \\\\frac{1}{2} \\\\times base \\\\times height \\\\\\\\\\n&= \\\\frac{1}{2} \\\\times 4 \\\\times 3 \\\\\\\\\\n&= 6 \\\\text{ cm}^2\\n\\\\end{align*}",
     "answer_images": [
-        {{
+        {
             "page_number": 35,
             "bbox": [50.0, 100.0, 300.0, 350.0],
             "description": "Diagram showing triangle with labeled sides"
-        }}
+        }
     ],
     "marks": 3,
     "compilation_success": true,
     "error_message": null
-}}
+}
 
 Example 3 (with sub-parts - MUST use this format):
-{{
+{
     "question_label": "Question 12",
-    "answer_latex": "\\\\item\\n\\\\begin{{enumerate}}[label=(\\\\roman*)]\\n\\\\item\\n\\\\begin{{align*}}\\n\\\\int_0^k \\\\frac{{x}}{{1+x^2}} \\\\, dx &= 1\\\\\\\\\\n\\\\frac{{1}}{{2}}\\\\left[\\\\ln(1+x^2)\\\\right]_0^k &= 1\\\\\\\\\\n\\\\ln(1+k^2) - \\\\ln(1) &= 2\\\\\\\\\\n1+k^2 &= e^2\\\\\\\\\\nk &= \\\\sqrt{{e^2 - 1}}, \\\\quad k > 0\\n\\\\end{{align*}}\\n\\\\item\\n\\\\begin{{align*}}\\nf'(x) &= \\\\frac{{(1+x^2)(1-x(2x))}}{{(1+x^2)^2}} \\\\\\\\\\n\\\\quad \\\\quad \\\\quad &= \\\\quad \\\\frac{{1-x^2}}{{(1+x^2)^2}}\\\\\\\\\\nf'(x) &= 0 \\\\quad \\\\implies \\\\quad 1-x^2 = 0 \\\\\\\\\\nx &= \\\\pm 1 \\\\\\\\\\n\\\\therefore \\\\quad x&=1 \\\\quad \\\\text{{is mode}} \\\\quad (x \\\\geq 0)\\n\\\\end{{align*}}\\n\\\\item\\n\\\\begin{{align*}}\\nF(x) &= \\\\frac{{1}}{{2}} \\\\ln(1 + x^2), \\\\ \\\\text{{from (i)}} \\\\\\\\\\nP(1 \\\\leq x \\\\leq 2) &= F(2) - F(1) \\\\\\\\\\n&= \\\\frac{{1}}{{2}} \\\\ln(5) - \\\\frac{{1}}{{2}} \\\\ln(2) \\\\\\\\\\n&= \\\\frac{{1}}{{2}} \\\\ln\\\\left(\\\\frac{{5}}{{2}}\\\\right) \\\\\\\\\\n&= 0.4581\\n\\\\end{{align*}}\\n\\\\end{{enumerate}}",
+    "answer_latex": "\\\\item\\n\\\\begin{enumerate}[label=(\\\\roman*)]\\n\\\\item\\n\\\\begin{align*}\\n\\\\int_0^k \\\\frac{x}{1+x^2} \\\\, dx &= 1\\\\\\\\\\n\\\\frac{1}{2}\\\\left[\\\\ln(1+x^2)\\\\right]_0^k &= 1\\\\\\\\\\n\\\\ln(1+k^2) - \\\\ln(1) &= 2\\\\\\\\\\n1+k^2 &= e^2\\\\\\\\\\nk &= \\\\sqrt{e^2 - 1}, \\\\quad k > 0\\n\\\\end{align*}\\n\\\\item\\n\\\\begin{align*}\\nf'(x) &= \\\\frac{(1+x^2)(1-x(2x))}{(1+x^2)^2} \\\\\\\\\\n\\\\quad \\\\quad \\\\quad &= \\\\quad \\\\frac{1-x^2}{(1+x^2)^2}\\\\\\\\\\nf'(x) &= 0 \\\\quad \\\\implies \\\\quad 1-x^2 = 0 \\\\\\\\\\nx &= \\\\pm 1 \\\\\\\\\\n\\\\therefore \\\\quad x&=1 \\\\quad \\\\text{is mode} \\\\quad (x \\\\geq 0)\\n\\\\end{align*}\\n\\\\item\\n\\\\begin{align*}\\nF(x) &= \\\\frac{1}{2} \\\\ln(1 + x^2), \\\\ \\\\text{from (i)} \\\\\\\\\\nP(1 \\\\leq x \\\\leq 2) &= F(2) - F(1) \\\\\\\\\\n&= \\\\frac{1}{2} \\\\ln(5) - \\\\frac{1}{2} \\\\ln(2) \\\\\\\\\\n&= \\\\frac{1}{2} \\\\ln\\\\left(\\\\frac{5}{2}\\\\right) \\\\\\\\\\n&= 0.4581\\n\\\\end{align*}\\n\\\\end{enumerate}",
     "answer_images": [],
     "marks": 8,
     "compilation_success": true,
     "error_message": null
-}}
+}
+
+"""
 
-Now convert the answer.
+_ANSWER_PROMPT_TAIL = """Now convert the answer.
 """
 
+_ANSWER_SYSTEM_PROMPT = _ANSWER_PROMPT_HEAD + _ANSWER_PROMPT_TAIL
+_ANSWER_SYSTEM_PROMPT_FULL = _ANSWER_PROMPT_HEAD + _ANSWER_EXTRA_EXAMPLES + _ANSWER_PROMPT_TAIL
 
-async def generate_answer_latex_direct(
+# 系统消息不随题目变化，复用同一个实例
+_ANSWER_SYSTEM_MESSAGE = LLMMessage(role=MessageRole.SYSTEM, content=_ANSWER_SYSTEM_PROMPT)
+_ANSWER_SYSTEM_MESSAGE_FULL = LLMMessage(role=MessageRole.SYSTEM, content=_ANSWER_SYSTEM_PROMPT_FULL)
+
+
+@functools.lru_cache(maxsize=64)
+def _file_content(file_id: str) -> MessageContent:
+    """文件引用块（同一份 PDF 的所有题目复用同一个对象）"""
+    return MessageContent(type=ContentType.FILE, file_id=file_id)
+
+
+# 每道题的 Task 段（动态字段为 {question_label} / {pages_str} / {question_index}）
+_ANSWER_TASK_TEMPLATE = """=== Task ===
+Convert the answer for question **{question_label}** to LaTeX. Return JSON.
+- Question Label: {question_label}
+- Solution Pages: [{pages_str}] (0-based page indexing)
+- Image Index: {question_index}"""
+
+
+def get_answer_latex_task(question_label: str, solution_pages: List[int], question_index: int) -> str:
+    """生成答案 LaTeX 的 Task 段（放在 user 消息中，system prompt 保持静态）"""
+    return _ANSWER_TASK_TEMPLATE.format_map({
+        "question_label": question_label,
+        "pages_str": ", ".join(map(str, solution_pages)),
+        "question_index": question_index,
+    })
+
+
+def get_answer_latex_prompt(question_label: str, solution_pages: List[int], question_index: int, verbose: bool = False) -> str:
+    """生成答案 LaTeX 完整提示词（静态部分 + Task 段）；verbose=True 时包含全部示例"""
+    system_prompt = _ANSWER_SYSTEM_PROMPT_FULL if verbose else _ANSWER_SYSTEM_PROMPT
+    return f"{system_prompt}\n{get_answer_latex_task(question_label, solution_pages, question_index)}"
+
+
+async def _generate_answer_latex_direct(
     question_label: str,
     solution_pages: List[int],
     solution_file_id: str,
-    question_index: Optional[int] = None
-) -> Tuple[AnswerLatexOutput, "UsageWithDuration"]:
-    """
-    生成单道题目答案的 LaTeX 代码
-    
-    Args:
-        question_label: 题目标签
-        solution_pages: 答案所在页码列表（0-based）
-        solution_file_id: 已上传的 solution 文件 ID
-        question_index: 题目索引（可选，用于生成图片占位符）
-    
-    Returns:
-        Tuple[AnswerLatexOutput, UsageWithDuration]: (LaTeX输出, API使用统计含时间)
-    """
-    from . import UsageWithDuration
-    
+    question_index: int,
+    cache_key: str
+) -> Tuple[AnswerLatexOutput, UsageWithDuration]:
+    """generate_answer_latex_direct 的实际实现（question_index 已解析，cache_key 已计算）"""
     # 记录开始时间
-    start_time = time.time()
+    start_time = time.perf_counter()
     
-    # 如果 question_index 为 None，尝试从 question_label 提取数字，否则使用默认值 0
-    if question_index is None:
-        import re
-        # 尝试从 label 中提取数字（如 "Question 6" -> 6, "10(a)" -> 10）
-        match = re.search(r'\d+', question_label)
-        question_index = int(match.group()) if match else 0
+    # 缓存命中时直接返回（不调用 API）
+    cached = await get_cached_latex(cache_key)
+    if cached is not None:
+        latex_output = AnswerLatexOutput.model_validate(cached)
+        duration = time.perf_counter() - start_time
+        logger.info("[A] ✓ Cache hit for {}", question_label)
+        return latex_output, UsageWithDuration(usage=Usage(), duration_seconds=duration)
     
-    client = ClientManager.create_agent_client()
+    client = ClientManager.get_agent_client(_MODEL)
     
-    logger.info(f"[A] 📝 Generating LaTeX for answer {question_label} (index: {question_index})")
-    logger.info(f"[A]    Pages: {solution_pages}, File: {solution_file_id}")
+    logger.info("[A] 📝 Generating LaTeX for answer {} (index: {})", question_label, question_index)
+    logger.info("[A]    Pages: {}, File: {}", solution_pages, solution_file_id)
     
-    # 构建 prompt
-    system_prompt = get_answer_latex_prompt(question_label, solution_pages, question_index)
+    # 构建 prompt：system prompt 静态，题目相关的 Task 段放在文件之后；
+    # 同一份 PDF 的所有题目共享 system + 文件这段前缀，可命中服务端的 prompt 缓存
+    system_prompt = _ANSWER_SYSTEM_PROMPT
+    task_prompt = get_answer_latex_task(question_label, solution_pages, question_index)
     
     # 构建消息
     user_content = [
+        _file_content(solution_file_id),
         MessageContent(
             type=ContentType.TEXT,
-            text=f"Convert answer for {question_label} to LaTeX. Return JSON."
-        ),
-        MessageContent(
-            type=ContentType.FILE,
-            file_id=solution_file_id
+            text=task_prompt
         )
     ]
     
     messages = [
-        LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+        _ANSWER_SYSTEM_MESSAGE,
         LLMMessage(role=MessageRole.USER, content=user_content)
     ]
     
@@ -184,9 +225,16 @@ async def generate_answer_latex_direct(
     max_retries = 2
     current_max_tokens = 8000
     
+    limiter = get_rate_limiter()
+    # 流式接收：长 LaTeX 输出在生成过程中就开始传输，而不是等整个响应完成后再一次性下载
+    query = client.astream_query_with_fallback if settings.latex_stream_responses else client.aquery
+    # 预估输入 token：prompt 按 4 字符/token 估算，另加 PDF 文件内容的估计值
+    estimated_input_tokens = (len(system_prompt) + len(task_prompt)) // 4 + 2000
+    
     for retry in range(max_retries):
         try:
-            response = await client.aquery(
+            await limiter.acquire(estimated_input_tokens + current_max_tokens)
+            response = await query(
                 messages=messages,
                 temperature=0.0,
                 max_tokens=current_max_tokens,
@@ -201,8 +249,9 @@ async def generate_answer_latex_direct(
                 logger.error(f"[A] usage: {response.usage}")
                 
                 # 如果是因为长度限制且还有重试机会
-                if response.finish_reason == 'length' and retry < max_retries - 1:
-                    current_max_tokens = int(current_max_tokens * 1.5)  # 增加 50%
+                if response.finish_reason == 'length' and retry < max_retries - 1 and current_max_tokens < settings.latex_max_output_tokens:
+                    current_max_tokens = min(int(current_max_tokens * 1.5), settings.latex_max_output_tokens)  # 增加 50%
+                    messages[0] = _ANSWER_SYSTEM_MESSAGE_FULL  # 重试时带上全部示例
                     logger.warning(f"[A] Response truncated. Retrying with max_tokens={current_max_tokens}")
                     continue
                 else:
@@ -211,40 +260,41 @@ async def generate_answer_latex_direct(
                         f"tokens={response.usage.get('completion_tokens', 0) if response.usage else 0}"
                     )
             
-            # 解析响应
-            response_data = json.loads(response.content)
-            
-            # 构造输出对象
-            latex_output = AnswerLatexOutput(**response_data)
+            # 解析并校验响应（pydantic-core 一次完成，不生成中间 dict）；
+            # JSON 非法或字段不符都抛出 ValidationError，走下面的重试分支
+            latex_output = AnswerLatexOutput.model_validate_json(response.content)
             
             # 构造 Usage
-            usage = Usage()
-            if response.usage:
-                usage.requests = 1
-                usage.input_tokens = response.usage.get("prompt_tokens", 0)
-                usage.output_tokens = response.usage.get("completion_tokens", 0)
-                usage.total_tokens = response.usage.get("total_tokens", 0)
+            usage = usage_from_response(response.usage)
             
             # 计算耗时
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             
-            logger.info(f"[A] ✓ Generated LaTeX for answer {question_label}")
-            logger.info(f"[A]    LaTeX length: {len(latex_output.answer_latex)} chars")
-            logger.info(f"[A]    Marks: {latex_output.marks}")
-            logger.info(f"[A]    Duration: {duration:.2f}s")
-            logger.info(f"[A]    Usage: {usage.total_tokens} tokens")
+            # 汇总为一条日志，参数延迟格式化（日志级别被关闭时不构造字符串）
+            logger.info(
+                "[A] ✓ Generated LaTeX for answer {} | {} chars, marks: {}, {:.2f}s, {} tokens",
+                question_label, len(latex_output.answer_latex), latex_output.marks, duration, usage.total_tokens
+            )
+            if response.metadata and response.metadata.get("time_to_first_token") is not None:
+                logger.info("[A]    Time to first token: {:.2f}s", response.metadata["time_to_first_token"])
+            
+            # 写入缓存
+            await put_cached_latex(cache_key, latex_output.model_dump())
             
             # 返回带时间的 usage
             usage_with_duration = UsageWithDuration(usage=usage, duration_seconds=duration)
             return latex_output, usage_with_duration
             
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, ValidationError) as e:
             logger.error(f"[A] Failed to parse JSON (attempt {retry + 1}/{max_retries}): {e}")
             logger.error(f"[A] Response: {response.content[:500] if response.content else '(empty)'}")
             
             # 如果还有重试机会且疑似长度问题
-            if retry < max_retries - 1:
-                current_max_tokens = int(current_max_tokens * 1.5)
+            # 已经是 token 上限仍被截断时，再重试一次注定失败
+            at_ceiling = response.finish_reason == 'length' and current_max_tokens >= settings.latex_max_output_tokens
+            if retry < max_retries - 1 and not at_ceiling:
+                current_max_tokens = min(int(current_max_tokens * 1.5), settings.latex_max_output_tokens)
+                messages[0] = _ANSWER_SYSTEM_MESSAGE_FULL  # 重试时带上全部示例
                 logger.warning(f"[A] Retrying with max_tokens={current_max_tokens}")
                 continue
             else:
@@ -253,3 +303,72 @@ async def generate_answer_latex_direct(
             logger.error(f"Failed to generate answer LaTeX for {question_label}: {e}")
             raise
 
+
+async def generate_answer_latex_direct(
+    question_label: str,
+    solution_pages: List[int],
+    solution_file_id: str,
+    question_index: Optional[int] = None
+) -> Tuple[AnswerLatexOutput, UsageWithDuration]:
+    """
+    生成单道题目答案的 LaTeX 代码
+    
+    Args:
+        question_label: 题目标签
+        solution_pages: 答案所在页码列表（0-based）
+        solution_file_id: 已上传的 solution 文件 ID
+        question_index: 题目索引（可选，用于生成图片占位符）
+    
+    Returns:
+        Tuple[AnswerLatexOutput, UsageWithDuration]: (LaTeX输出, API使用统计含时间)
+    """
+    start_time = time.perf_counter()
+    
+    # 如果 question_index 为 None，尝试从 question_label 提取数字，否则使用默认值 0
+    if question_index is None:
+        # 尝试从 label 中提取数字（如 "Question 6" -> 6, "10(a)" -> 10）
+        match = _LABEL_DIGIT_RE.search(question_label)
+        question_index = int(match.group()) if match else 0
+    
+    cache_key = latex_cache_key("answer", solution_file_id, question_label, question_index, solution_pages, _PROMPT_VERSION, _MODEL)
+    
+    # 相同请求（重复题目、重叠批次）正在生成时直接等待其结果，只调用一次 LLM
+    (latex_output, usage_with_duration), shared = await coalesce_in_flight(
+        cache_key,
+        lambda: _generate_answer_latex_direct(question_label, solution_pages, solution_file_id, question_index, cache_key)
+    )
+    if shared:
+        logger.info("[A] ✓ Reused in-flight result for {}", question_label)
+        return latex_output.model_copy(deep=True), UsageWithDuration(usage=Usage(), duration_seconds=time.perf_counter() - start_time)
+    return latex_output, usage_with_duration
+
+
+async def generate_answer_latex_batch(
+    tasks: List[Tuple[str, List[int], str, Optional[int]]],
+    max_concurrent: Optional[int] = None
+) -> List[Union[Tuple[AnswerLatexOutput, UsageWithDuration], BaseException]]:
+    """
+    批量并发生成答案 LaTeX
+    
+    与 question / answer 生成共用同一个 "latex" Semaphore，总并发不超过
+    settings.latex_max_concurrent。
+    
+    Args:
+        tasks: [(question_label, solution_pages, solution_file_id, question_index), ...]
+        max_concurrent: 最大并发数（默认 settings.latex_max_concurrent，仅首次创建 Semaphore 时生效）
+    
+    Returns:
+        与 tasks 顺序一致的结果列表；失败的任务返回对应异常
+    """
+    semaphore = get_shared_semaphore("latex", max_concurrent or settings.latex_max_concurrent)
+    
+    async def _run(question_label: str, solution_pages: List[int], solution_file_id: str, question_index: Optional[int]):
+        async with semaphore:
+            return await generate_answer_latex_direct(
+                question_label=question_label,
+                solution_pages=solution_pages,
+                solution_file_id=solution_file_id,
+                question_index=question_index
+            )
+    
+    return await asyncio.gather(*[_run(*task) for task in tasks], return_exceptions=True)
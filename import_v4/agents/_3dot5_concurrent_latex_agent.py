@@ -5,19 +5,226 @@ providing approximately 50% performance improvement over sequential execution.
 """
 
 import asyncio
+import re
 import time
-from typing import Tuple, List, Optional, TYPE_CHECKING
+from collections import Counter
+from typing import Dict, Tuple, List, Optional
 from loguru import logger
+from pydantic import ValidationError
+from agents import Usage
 
-if TYPE_CHECKING:
-    from . import UsageWithDuration
+from ._usage import UsageWithDuration
 
-from ..models.schemas import QuestionLatexOutput, AnswerLatexOutput, QuestionLabelOutput
-from ._2_question_latex_agent import generate_question_latex_direct
-from ._3_answer_latex_agent import generate_answer_latex_direct
+from ..config.settings import settings
+from ..models.schemas import QuestionLatexOutput, AnswerLatexOutput, QALatexOutput, QuestionLabelOutput
+from ..clients.client_manager import ClientManager
+from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
+from ..clients.rate_limiter import get_rate_limiter
+from ..utils.concurrency import get_shared_semaphore, create_eager_task
+from ..utils.usage_tracker import usage_from_response
+from ..utils.latex_cache import latex_cache_key, get_cached_latex, put_cached_latex, file_content_id
+from ._2_question_latex_agent import generate_question_latex_direct, get_question_latex_prompt, _PROMPT_VERSION as _QUESTION_PROMPT_VERSION, _MODEL as _LATEX_MODEL
+from ._3_answer_latex_agent import generate_answer_latex_direct, get_answer_latex_prompt, _PROMPT_VERSION as _ANSWER_PROMPT_VERSION
 from ._5_labelling_agent import label_question_direct
 
 
+# 从题目标签中提取第一个数字（如 "Question 6" -> 6, "10(a)" -> 10）
+_LABEL_DIGIT_RE = re.compile(r'\d+')
+
+# labelling 调用 / 跳过次数（按原因统计），用于观察预检查的跳过比例
+_labelling_counts: Counter = Counter()
+
+
+def get_labelling_counts() -> Dict[str, int]:
+    """返回 labelling 调用与各原因跳过的累计次数（"labelled" 为实际调用次数）"""
+    return dict(_labelling_counts)
+
+
+def _workflow_stats(
+    total_duration: float,
+    q_usage: UsageWithDuration,
+    a_usage: UsageWithDuration,
+    label_usage: Optional[UsageWithDuration]
+) -> Tuple[float, float, float, float, int]:
+    """计算日志用的性能统计：(总耗时, 顺序执行耗时, 节省时间, 节省百分比, 总 token 数)"""
+    usages = [usage for usage in (q_usage, a_usage, label_usage) if usage]
+    sequential_duration = sum(usage.duration_seconds for usage in usages)
+    time_saved = sequential_duration - total_duration
+    percentage_saved = (time_saved / sequential_duration * 100) if sequential_duration > 0 else 0
+    total_tokens = sum(usage.total_tokens for usage in usages)
+    return total_duration, sequential_duration, time_saved, percentage_saved, total_tokens
+
+
+def _labelling_skip_reason(q_latex: QuestionLatexOutput, a_latex: AnswerLatexOutput) -> Optional[str]:
+    """labelling 前的快速预检查：LaTeX 为空或内容过少时返回跳过原因，否则返回 None"""
+    question_text = (q_latex.question_latex or "").strip()
+    if not question_text:
+        return "empty_question_latex"
+    if not (a_latex.answer_latex or "").strip():
+        return "empty_answer_latex"
+    if not q_latex.question_images and len(question_text) < settings.labelling_min_question_chars:
+        return "short_question_latex"
+    return None
+
+
+def get_qa_latex_prompt(
+    question_label: str,
+    paper_pages: List[int],
+    solution_pages: List[int],
+    question_index: int
+) -> str:
+    """生成题目 + 答案合并 LaTeX 提示词（复用两个单独的提示词，只替换输出格式）"""
+    
+    question_prompt = get_question_latex_prompt(question_label, paper_pages, question_index)
+    answer_prompt = get_answer_latex_prompt(question_label, solution_pages, question_index)
+    
+    return f"""You will convert BOTH the question and its answer for **{question_label}** to LaTeX in one response.
+
+Two PDF files are attached: the FIRST file is the question paper, the SECOND file is the solution.
+Complete PART 1 using the paper file and PART 2 using the solution file.
+
+######## PART 1: QUESTION (paper file) ########
+{question_prompt}
+
+######## PART 2: ANSWER (solution file) ########
+{answer_prompt}
+
+######## Combined Output Format (overrides the output formats above) ########
+Return ONLY one valid JSON object with exactly two keys:
+{{
+    "question": {{ ...the PART 1 JSON object, same fields as described in PART 1... }},
+    "answer": {{ ...the PART 2 JSON object, same fields as described in PART 2... }}
+}}
+"""
+
+
+async def generate_qa_latex_direct(
+    question_label: str,
+    paper_pages: List[int],
+    solution_pages: List[int],
+    paper_file_id: str,
+    solution_file_id: str,
+    question_index: Optional[int] = None
+) -> Tuple[QuestionLatexOutput, AnswerLatexOutput, UsageWithDuration]:
+    """
+    单次 LLM 调用同时生成题目和答案的 LaTeX（两个文件放在同一条消息中）
+    
+    Args:
+        question_label: 题目标签（如 "10(a)", "Question 21"）
+        paper_pages: 题目所在页码列表（0-based）
+        solution_pages: 答案所在页码列表（0-based）
+        paper_file_id: 已上传的 paper 文件 ID
+        solution_file_id: 已上传的 solution 文件 ID
+        question_index: 题目索引（可选，用于生成图片占位符）
+    
+    Returns:
+        Tuple[QuestionLatexOutput, AnswerLatexOutput, UsageWithDuration]: (题目LaTeX, 答案LaTeX, API使用统计含时间)
+    """
+    # 记录开始时间
+    start_time = time.perf_counter()
+    
+    # 如果 question_index 为 None，尝试从 question_label 提取数字，否则使用默认值 0
+    if question_index is None:
+        match = _LABEL_DIGIT_RE.search(question_label)
+        question_index = int(match.group()) if match else 0
+    
+    # 缓存命中时直接返回（不调用 API）；两个文件各自解析为内容标识（跨运行不变），
+    # 页码用 -1 分隔 paper / solution 两段，提示词版本取两者组合
+    cache_key = latex_cache_key(
+        "qa",
+        f"{file_content_id(paper_file_id)}+{file_content_id(solution_file_id)}",
+        question_label,
+        question_index,
+        [*paper_pages, -1, *solution_pages],
+        f"{_QUESTION_PROMPT_VERSION}+{_ANSWER_PROMPT_VERSION}",
+        _LATEX_MODEL
+    )
+    cached = await get_cached_latex(cache_key)
+    if cached is not None:
+        qa_output = QALatexOutput.model_validate(cached)
+        logger.info("[QA] ✓ Cache hit for {}", question_label)
+        return qa_output.question, qa_output.answer, UsageWithDuration(usage=Usage(), duration_seconds=time.perf_counter() - start_time)
+    
+    client = ClientManager.get_agent_client(_LATEX_MODEL)
+    
+    logger.info(
+        "[QA] 📝 Generating question + answer LaTeX for {} (index: {}) | paper pages: {}, solution pages: {}",
+        question_label, question_index, paper_pages, solution_pages
+    )
+    
+    system_prompt = get_qa_latex_prompt(question_label, paper_pages, solution_pages, question_index)
+    
+    user_content = [
+        MessageContent(
+            type=ContentType.TEXT,
+            text=f"Convert question {question_label} and its answer to LaTeX. Return JSON."
+        ),
+        MessageContent(type=ContentType.FILE, file_id=paper_file_id),
+        MessageContent(type=ContentType.FILE, file_id=solution_file_id)
+    ]
+    
+    messages = [
+        LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+        LLMMessage(role=MessageRole.USER, content=user_content)
+    ]
+    
+    # 调用 API（带重试机制；输出包含题目和答案，token 上限为单独调用的两倍）
+    max_retries = 2
+    current_max_tokens = 16000
+    
+    limiter = get_rate_limiter()
+    # 流式接收：长 LaTeX 输出在生成过程中就开始传输，而不是等整个响应完成后再一次性下载
+    query = client.astream_query_with_fallback if settings.latex_stream_responses else client.aquery
+    estimated_input_tokens = len(system_prompt) // 4 + 4000
+    
+    for retry in range(max_retries):
+        await limiter.acquire(estimated_input_tokens + current_max_tokens)
+        response = await query(
+            messages=messages,
+            temperature=0.0,
+            max_tokens=current_max_tokens,
+            response_format={"type": "json_object"}
+        )
+        
+        if not response.content:
+            logger.error("[QA] Empty response content for {}, finish_reason: {}", question_label, response.finish_reason)
+            if response.finish_reason == 'length' and retry < max_retries - 1 and current_max_tokens < settings.latex_max_output_tokens:
+                current_max_tokens = min(int(current_max_tokens * 1.5), settings.latex_max_output_tokens)
+                logger.warning("[QA] Response truncated. Retrying with max_tokens={}", current_max_tokens)
+                continue
+            raise ValueError(
+                f"API returned empty content. finish_reason={response.finish_reason}, "
+                f"tokens={response.usage.get('completion_tokens', 0) if response.usage else 0}"
+            )
+        
+        try:
+            qa_output = QALatexOutput.model_validate_json(response.content)
+        except ValidationError as e:
+            logger.error("[QA] Failed to parse JSON (attempt {}/{}): {}", retry + 1, max_retries, e)
+            # 已经是 token 上限仍被截断时，再重试一次注定失败
+            at_ceiling = response.finish_reason == 'length' and current_max_tokens >= settings.latex_max_output_tokens
+            if retry < max_retries - 1 and not at_ceiling:
+                current_max_tokens = min(int(current_max_tokens * 1.5), settings.latex_max_output_tokens)
+                logger.warning("[QA] Retrying with max_tokens={}", current_max_tokens)
+                continue
+            raise
+        
+        usage = usage_from_response(response.usage)
+        duration = time.perf_counter() - start_time
+        
+        # 汇总为一条日志，参数延迟格式化（日志级别被关闭时不构造字符串）
+        logger.info(
+            "[QA] ✓ Generated LaTeX for {} | question: {} chars, answer: {} chars, {:.2f}s, {} tokens",
+            question_label, len(qa_output.question.question_latex), len(qa_output.answer.answer_latex),
+            duration, usage.total_tokens
+        )
+        
+        # 写入缓存
+        await put_cached_latex(cache_key, qa_output.model_dump())
+        
+        return qa_output.question, qa_output.answer, UsageWithDuration(usage=usage, duration_seconds=duration)
+
+
 async def generate_question_and_answer_latex_concurrent(
     question_label: str,
     paper_pages: List[int],
@@ -32,9 +239,9 @@ async def generate_question_and_answer_latex_concurrent(
     QuestionLatexOutput, 
     AnswerLatexOutput, 
     Optional[QuestionLabelOutput],
-    "UsageWithDuration", 
-    "UsageWithDuration",
-    Optional["UsageWithDuration"]
+    UsageWithDuration, 
+    UsageWithDuration,
+    Optional[UsageWithDuration]
 ]:
     """
     并发生成单道题目的 question LaTeX、answer LaTeX 和 labelling
@@ -84,32 +291,62 @@ async def generate_question_and_answer_latex_concurrent(
         >>> print(f"Answer LaTeX: {len(a_latex.answer_latex)} chars")
         >>> print(f"Topic: {label.topic_id}, Difficulty: {label.difficulty}")
     """
-    from . import UsageWithDuration
-    
     # 记录开始时间
-    start_time = time.time()
+    start_time = time.perf_counter()
     
-    logger.info(f"🚀 Starting concurrent LaTeX generation for {question_label}")
-    logger.info(f"   Question pages: {paper_pages}")
-    logger.info(f"   Answer pages: {solution_pages}")
+    logger.info("🚀 Starting concurrent LaTeX generation for {}", question_label)
+    logger.info("   Question pages: {}", paper_pages)
+    logger.info("   Answer pages: {}", solution_pages)
+    
+    # 与批量接口共用 LaTeX 并发上限（多道题同时处理时限制总的 LLM 请求数）
+    semaphore = get_shared_semaphore("latex", settings.latex_max_concurrent)
+    
+    async def _limited(coro):
+        async with semaphore:
+            return await coro
     
     # 并发执行两个任务
     try:
-        results = await asyncio.gather(
-            generate_question_latex_direct(
+        if settings.combined_qa_latex:
+            # 合并模式：一次调用同时生成题目和答案；usage 全部记在 question 上，answer 为空
+            async with semaphore:
+                q_latex, a_latex, q_usage = await generate_qa_latex_direct(
+                    question_label=question_label,
+                    paper_pages=paper_pages,
+                    solution_pages=solution_pages,
+                    paper_file_id=paper_file_id,
+                    solution_file_id=solution_file_id,
+                    question_index=question_index
+                )
+            results = [(q_latex, q_usage), (a_latex, UsageWithDuration(usage=Usage(), duration_seconds=0.0))]
+        else:
+            q_task = create_eager_task(_limited(generate_question_latex_direct(
                 question_label=question_label,
                 paper_pages=paper_pages,
                 paper_file_id=paper_file_id,
                 question_index=question_index
-            ),
-            generate_answer_latex_direct(
+            )))
+            a_task = create_eager_task(_limited(generate_answer_latex_direct(
                 question_label=question_label,
                 solution_pages=solution_pages,
                 solution_file_id=solution_file_id,
                 question_index=question_index
-            ),
-            return_exceptions=True  # 捕获异常而不是立即失败
-        )
+            )))
+            try:
+                # 按完成顺序处理：先完成的一侧立即记录结果，不必等较慢的一侧；
+                # 任一任务失败时立即取消另一个：整道题已经失败，不必再等它跑完、浪费 token
+                for next_done in asyncio.as_completed((q_task, a_task)):
+                    try:
+                        latex, usage = await next_done
+                    except Exception:
+                        break
+                    kind = "Question" if isinstance(latex, QuestionLatexOutput) else "Answer"
+                    logger.info("   ✓ {} LaTeX ready: {:.2f}s, {} tokens", kind, usage.duration_seconds, usage.total_tokens)
+            finally:
+                for task in (q_task, a_task):
+                    if not task.done():
+                        task.cancel()
+            results = await asyncio.gather(q_task, a_task, return_exceptions=True)
         
         # 检查结果
         if isinstance(results[0], Exception):
@@ -123,17 +360,26 @@ async def generate_question_and_answer_latex_concurrent(
         # 解包结果
         (q_latex, q_usage), (a_latex, a_usage) = results
         
-        latex_duration = time.time() - start_time
-        logger.info(f"✅ Step 1/2: Concurrent LaTeX generation completed for {question_label}")
-        logger.info(f"   LaTeX duration: {latex_duration:.2f}s")
+        latex_duration = time.perf_counter() - start_time
+        logger.info("✅ Step 1/2: Concurrent LaTeX generation completed for {}", question_label)
+        logger.info("   LaTeX duration: {:.2f}s", latex_duration)
         
         # Step 2: Label question（依赖 LaTeX 结果）
         label_output = None
         label_usage = None
         
-        if enable_labelling:
+        skip_reason = _labelling_skip_reason(q_latex, a_latex) if enable_labelling else None
+        if skip_reason:
+            _labelling_counts[skip_reason] += 1
+            skipped = sum(count for reason, count in _labelling_counts.items() if reason != "labelled")
+            logger.warning(
+                "⚠️  Skipping labelling for {} ({}); skipped {}/{} so far",
+                question_label, skip_reason, skipped, sum(_labelling_counts.values())
+            )
+        elif enable_labelling:
+            _labelling_counts["labelled"] += 1
             try:
-                logger.info(f"🏷️  Step 2/2: Labelling {question_label}...")
+                logger.info("🏷️  Step 2/2: Labelling {}...", question_label)
                 
                 label_output, label_usage = await label_question_direct(
                     question_index=question_index or 0,
@@ -146,9 +392,9 @@ async def generate_question_and_answer_latex_concurrent(
                     existing_mark=a_latex.marks
                 )
                 
-                logger.info(f"✅ Step 2/2: Labelling completed for {question_label}")
-                logger.info(f"   Topic: {label_output.topic_id}, Subtopic: {label_output.subtopic_id}")
-                logger.info(f"   Type: {label_output.question_type}, Difficulty: {label_output.difficulty}")
+                logger.info("✅ Step 2/2: Labelling completed for {}", question_label)
+                logger.info("   Topic: {}, Subtopic: {}", label_output.topic_id, label_output.subtopic_id)
+                logger.info("   Type: {}, Difficulty: {}", label_output.question_type, label_output.difficulty)
                 
             except Exception as e:
                 logger.error(f"❌ Labelling failed for {question_label}: {e}")
@@ -156,24 +402,16 @@ async def generate_question_and_answer_latex_concurrent(
                 # 不抛出异常，允许继续（labelling 失败不应阻止整个流程）
         
         # 计算总耗时
-        total_duration = time.time() - start_time
-        
-        # 计算性能提升
-        sequential_duration = q_usage.duration_seconds + a_usage.duration_seconds
-        if label_usage:
-            sequential_duration += label_usage.duration_seconds
-        
-        time_saved = sequential_duration - total_duration
-        percentage_saved = (time_saved / sequential_duration * 100) if sequential_duration > 0 else 0
-        
-        # 日志输出
-        logger.info(f"✅ Complete workflow finished for {question_label}")
-        logger.info(f"   Total duration: {total_duration:.2f}s (vs {sequential_duration:.2f}s sequential)")
-        logger.info(f"   Time saved: {time_saved:.2f}s ({percentage_saved:.1f}%)")
-        total_tokens = q_usage.total_tokens + a_usage.total_tokens
-        if label_usage:
-            total_tokens += label_usage.total_tokens
-        logger.info(f"   Total tokens: {total_tokens:,}")
+        total_duration = time.perf_counter() - start_time
+        
+        # 日志输出（参数交给 loguru 延迟格式化；性能统计只在 INFO 级别启用时才计算）
+        logger.info("✅ Complete workflow finished for {}", question_label)
+        logger.opt(lazy=True).info(
+            "   Total duration: {0[0]:.2f}s (vs {0[1]:.2f}s sequential)\n"
+            "   Time saved: {0[2]:.2f}s ({0[3]:.1f}%)\n"
+            "   Total tokens: {0[4]:,}",
+            lambda: _workflow_stats(total_duration, q_usage, a_usage, label_usage)
+        )
         
         return q_latex, a_latex, label_output, q_usage, a_usage, label_usage
         
@@ -3,64 +3,43 @@
 Verifies and corrects image bounding box coordinates to ensure proper image extraction.
 """
 
+import io
+import os
+import atexit
 import json
+import asyncio
 import base64
+import functools
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Any, List, Tuple, Dict, Optional, Union
 from loguru import logger
 import fitz  # PyMuPDF
 from PIL import Image
 
-from ..models.schemas import BboxCorrectionOutput, ImageInfo
+from ..models.schemas import BboxCorrectionOutput, BboxBatchCorrectionOutput, ImageInfo
 from ..clients.client_manager import ClientManager
 from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
-from ..preprocessing.pdf_renderer import PDFRenderer
+from ..config.settings import settings
+from ..preprocessing.pdf_renderer import PDFRenderer, fit_render_scale, render_pages_parallel
+from ..utils.concurrency import get_shared_semaphore
+from ..utils.usage_tracker import usage_from_response
 from agents import Usage
 
 
-def get_bbox_corrector_prompt(
-    question_label: str,
-    current_bbox: List[float],
-    expected_description: str,
-    image_type: str,
-    pdf_page_size: Tuple[float, float],
-    rendered_page_size: Tuple[int, int],
-    cropped_image_size: Tuple[int, int]
-) -> str:
-    """生成 bbox 修正提示词"""
-    
-    pdf_width, pdf_height = pdf_page_size
-    rendered_width, rendered_height = rendered_page_size
-    cropped_width, cropped_height = cropped_image_size
-    
-    # Calculate scale factor
-    scale_x = rendered_width / pdf_width
-    scale_y = rendered_height / pdf_height
-    
-    # Calculate bbox in rendered image coordinates
-    x1, y1, x2, y2 = current_bbox
-    bbox_rendered_x1 = x1 * scale_x
-    bbox_rendered_y1 = y1 * scale_y
-    bbox_rendered_x2 = x2 * scale_x
-    bbox_rendered_y2 = y2 * scale_y
-    
-    return f"""You are an expert at validating image crops from PDF documents.
+# 静态 system prompt（每次迭代、每张图片都逐字节相同，放在消息最前面以命中服务端的前缀缓存；
+# 随调用变化的坐标和尺寸放在 user 消息开头的 Context JSON 中）
+_BBOX_SYSTEM_PROMPT = """You are an expert at validating image crops from PDF documents.
 
 === Your Task ===
-Verify if the cropped image correctly captures the {image_type} content for {question_label}.
-
-=== Current Crop Info ===
-- Question Label: {question_label}
-- Current BBox (PDF points): {current_bbox} (format: [x1, y1, x2, y2])
-- Current BBox (rendered pixels): [{bbox_rendered_x1:.1f}, {bbox_rendered_y1:.1f}, {bbox_rendered_x2:.1f}, {bbox_rendered_y2:.1f}]
-- Expected Content: {expected_description}
-- Image Type: {image_type}
+Verify if the cropped image correctly captures the content described in the === Context === section of the user message.
 
-=== Dimension Information ===
-- PDF Page Size: {pdf_width:.1f} x {pdf_height:.1f} points (PDF coordinate system)
-- Rendered Page Size: {rendered_width} x {rendered_height} pixels
-- Cropped Image Size: {cropped_width} x {cropped_height} pixels
-- Scale Factor: {scale_x:.3f} (X), {scale_y:.3f} (Y) pixels per PDF point
+=== Context Fields ===
+The user message contains the rendered PDF page image, then a JSON context block, then the cropped image:
+- question_label / image_type ("question" or "answer") / expected_description: what the crop should contain
+- current_bbox_pdf_points: current crop [x1, y1, x2, y2] in PDF points
+- current_bbox_rendered_pixels: the same crop in rendered page pixels
+- pdf_page_size_points, rendered_page_size_pixels, cropped_image_size_pixels: [width, height]
+- scale_factor: [x, y] rendered pixels per PDF point
 
 === Important Context ===
 The expected description may include:
@@ -97,13 +76,13 @@ When validating, pay special attention to:
 
 === Output Format ===
 Return ONLY valid JSON:
-{{
+{
     "is_correct": true/false,
     "confidence": 0.95,
     "issue_description": "Crop is too narrow, missing right side of diagram" or null,
     "corrected_bbox": [x1, y1, x2, y2] or null,
     "reasoning": "Detailed explanation of your decision..."
-}}
+}
 
 If crop is correct, set corrected_bbox to null.
 If crop needs correction, provide the corrected coordinates in PDF points.
@@ -111,6 +90,238 @@ If crop needs correction, provide the corrected coordinates in PDF points.
 Now analyze the cropped image and the PDF page.
 """
 
+# 系统消息不随输入变化，复用同一个实例
+_BBOX_SYSTEM_MESSAGE = LLMMessage(role=MessageRole.SYSTEM, content=_BBOX_SYSTEM_PROMPT)
+
+# 多图合并修正：一次调用最多校验的截图数（受单次请求图片数量限制）
+_BBOX_BATCH_MAX_ITEMS = 6
+
+# 多图合并修正的输出要求（放在 user 消息末尾，system prompt 保持不变以共用前缀缓存）
+_BBOX_BATCH_INSTRUCTIONS = """The user message contains several crops from the same rendered PDF page. Each crop is preceded by an "=== Item N ===" header and its own context block.
+Verify EACH crop independently against its own context, using the rendered page image at the top as reference.
+
+Return ONLY valid JSON with exactly one result per item:
+{
+    "results": [
+        {
+            "item_index": N,
+            "is_correct": true/false,
+            "confidence": 0.95,
+            "issue_description": "..." or null,
+            "corrected_bbox": [x1, y1, x2, y2] or null,
+            "reasoning": "..."
+        }
+    ]
+}"""
+
+
+# 进程内已打开的 PDF 文档：(绝对路径, mtime) -> fitz.Document（同一份 PDF 的多张图片共用，避免反复解析）
+_pdf_docs: Dict[Tuple[str, float], fitz.Document] = {}
+
+
+def _close_pdf_docs() -> None:
+    """进程退出时关闭缓存的 PDF 文档（atexit 回调）"""
+    for doc in _pdf_docs.values():
+        doc.close()
+    _pdf_docs.clear()
+
+
+def _open_pdf(pdf_path: str) -> fitz.Document:
+    """打开 PDF（按路径 + 修改时间缓存；文件被修改后关闭旧文档重新打开）"""
+    path = os.path.abspath(pdf_path)
+    key = (path, os.path.getmtime(path))
+    doc = _pdf_docs.get(key)
+    if doc is None:
+        for stale_key in [k for k in _pdf_docs if k[0] == path]:
+            _pdf_docs.pop(stale_key).close()
+        doc = fitz.open(path)
+        if not _pdf_docs:
+            atexit.register(_close_pdf_docs)
+        _pdf_docs[key] = doc
+    return doc
+
+
+# PDF 页面尺寸（PDF points）：(绝对路径, mtime, 页码) -> (宽, 高)；只读元数据，同一页的多张图片不必重复加载页面
+_page_sizes: Dict[Tuple[str, float, int], Tuple[float, float]] = {}
+
+
+def _get_page_size(pdf_path: str, page_number: int) -> Tuple[float, float]:
+    """获取页面尺寸（PDF points，page_number 为 0-based；按路径 + 修改时间 + 页码缓存）"""
+    path = os.path.abspath(pdf_path)
+    key = (path, os.path.getmtime(path), page_number)
+    size = _page_sizes.get(key)
+    if size is None:
+        rect = _open_pdf(path)[page_number].rect
+        size = _page_sizes[key] = (rect.width, rect.height)
+    return size
+
+
+@functools.lru_cache(maxsize=None)
+def _get_renderer(quality: str) -> PDFRenderer:
+    """每种渲染质量共用一个 PDFRenderer"""
+    return PDFRenderer(quality=quality)
+
+
+@functools.lru_cache(maxsize=16)
+def _render_page_cached(pdf_path: str, mtime: float, page_number: int, quality: str, max_edge: int = 0) -> Dict:
+    """渲染整页图片（按 PDF 路径、修改时间、页码、质量、最长边缓存；同一页的多张图片只渲染一次）
+
+    max_edge > 0 时降低渲染倍率，使图片最长边不超过 max_edge 像素（直接按较小倍率光栅化，
+    不需要先渲染再缩小）。mtime 只用于让缓存键随文件内容变化而失效。
+    返回的 dict 为共享对象，调用方不可修改。
+    """
+    page = _open_pdf(pdf_path)[page_number - 1]  # page_number is 1-based
+    scale = fit_render_scale(page.rect.width, page.rect.height, _get_renderer(quality).scale, max_edge)
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale))
+    return {
+        "page_number": page_number,
+        "image_base64": base64.b64encode(pix.tobytes("png")).decode('utf-8'),
+        "width": pix.width,
+        "height": pix.height
+    }
+
+
+# 预先并行渲染的整页图片：(绝对路径, mtime, 页码 1-based, 质量, 最长边) -> render dict
+_prerendered_pages: Dict[Tuple[str, float, int, str, int], Dict] = {}
+
+
+def _prerender_key(pdf_path: str, page_number: int) -> Tuple[str, float, int, str, int]:
+    """预渲染缓存键（page_number 为 1-based）"""
+    path = os.path.abspath(pdf_path)
+    return (path, os.path.getmtime(path), page_number, "medium", settings.bbox_page_max_edge)
+
+
+async def prerender_bbox_pages(pdf_path: str, page_numbers: List[int]) -> None:
+    """
+    在开始 bbox 修正前，多进程并行渲染需要用到的整页图片
+    
+    Args:
+        pdf_path: PDF 文件路径
+        page_numbers: 页码列表（0-based，与 correct_image_bbox 一致）
+    """
+    missing = sorted({n + 1 for n in page_numbers if _prerender_key(pdf_path, n + 1) not in _prerendered_pages})
+    if not missing:
+        return
+    
+    rendered = await asyncio.to_thread(
+        render_pages_parallel, pdf_path, missing, "medium", settings.bbox_page_max_edge
+    )
+    for page_number, page_data in rendered.items():
+        _prerendered_pages[_prerender_key(pdf_path, page_number)] = page_data
+    logger.info(f"🖼️  Pre-rendered {len(rendered)} pages of {Path(pdf_path).name} for bbox correction")
+
+
+def _load_rendered_page(pdf_path: str, page_number: int, output_dir: Path, image_type: str) -> Dict:
+    """渲染（或从缓存取得）整页图片；settings.bbox_save_rendered_page 开启时在输出目录中保存一份供查看
+
+    Args:
+        page_number: 页码（0-based）
+    """
+    # Render PDF page as image once (outside loop for consistency; cached across images on the same page)
+    rendered_page_data = _prerendered_pages.get(_prerender_key(pdf_path, page_number + 1))
+    if rendered_page_data is None:
+        logger.debug(f"  Rendering PDF page {page_number + 1} (1-based)...")
+        rendered_page_data = _render_page_cached(
+            pdf_path, os.path.getmtime(pdf_path), page_number + 1, "medium",  # 1-based
+            settings.bbox_page_max_edge
+        )
+    
+    # 整页图片只在内存中使用（截图直接从 PDF 光栅化），默认不写入磁盘
+    if not settings.bbox_save_rendered_page:
+        return rendered_page_data
+    
+    # Save rendered page image for reference
+    rendered_page_path = output_dir / f"{image_type}_rendered_page_{page_number}.png"
+    # 同一页的多张图片共用同一个文件，已存在时不再重复写入
+    if not rendered_page_path.exists():
+        rendered_page_bytes = base64.b64decode(rendered_page_data['image_base64'])
+        with open(rendered_page_path, 'wb') as f:
+            f.write(rendered_page_bytes)
+        logger.debug(f"  Saved rendered page image: {rendered_page_path}")
+    return rendered_page_data
+
+
+def _rasterize_crop(
+    pdf_path: str,
+    page_number: int,
+    bbox: List[float],
+    scale_x: float,
+    scale_y: float
+) -> Tuple[fitz.Pixmap, bytes, str]:
+    """
+    按 PDF 坐标 bbox 直接从页面光栅化截图（page_number 为 0-based，使用缓存的 PDF 文档）
+    
+    Returns:
+        Tuple[fitz.Pixmap, bytes, str]: (截图 pixmap, 发给 LLM 的图片字节, 图片 MIME 类型)
+    """
+    page = _open_pdf(pdf_path)[page_number]
+    
+    # Clip to the page and rasterize only the bbox at the rendered page's scale
+    # （PyMuPDF 直接按区域渲染，避免整页 PNG 解码后再裁剪造成的二次重采样）
+    clip = fitz.Rect(*bbox) & page.rect
+    if clip.is_empty:
+        raise ValueError(f"Corrected bbox {bbox} lies outside the page {list(page.rect)}")
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale_x, scale_y), clip=clip, alpha=False)
+    # 中间截图只用于发给 LLM，默认编码为 JPEG（比 PNG 编码快、体积小）
+    if settings.bbox_crop_jpeg_quality > 0:
+        return pix, pix.tobytes("jpg", jpg_quality=settings.bbox_crop_jpeg_quality), "image/jpeg"
+    return pix, pix.tobytes("png"), "image/png"
+
+
+def _bbox_to_pixels(bbox: List[float], scale_x: float, scale_y: float) -> List[float]:
+    """把 PDF 坐标 bbox [x1, y1, x2, y2] 换算为渲染图片中的像素坐标（保留一位小数）"""
+    x1, y1, x2, y2 = bbox
+    return [round(x1 * scale_x, 1), round(y1 * scale_y, 1), round(x2 * scale_x, 1), round(y2 * scale_y, 1)]
+
+
+def get_bbox_corrector_context(
+    question_label: str,
+    current_bbox: List[float],
+    expected_description: str,
+    image_type: str,
+    pdf_page_size: Tuple[float, float],
+    rendered_page_size: Tuple[int, int],
+    cropped_image_size: Tuple[int, int]
+) -> str:
+    """生成 bbox 修正的 Context 段（JSON，放在 user 消息开头）"""
+    
+    pdf_width, pdf_height = pdf_page_size
+    rendered_width, rendered_height = rendered_page_size
+    
+    # Calculate scale factor
+    scale_x = rendered_width / pdf_width
+    scale_y = rendered_height / pdf_height
+    
+    context = {
+        "question_label": question_label,
+        "image_type": image_type,
+        "expected_description": expected_description,
+        "current_bbox_pdf_points": current_bbox,
+        "current_bbox_rendered_pixels": _bbox_to_pixels(current_bbox, scale_x, scale_y),
+        "pdf_page_size_points": [round(pdf_width, 1), round(pdf_height, 1)],
+        "rendered_page_size_pixels": list(rendered_page_size),
+        "cropped_image_size_pixels": list(cropped_image_size),
+        "scale_factor": [round(scale_x, 3), round(scale_y, 3)],
+    }
+    return "=== Context ===\n" + json.dumps(context, ensure_ascii=False)
+
+
+def get_bbox_corrector_prompt(
+    question_label: str,
+    current_bbox: List[float],
+    expected_description: str,
+    image_type: str,
+    pdf_page_size: Tuple[float, float],
+    rendered_page_size: Tuple[int, int],
+    cropped_image_size: Tuple[int, int]
+) -> str:
+    """生成 bbox 修正完整提示词（静态部分 + Context 段）"""
+    context = get_bbox_corrector_context(
+        question_label, current_bbox, expected_description, image_type,
+        pdf_page_size, rendered_page_size, cropped_image_size
+    )
+    return f"{_BBOX_SYSTEM_PROMPT}\n{context}"
+
 
 async def correct_image_bbox(
     question_label: str,
@@ -136,7 +347,9 @@ async def correct_image_bbox(
         max_iterations: 最大迭代次数（默认 4）
     
     Returns:
-        Tuple[List[float], bool, Usage, List[str]]: (最终bbox, 是否成功, 使用统计, 所有截取的图片路径)
+        Tuple[List[float], bool, Usage, List[str]]: (最终bbox, 是否成功, 使用统计, 截取的图片路径)
+        
+        中间迭代的截图只保存在内存中，图片路径列表为原始截图加上最终修正后写入磁盘的截图。
     """
     logger.info(f"🔍 Verifying {image_type} image bbox for {question_label}")
     logger.info(f"   Initial bbox: {original_bbox}")
@@ -145,64 +358,51 @@ async def correct_image_bbox(
     total_usage = Usage()
     all_image_paths = [cropped_image_path]
     
-    # Get PDF page dimensions (PDF points)
-    doc = fitz.open(pdf_path)
-    try:
-        page = doc[page_number]  # 0-based
-        pdf_page_rect = page.rect
-        pdf_page_width = pdf_page_rect.width
-        pdf_page_height = pdf_page_rect.height
-    finally:
-        doc.close()
+    # Get PDF page dimensions (PDF points, cached per page)
+    pdf_page_width, pdf_page_height = _get_page_size(pdf_path, page_number)  # 0-based
     
-    # Get cropped image dimensions
-    with Image.open(cropped_image_path) as img:
-        cropped_image_width, cropped_image_height = img.size
+    # Read the initial cropped image once; later crops stay in memory
+    with open(cropped_image_path, 'rb') as f:
+        cropped_image_bytes = f.read()
+    cropped_media_type = "image/png"
+    with Image.open(io.BytesIO(cropped_image_bytes)) as img:
+        cropped_size = img.size
+    # 尚未写入磁盘的修正截图（只在返回前以无损 PNG 写入最终结果）
+    pending_img: Optional[Tuple[Path, fitz.Pixmap]] = None
     
     # Use gpt-5 for better accuracy
-    client = ClientManager.create_agent_client(model="gpt-5")
-    
-    # Initialize PDF renderer
-    pdf_renderer = PDFRenderer(quality="medium")
+    client = ClientManager.get_agent_client(model="gpt-5")
     
-    # Render PDF page as image once (outside loop for consistency)
-    logger.debug(f"  Rendering PDF page {page_number + 1} (1-based)...")
-    rendered_page_data = pdf_renderer.render_page(pdf_path, page_number + 1)  # render_page uses 1-based
+    output_dir = Path(cropped_image_path).parent
+    # 修正后的图片以原图文件名为前缀，同一目录下多张图片并发修正时互不覆盖
+    original_stem = Path(cropped_image_path).stem
+    rendered_page_data = _load_rendered_page(pdf_path, page_number, output_dir, image_type)
     rendered_page_b64 = rendered_page_data['image_base64']
     rendered_page_width = rendered_page_data['width']
     rendered_page_height = rendered_page_data['height']
     
-    # Save rendered page image to temporary file for cropping
-    output_dir = Path(cropped_image_path).parent
-    rendered_page_path = output_dir / f"{image_type}_rendered_page_{page_number}.png"
-    rendered_page_bytes = base64.b64decode(rendered_page_b64)
-    with open(rendered_page_path, 'wb') as f:
-        f.write(rendered_page_bytes)
-    logger.debug(f"  Saved rendered page image: {rendered_page_path}")
+    rendered_page_content = MessageContent(type=ContentType.IMAGE, image_base64=rendered_page_b64)
     
     # Calculate scale factors for coordinate conversion
     scale_x = rendered_page_width / pdf_page_width
     scale_y = rendered_page_height / pdf_page_height
     
+    def _save_pending() -> None:
+        """把最终的修正截图写入磁盘并加入路径列表"""
+        if pending_img is not None:
+            new_img_path, pix = pending_img
+            pix.save(str(new_img_path))
+            all_image_paths.append(str(new_img_path))
+            logger.info(f"  Saved corrected image: {new_img_path}")
+    
     for iteration in range(max_iterations):
         logger.info(f"  Iteration {iteration + 1}/{max_iterations}")
         
         try:
+            current_cropped_width, current_cropped_height = cropped_size
             
-            # Read and encode current cropped image as base64
-            current_img_path = all_image_paths[-1]
-            logger.debug(f"  Reading cropped image: {current_img_path}")
-            
-            with open(current_img_path, 'rb') as f:
-                cropped_image_data = f.read()
-                cropped_image_b64 = base64.b64encode(cropped_image_data).decode('utf-8')
-            
-            # Get current cropped image dimensions (may have changed after re-extraction)
-            with Image.open(current_img_path) as img:
-                current_cropped_width, current_cropped_height = img.size
-            
-            # Prepare prompt with dimension information
-            system_prompt = get_bbox_corrector_prompt(
+            # Prepare per-call context (system prompt is static)
+            context_text = get_bbox_corrector_context(
                 question_label=question_label,
                 current_bbox=current_bbox,
                 expected_description=expected_description,
@@ -213,25 +413,25 @@ async def correct_image_bbox(
             )
             
             # Prepare message content with rendered PDF page and cropped image
+            # 整页图片在各次迭代中不变，放在最前面使 system + 整页图片构成可缓存的公共前缀
             user_content = [
+                rendered_page_content,
                 MessageContent(
                     type=ContentType.TEXT,
-                    text=f"Here is the rendered PDF page image and the cropped image. "
+                    text=f"{context_text}\n\n"
+                         f"The image above is the rendered PDF page; the image below is the cropped image. "
                          f"The crop was taken from page {page_number} (0-based) using bbox {current_bbox} (PDF points). "
                          f"Please verify if the crop is correct and provide corrected coordinates in PDF points if needed."
                 ),
                 MessageContent(
                     type=ContentType.IMAGE,
-                    image_base64=rendered_page_b64
-                ),
-                MessageContent(
-                    type=ContentType.IMAGE,
-                    image_base64=cropped_image_b64
+                    image_bytes=cropped_image_bytes,  # 发送请求时才编码为 base64
+                    image_media_type=cropped_media_type
                 )
             ]
             
             messages = [
-                LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
+                _BBOX_SYSTEM_MESSAGE,
                 LLMMessage(role=MessageRole.USER, content=user_content)
             ]
             
@@ -248,23 +448,19 @@ async def correct_image_bbox(
                 logger.error(f"Empty response from bbox corrector API")
                 break
             
-            response_data = json.loads(response.content)
-            correction_result = BboxCorrectionOutput(**response_data)
+            # 一次完成 JSON 解析和校验（pydantic-core）
+            correction_result = BboxCorrectionOutput.model_validate_json(response.content)
             
             # Track usage
             if response.usage:
-                iter_usage = Usage()
-                iter_usage.requests = 1
-                iter_usage.input_tokens = response.usage.get("prompt_tokens", 0)
-                iter_usage.output_tokens = response.usage.get("completion_tokens", 0)
-                iter_usage.total_tokens = response.usage.get("total_tokens", 0)
-                total_usage.add(iter_usage)
+                total_usage.add(usage_from_response(response.usage))
             
             logger.info(f"  Correction result: is_correct={correction_result.is_correct}, confidence={correction_result.confidence}")
             logger.info(f"  Reasoning: {correction_result.reasoning}")
             
             if correction_result.is_correct:
                 logger.info(f"  ✓ Bbox verified as correct")
+                _save_pending()
                 return current_bbox, True, total_usage, all_image_paths
             
             # Need correction
@@ -275,43 +471,234 @@ async def correct_image_bbox(
             logger.info(f"  Issue: {correction_result.issue_description}")
             logger.info(f"  Suggested bbox: {correction_result.corrected_bbox}")
             
-            # Update bbox and re-extract from rendered page image
+            # Update bbox and re-extract directly from the PDF page
             current_bbox = correction_result.corrected_bbox
             
-            # Convert PDF points to pixel coordinates
-            x1, y1, x2, y2 = current_bbox
-            pixel_x1 = int(x1 * scale_x)
-            pixel_y1 = int(y1 * scale_y)
-            pixel_x2 = int(x2 * scale_x)
-            pixel_y2 = int(y2 * scale_y)
+            pix, cropped_image_bytes, cropped_media_type = _rasterize_crop(pdf_path, page_number, current_bbox, scale_x, scale_y)
+            cropped_size = (pix.width, pix.height)
             
-            # Ensure coordinates are within bounds
-            pixel_x1 = max(0, min(pixel_x1, rendered_page_width - 1))
-            pixel_y1 = max(0, min(pixel_y1, rendered_page_height - 1))
-            pixel_x2 = max(pixel_x1 + 1, min(pixel_x2, rendered_page_width))
-            pixel_y2 = max(pixel_y1 + 1, min(pixel_y2, rendered_page_height))
-            
-            # Crop from rendered page image
-            with Image.open(rendered_page_path) as rendered_img:
-                cropped_img = rendered_img.crop((pixel_x1, pixel_y1, pixel_x2, pixel_y2))
-                
-                # Save cropped image
-                prefix = f"{image_type}_image_corrected_iter{iteration + 1}"
-                new_img_filename = f"{prefix}_1.png"
-                new_img_path = output_dir / new_img_filename
-                cropped_img.save(str(new_img_path))
-                
-            all_image_paths.append(str(new_img_path))
-            logger.info(f"  Re-extracted image from rendered page with new bbox: {new_img_path}")
-            logger.info(f"    PDF bbox: {current_bbox} -> Pixel bbox: [{pixel_x1}, {pixel_y1}, {pixel_x2}, {pixel_y2}]")
+            new_img_filename = f"{original_stem}_corrected_iter{iteration + 1}.png"
+            pending_img = (output_dir / new_img_filename, pix)
+            logger.info(f"  Re-extracted image from PDF page with new bbox (iteration {iteration + 1})")
+            logger.info(f"    PDF bbox: {current_bbox} -> size: {pix.width}x{pix.height}")
             
         except Exception as e:
             logger.error(f"  Error in bbox correction iteration {iteration + 1}: {e}")
             break
     
     # Reached max iterations or error
+    _save_pending()
     logger.warning(f"  ⚠ Bbox correction completed with {len(all_image_paths)} attempts")
     logger.warning(f"  Final bbox: {current_bbox}")
     
     return current_bbox, False, total_usage, all_image_paths
 
+
+async def correct_image_bboxes_single_call(
+    pdf_path: str,
+    page_number: int,
+    items: List[Dict[str, Any]],
+    image_type: str = "question",
+    max_iterations: int = 4
+) -> List[Tuple[List[float], bool, Usage, List[str]]]:
+    """
+    用一次 LLM 调用同时验证并修正同一页上的多张截图
+    
+    每轮迭代把仍未确认的截图放进同一个请求（整页图片只发送一次），模型返回每张截图的结果；
+    需要修正的截图重新截取后进入下一轮。超过 _BBOX_BATCH_MAX_ITEMS 张时分组并发处理。
+    合并调用的响应不合法（解析失败、结果与截图对不上）时，剩余截图退回逐张调用 correct_image_bbox。
+    
+    Args:
+        pdf_path: PDF 文件路径
+        page_number: 页码（0-based）
+        items: 每项包含 question_label, original_bbox, cropped_image_path, expected_description
+        image_type: 图片类型（"question" 或 "answer"）
+        max_iterations: 最大迭代次数（默认 4）
+    
+    Returns:
+        与 items 顺序一致的 (最终bbox, 是否成功, 使用统计, 截取的图片路径) 列表；
+        合并调用的使用统计记在本组第一张截图上，其余为逐张退回调用的用量
+    """
+    if len(items) > _BBOX_BATCH_MAX_ITEMS:
+        groups = [items[i:i + _BBOX_BATCH_MAX_ITEMS] for i in range(0, len(items), _BBOX_BATCH_MAX_ITEMS)]
+        group_results = await asyncio.gather(*[
+            correct_image_bboxes_single_call(pdf_path, page_number, group, image_type, max_iterations)
+            for group in groups
+        ])
+        return [result for results in group_results for result in results]
+    if not items:
+        return []
+    
+    logger.info(f"🔍 Verifying {len(items)} {image_type} image bboxes on page {page_number} in one call")
+    
+    pdf_page_size = _get_page_size(pdf_path, page_number)  # 0-based
+    output_dir = Path(items[0]["cropped_image_path"]).parent
+    rendered_page_data = _load_rendered_page(pdf_path, page_number, output_dir, image_type)
+    rendered_page_size = (rendered_page_data['width'], rendered_page_data['height'])
+    rendered_page_content = MessageContent(type=ContentType.IMAGE, image_base64=rendered_page_data['image_base64'])
+    scale_x = rendered_page_size[0] / pdf_page_size[0]
+    scale_y = rendered_page_size[1] / pdf_page_size[1]
+    
+    # 每张截图的状态（截图只保存在内存中，最终结果返回前写入磁盘）
+    states = []
+    for item in items:
+        with open(item["cropped_image_path"], 'rb') as f:
+            image_bytes = f.read()
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            size = img.size
+        states.append({
+            "bbox": item["original_bbox"],
+            "image_bytes": image_bytes,
+            "media_type": "image/png",
+            "size": size,
+            "pending": None,
+            "paths": [item["cropped_image_path"]],
+            "done": False,
+            "ok": False,
+        })
+    
+    client = ClientManager.get_agent_client(model="gpt-5")
+    total_usage = Usage()
+    fallback_from_iteration = None
+    
+    for iteration in range(max_iterations):
+        active = [index for index, state in enumerate(states) if not state["done"]]
+        if not active:
+            break
+        logger.info(f"  Iteration {iteration + 1}/{max_iterations}: {len(active)} crops")
+        
+        user_content = [rendered_page_content]
+        for index in active:
+            item, state = items[index], states[index]
+            context_text = get_bbox_corrector_context(
+                question_label=item["question_label"],
+                current_bbox=state["bbox"],
+                expected_description=item["expected_description"],
+                image_type=image_type,
+                pdf_page_size=pdf_page_size,
+                rendered_page_size=rendered_page_size,
+                cropped_image_size=state["size"]
+            )
+            user_content.append(MessageContent(type=ContentType.TEXT, text=f"=== Item {index} ===\n{context_text}"))
+            user_content.append(MessageContent(
+                type=ContentType.IMAGE,
+                image_bytes=state["image_bytes"],
+                image_media_type=state["media_type"]
+            ))
+        user_content.append(MessageContent(type=ContentType.TEXT, text=_BBOX_BATCH_INSTRUCTIONS))
+        
+        try:
+            response = await client.aquery(
+                messages=[_BBOX_SYSTEM_MESSAGE, LLMMessage(role=MessageRole.USER, content=user_content)],
+                temperature=0.0,
+                max_tokens=1000 * len(active),
+                response_format={"type": "json_object"}
+            )
+            if response.usage:
+                total_usage.add(usage_from_response(response.usage))
+            batch_result = BboxBatchCorrectionOutput.model_validate_json(response.content or "")
+            results_by_index = {result.item_index: result for result in batch_result.results}
+            if set(results_by_index) != set(active):
+                raise ValueError(f"Expected results for items {active}, got {sorted(results_by_index)}")
+        except Exception as e:
+            logger.warning(f"  Combined bbox correction failed ({e}); falling back to per-image calls")
+            fallback_from_iteration = iteration
+            break
+        
+        for index in active:
+            result, state = results_by_index[index], states[index]
+            label = items[index]["question_label"]
+            logger.info(f"  [{label} #{index}] is_correct={result.is_correct}, confidence={result.confidence}")
+            if result.is_correct:
+                state["done"], state["ok"] = True, True
+                continue
+            if result.corrected_bbox is None:
+                logger.warning(f"  [{label} #{index}] LLM says crop is incorrect but provided no corrected bbox")
+                state["done"] = True
+                continue
+            try:
+                pix, image_bytes, media_type = _rasterize_crop(pdf_path, page_number, result.corrected_bbox, scale_x, scale_y)
+            except Exception as e:
+                logger.error(f"  [{label} #{index}] Error re-extracting crop: {e}")
+                state["done"] = True
+                continue
+            stem = Path(items[index]["cropped_image_path"]).stem
+            state.update(
+                bbox=result.corrected_bbox,
+                image_bytes=image_bytes,
+                media_type=media_type,
+                size=(pix.width, pix.height),
+                pending=(output_dir / f"{stem}_corrected_iter{iteration + 1}.png", pix),
+            )
+            logger.info(f"  [{label} #{index}] Suggested bbox: {result.corrected_bbox}")
+    
+    # 把最终的修正截图写入磁盘
+    for state in states:
+        if state["pending"] is not None:
+            new_img_path, pix = state["pending"]
+            pix.save(str(new_img_path))
+            state["paths"].append(str(new_img_path))
+    
+    results = [
+        (state["bbox"], state["ok"], total_usage if index == 0 else Usage(), state["paths"])
+        for index, state in enumerate(states)
+    ]
+    
+    if fallback_from_iteration is not None:
+        remaining = [index for index, state in enumerate(states) if not state["done"]]
+        fallback_results = await asyncio.gather(*[
+            correct_image_bbox(
+                question_label=items[index]["question_label"],
+                original_bbox=states[index]["bbox"],
+                cropped_image_path=states[index]["paths"][-1],
+                pdf_path=pdf_path,
+                page_number=page_number,
+                expected_description=items[index]["expected_description"],
+                image_type=image_type,
+                max_iterations=max_iterations - fallback_from_iteration
+            )
+            for index in remaining
+        ])
+        for index, (bbox, ok, usage, paths) in zip(remaining, fallback_results):
+            merged_usage = results[index][2]
+            merged_usage.add(usage)
+            results[index] = (bbox, ok, merged_usage, states[index]["paths"][:-1] + paths)
+    
+    return results
+
+
+async def correct_image_bboxes_batch(
+    requests: List[Dict[str, Any]],
+    max_concurrent: Optional[int] = None
+) -> List[Union[Tuple[List[float], bool, Usage, List[str]], BaseException]]:
+    """
+    批量并发修正图片 bbox
+    
+    所有调用方共用同一个 "bbox" Semaphore，同时进行的修正不超过
+    settings.bbox_max_concurrent。
+    
+    Args:
+        requests: 每项为 correct_image_bbox 的关键字参数 dict
+        max_concurrent: 最大并发数（默认 settings.bbox_max_concurrent，仅首次创建 Semaphore 时生效）
+    
+    Returns:
+        与 requests 顺序一致的结果列表；失败的任务返回对应异常
+    """
+    semaphore = get_shared_semaphore("bbox", max_concurrent or settings.bbox_max_concurrent)
+    
+    # 先并行渲染所有用到的页面（每份 PDF 一次），修正时直接读取
+    pages_by_pdf: Dict[str, set] = {}
+    for kwargs in requests:
+        pages_by_pdf.setdefault(kwargs["pdf_path"], set()).add(kwargs["page_number"])
+    try:
+        await asyncio.gather(*[
+            prerender_bbox_pages(pdf_path, sorted(pages)) for pdf_path, pages in pages_by_pdf.items()
+        ])
+    except Exception as e:
+        logger.warning(f"Page pre-rendering failed, rendering lazily instead: {e}")
+    
+    async def _run(kwargs: Dict[str, Any]):
+        async with semaphore:
+            return await correct_image_bbox(**kwargs)
+    
+    return await asyncio.gather(*[_run(kwargs) for kwargs in requests], return_exceptions=True)
@@ -2,79 +2,35 @@
 
 import json
 import time
-from typing import List, Optional, Tuple, TYPE_CHECKING
+import asyncio
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Union
 from loguru import logger
 from agents import Usage
 
-if TYPE_CHECKING:
-    from . import UsageWithDuration
+from ._usage import UsageWithDuration
 
 from ..config.settings import settings
 from ..models.schemas import QuestionLabelOutput, ImageInfo
 from ..clients.client_manager import ClientManager
 from ..clients.base import LLMMessage, MessageContent, MessageRole, ContentType
+from ..clients.rate_limiter import get_rate_limiter
+from ..utils.usage_tracker import usage_from_response
+from ..utils.label_parsing import extract_mark, salvage_truncated_json
+from ..utils.label_cache import label_cache_key, get_cached_label, put_cached_label
+from ..utils.concurrency import get_shared_semaphore
+from ..preprocessing.subtopic_fetcher import Subtopic, normalize_subtopics
 from ....management.topic_operations import get_all_subtopics
 
 
-def get_labelling_prompt(
-    question_index: int,
-    question_label: str,
-    question_latex: str,
-    answer_latex: Optional[str],
-    subtopics_list: List[dict],
-    existing_mark: Optional[int] = None
-) -> str:
-    """
-    生成题目标注的提示词
-    
-    Args:
-        question_index: 题目索引（顺序号）
-        question_label: 题目标签
-        question_latex: 题目 LaTeX 代码
-        answer_latex: 答案 LaTeX 代码（可选）
-        subtopics_list: 可用的 subtopic 列表
-        existing_mark: 已有的分数（可选）
-    
-    Returns:
-        Prompt string
-    """
-    # 构建 subtopic 选项列表
-    # 统一字段名处理：支持 topicid/topic_id 和 topicname/topic_name 两种格式
-    subtopics_text = "\n".join([
-        f"  {idx + 1}. Topic: {s.get('topic_name') or s.get('topicname', 'N/A')} (topic_id: {s.get('topicid') or s.get('topic_id', 'N/A')}) | "
-        f"Subtopic: {s.get('subtopic_name') or s.get('subtopicname', 'N/A')} (subtopic_id: {s.get('subtopicid') or s.get('subtopic_id', 'N/A')})"
-        for idx, s in enumerate(subtopics_list)
-    ])
-    
-    mark_instruction = ""
-    if existing_mark is not None:
-        mark_instruction = f"\n- **Mark**: The question already has a mark of {existing_mark}. Verify if this is correct based on the question content. If incorrect, extract the correct mark."
-    else:
-        mark_instruction = "\n- **Mark**: Extract the mark from the question (look for notations like [5], [8 marks], etc.). If not found, leave as null."
-    
-    answer_section = ""
-    if answer_latex:
-        answer_section = f"""
-=== Answer Content ===
-{answer_latex}
+# 标注使用的模型（也是标注缓存键的一部分）
+_LABELLING_MODEL = "gpt-5"
 
-**Note**: The answer content can help you understand the question better and determine its difficulty.
-"""
-    
-    return f"""You are a Question Labelling Agent. Your task is to analyze a question and label it with accurate metadata.
+# 提示词版本：修改标注提示词时递增，使旧的标注缓存失效
+_PROMPT_VERSION = "v3"
 
-=== Question Information ===
-Question Index: {question_index}
-Question Label: {question_label}
-
-=== Question Content ===
-{question_latex}
-{answer_section}
-=== Your Task ===
-
-You need to label this question with the following metadata:
-
-1. **Topic and Subtopic** (MOST IMPORTANT):
+# 单题与批量标注提示词共用的静态段落
+_LABELLING_METADATA_SECTION = """1. **Topic and Subtopic** (MOST IMPORTANT):
    - You MUST select the MOST ACCURATE subtopic from the provided list below
    - You CANNOT create new topics or subtopics - you MUST choose from the list
    - The subtopic_id is the MOST CRITICAL field - it must be accurate
@@ -94,40 +50,31 @@ You need to label this question with the following metadata:
      * Level of mathematical reasoning needed
    - Common values: "Easy", "Medium", "Hard", or specific difficulty levels
    - If uncertain, you can leave it as null
+"""
 
-4. **Mark** (OPTIONAL):{mark_instruction}
-
-=== Available Topics and Subtopics ===
-
-You MUST select from this list (DO NOT create new ones):
-
-{subtopics_text}
-
-**CRITICAL RULES**:
+_LABELLING_CRITICAL_RULES = """**CRITICAL RULES**:
 - You MUST select a subtopic_id from the list above
 - The subtopic_id is the MOST IMPORTANT field - accuracy is critical
 - If no subtopic matches perfectly, choose the CLOSEST match and explain in reasoning
 - Provide confidence score for your subtopic selection
 
-=== Output Format ===
+"""
 
-Return ONLY valid JSON (no markdown, no code blocks):
-{{
-    "question_index": {question_index},
-    "question_label": "{question_label}",
-    "topic_id": <integer>,
-    "subtopic_id": <integer>,
-    "question_type": "short answer" or "multiple choice",
-    "difficulty": "<string>" or null,
-    "mark": <integer> or null,
-    "confidence": <float between 0.0 and 1.0>,
-    "reasoning": "<detailed explanation of your decisions, especially for subtopic selection>"
-}}
+# 单题标注提示词中按条件插入的段落（模块加载时构建一次）
+_MARK_INSTRUCTION_VERIFY = "\n- **Mark**: The question already has a mark of {existing_mark}. Verify if this is correct based on the question content. If incorrect, extract the correct mark."
+_MARK_INSTRUCTION_EXTRACT = "\n- **Mark**: Extract the mark from the question (look for notations like [5], [8 marks], etc.). If not found, leave as null."
+_ANSWER_SECTION = """
+=== Answer Content ===
+{answer_latex}
+
+**Note**: The answer content can help you understand the question better and determine its difficulty.
+"""
 
-=== Examples ===
+# 单题标注的 few-shot 示例：默认不发送，只在低置信度重试时附加
+_LABELLING_EXAMPLES = """=== Examples ===
 
 Example 1 (Multiple Choice):
-{{
+{
     "question_index": 3,
     "question_label": "Question 3",
     "topic_id": 15,
@@ -137,10 +84,10 @@ Example 1 (Multiple Choice):
     "mark": 2,
     "confidence": 0.95,
     "reasoning": "This is a multiple choice question about derivatives. The subtopic 'Derivatives of Trigonometric Functions' (subtopic_id: 42) is the most accurate match. The question has 4 options (A, B, C, D) and asks to select the correct answer."
-}}
+}
 
 Example 2 (Short Answer):
-{{
+{
     "question_index": 10,
     "question_label": "10(a)",
     "topic_id": 12,
@@ -150,71 +97,279 @@ Example 2 (Short Answer):
     "mark": 5,
     "confidence": 0.88,
     "reasoning": "This is a short answer question about quadratic equations. The subtopic 'Solving Quadratic Equations' (subtopic_id: 28) matches well. The question requires students to show their working and write the answer. The difficulty is high because it involves completing the square method."
-}}
+}
 
-Now analyze the question and provide the labels.
 """
 
+# 批量标注时题目记录之间的分隔行（ASCII 哨兵，不会出现在正常的题目 LaTeX 中）
+_RECORD_SEPARATOR = "---RECORD|||SEP|||BOUNDARY---"
 
-async def label_question_direct(
+
+# 进程内 subtopic 缓存：(subject_id, grade_id) -> (格式化好的 subtopic 选项文本, 获取时间)；同一份试卷的所有题目共用
+_subtopics_cache: Dict[Tuple[int, int], Tuple[str, float]] = {}
+
+# 每个事件循环、每个 (subject_id, grade_id) 一把锁，并发的缓存未命中只查询一次
+_subtopics_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[int, int], asyncio.Lock]]" = weakref.WeakKeyDictionary()
+
+
+async def _get_subtopics_text_cached(subject_id: int, grade_id: int) -> str:
+    """
+    获取可用 subtopics 格式化后的选项文本（按 subject/grade 缓存 settings.subtopics_cache_ttl_seconds 秒）
+
+    列表只在取回时格式化一次，各题的提示词直接引用同一个字符串；没有 subtopic 时返回空串。
+    """
+    key = (subject_id, grade_id)
+    cached = _subtopics_cache.get(key)
+    if cached is not None and time.monotonic() - cached[1] < settings.subtopics_cache_ttl_seconds:
+        return cached[0]
+    
+    locks = _subtopics_locks.setdefault(asyncio.get_running_loop(), {})
+    async with locks.setdefault(key, asyncio.Lock()):
+        # 等锁期间其他协程可能已经取回
+        cached = _subtopics_cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < settings.subtopics_cache_ttl_seconds:
+            return cached[0]
+        
+        logger.info(f"[Label] 📋 Fetching available subtopics for subject_id={subject_id}, grade_id={grade_id}")
+        subtopics = await get_all_subtopics(subject_id=subject_id, grade_id=grade_id)
+        if not subtopics:
+            return ""
+        subtopics_text = _format_subtopics_text(normalize_subtopics(subtopics))
+        _subtopics_cache[key] = (subtopics_text, time.monotonic())
+        logger.info(f"[Label] ✓ Found {len(subtopics)} available subtopics")
+        return subtopics_text
+
+
+def _format_subtopics_text(subtopics_list: List[Subtopic]) -> str:
+    """把 subtopic 列表格式化为提示词中的 TSV 表（表头 + 每个 subtopic 一行，比逐行描述少一半左右的 token）"""
+    rows = [
+        f"{s.topic_id or 'N/A'}\t{s.topic_name or 'N/A'}\t{s.subtopic_id or 'N/A'}\t{s.subtopic_name or 'N/A'}"
+        for s in subtopics_list
+    ]
+    return "topic_id\ttopic\tsubtopic_id\tsubtopic\n" + "\n".join(rows)
+
+
+def get_labelling_prompt(
     question_index: int,
     question_label: str,
     question_latex: str,
-    answer_latex: Optional[str] = None,
-    question_images: Optional[List[ImageInfo]] = None,
-    subject_id: int = None,
-    grade_id: int = None,
-    existing_mark: Optional[int] = None
-) -> Tuple[QuestionLabelOutput, "UsageWithDuration"]:
+    answer_latex: Optional[str],
+    subtopics_text: str,
+    existing_mark: Optional[int] = None,
+    include_examples: bool = False
+) -> str:
     """
-    标注题目（直接 API 调用）
+    生成题目标注的提示词
     
     Args:
-        question_index: 题目索引（顺序号，1-based）
-        question_label: 题目标签（如 "10(a)", "Question 21"）
+        question_index: 题目索引（顺序号）
+        question_label: 题目标签
         question_latex: 题目 LaTeX 代码
         answer_latex: 答案 LaTeX 代码（可选）
-        question_images: 题目中的图片列表（可选）
-        subject_id: Subject ID（必需，用于获取可用的 subtopics）
-        grade_id: Grade ID（必需，用于获取可用的 subtopics）
-        existing_mark: 已有的分数（可选，如果已提取）
+        subtopics_text: 可用 subtopic 的选项文本（_format_subtopics_text 的结果）
+        existing_mark: 已有的分数（可选）
+        include_examples: 是否附加 few-shot 示例（低置信度重试时使用）
     
     Returns:
-        Tuple[QuestionLabelOutput, UsageWithDuration]: (标注输出, API使用统计含时间)
+        Prompt string
     """
-    from . import UsageWithDuration
-    
-    if subject_id is None or grade_id is None:
-        raise ValueError("subject_id and grade_id are required to get available subtopics")
-    
-    # 记录开始时间
-    start_time = time.time()
-    
-    # 获取可用的 subtopics
-    logger.info(f"[Label] 📋 Fetching available subtopics for subject_id={subject_id}, grade_id={grade_id}")
-    subtopics = await get_all_subtopics(
-        subject_id=subject_id,
-        grade_id=grade_id
-    )
-    
-    if not subtopics:
-        raise ValueError(f"No subtopics found for subject_id={subject_id}, grade_id={grade_id}")
+    if existing_mark is not None:
+        mark_instruction = _MARK_INSTRUCTION_VERIFY.format(existing_mark=existing_mark)
+    else:
+        mark_instruction = _MARK_INSTRUCTION_EXTRACT
+    answer_section = _ANSWER_SECTION.format(answer_latex=answer_latex) if answer_latex else ""
+    examples_section = _LABELLING_EXAMPLES if include_examples else ""
     
-    logger.info(f"[Label] ✓ Found {len(subtopics)} available subtopics")
+    return f"""You are a Question Labelling Agent. Your task is to analyze a question and label it with accurate metadata.
+
+=== Question Information ===
+Question Index: {question_index}
+Question Label: {question_label}
+
+=== Question Content ===
+{question_latex}
+{answer_section}
+=== Your Task ===
+
+You need to label this question with the following metadata:
+
+{_LABELLING_METADATA_SECTION}
+4. **Mark** (OPTIONAL):{mark_instruction}
+
+=== Available Topics and Subtopics ===
+
+You MUST select from this tab-separated list (DO NOT create new ones):
+
+{subtopics_text}
+
+{_LABELLING_CRITICAL_RULES}=== Output Format ===
+
+Return ONLY valid JSON (no markdown, no code blocks):
+{{
+    "question_index": {question_index},
+    "question_label": "{question_label}",
+    "topic_id": <integer>,
+    "subtopic_id": <integer>,
+    "question_type": "short answer" or "multiple choice",
+    "difficulty": "<string>" or null,
+    "mark": <integer> or null,
+    "confidence": <float between 0.0 and 1.0>,
+    "reasoning": "<detailed explanation of your decisions, especially for subtopic selection>"
+}}
+
+{examples_section}Now analyze the question and provide the labels.
+"""
+
+
+def get_labelling_batch_prompt(subtopics_text: str) -> str:
+    """
+    生成批量标注的 system 提示词（只依赖 subtopic 选项文本，同一 subject/grade 的各批次逐字节相同）
     
-    # 创建客户端
-    client = ClientManager.create_agent_client()
+    题目记录放在 user 消息中，以 _RECORD_SEPARATOR 分隔。
+    """
+    return f"""You are a Question Labelling Agent. Your task is to analyze SEVERAL questions and label EACH of them with accurate metadata.
+
+=== Input Format ===
+The user message contains several question records, each starting with the line:
+{_RECORD_SEPARATOR}
+Each record gives the Question Index, the Question Label, optionally an Existing Mark, the question content and optionally the answer content. Images (if any) follow the record they belong to.
+Label every record independently.
+
+=== Your Task ===
+
+You need to label EACH question with the following metadata:
+
+{_LABELLING_METADATA_SECTION}
+4. **Mark** (OPTIONAL):
+- **Mark**: If the record gives an Existing Mark, verify if it is correct based on the question content; if incorrect, extract the correct mark. Otherwise extract the mark from the question (look for notations like [5], [8 marks], etc.). If not found, leave as null.
+
+=== Available Topics and Subtopics ===
+
+You MUST select from this tab-separated list (DO NOT create new ones):
+
+{subtopics_text}
+
+{_LABELLING_CRITICAL_RULES}=== Output Format ===
+
+Return ONLY valid JSON (no markdown, no code blocks) with exactly one result per record, in record order:
+{{
+    "results": [
+        {{
+            "question_index": <the record's Question Index>,
+            "question_label": "<the record's Question Label>",
+            "topic_id": <integer>,
+            "subtopic_id": <integer>,
+            "question_type": "short answer" or "multiple choice",
+            "difficulty": "<string>" or null,
+            "mark": <integer> or null,
+            "confidence": <float between 0.0 and 1.0>,
+            "reasoning": "<detailed explanation of your decisions, especially for subtopic selection>"
+        }}
+    ]
+}}
+"""
+
+
+def _format_question_record(question: Dict[str, Any]) -> str:
+    """格式化批量标注中的单条题目记录（以分隔行开头）"""
+    lines = [
+        _RECORD_SEPARATOR,
+        f"Question Index: {question['question_index']}",
+        f"Question Label: {question['question_label']}",
+    ]
+    if question.get("existing_mark") is not None:
+        lines.append(f"Existing Mark: {question['existing_mark']}")
+    lines += ["", "=== Question Content ===", question["question_latex"]]
+    if question.get("answer_latex"):
+        lines += ["", "=== Answer Content ===", question["answer_latex"]]
+    return "\n".join(lines)
+
+
+def _build_label_output(
+    response_data: dict,
+    question_index: int,
+    question_label: str,
+    existing_mark: Optional[int]
+) -> QuestionLabelOutput:
+    """
+    把模型返回的 JSON dict 转换为 QuestionLabelOutput（修正非法的 question_type）
     
-    logger.info(f"[Label] 🏷️  Labelling question {question_label}")
+    question_index / question_label 始终取自输入记录，不信任模型回显的值。
+    """
+    # 验证 question_type
+    question_type = (response_data.get("question_type") or "").lower()
+    if question_type not in ["short answer", "multiple choice"]:
+        logger.warning(f"[Label] ⚠️  Invalid question_type: {question_type}, defaulting to 'short answer'")
+        question_type = "short answer"
     
+    # 构造输出对象
+    return QuestionLabelOutput(
+        question_index=question_index,
+        question_label=question_label,
+        topic_id=response_data.get("topic_id"),
+        subtopic_id=response_data.get("subtopic_id"),
+        question_type=question_type,
+        difficulty=response_data.get("difficulty"),
+        mark=response_data.get("mark", existing_mark),
+        confidence=response_data.get("confidence"),
+        reasoning=response_data.get("reasoning", "")
+    )
+
+
+def _with_extracted_mark(question: Dict[str, Any]) -> Dict[str, Any]:
+    """没有已知分数的题目先用正则提取分数（question 字段与 label_question_direct 参数同名）"""
+    if question.get("existing_mark") is not None:
+        return question
+    mark = extract_mark(question["question_latex"])
+    return question if mark is None else {**question, "existing_mark": mark}
+
+
+def _label_cache_key(question: Dict[str, Any], subtopics_text: str) -> str:
+    """题目的标注缓存键（question 字段与 label_question_direct 参数同名）"""
+    return label_cache_key(
+        question["question_latex"],
+        question.get("answer_latex"),
+        subtopics_text,
+        _LABELLING_MODEL,
+        _PROMPT_VERSION,
+        existing_mark=question.get("existing_mark"),
+        images_base64=[
+            img.image_base64 for img in question.get("question_images") or []
+            if getattr(img, 'image_base64', None)
+        ]
+    )
+
+
+async def _get_cached_label_output(question: Dict[str, Any], cache_key: str) -> Optional[QuestionLabelOutput]:
+    """读取缓存的标注结果，题号与标签换成当前题目的"""
+    cached = await get_cached_label(cache_key)
+    if cached is None:
+        return None
+    cached.update(question_index=question["question_index"], question_label=question["question_label"])
+    logger.info("[Label] ✓ Cache hit for {}", question["question_label"])
+    return QuestionLabelOutput.model_validate(cached)
+
+
+def _build_label_messages(
+    question_index: int,
+    question_label: str,
+    question_latex: str,
+    answer_latex: Optional[str],
+    question_images: Optional[List[ImageInfo]],
+    subtopics_text: str,
+    existing_mark: Optional[int],
+    include_examples: bool = False
+) -> List[LLMMessage]:
+    """构建单题标注的消息（实时调用与 Batch API 共用）"""
     # 构建 prompt
     system_prompt = get_labelling_prompt(
         question_index=question_index,
         question_label=question_label,
         question_latex=question_latex,
         answer_latex=answer_latex,
-        subtopics_list=subtopics,
-        existing_mark=existing_mark
+        subtopics_text=subtopics_text,
+        existing_mark=existing_mark,
+        include_examples=include_examples
     )
     
     # 构建用户消息
@@ -237,17 +392,45 @@ async def label_question_direct(
                     )
                 )
     
-    messages = [
+    return [
         LLMMessage(role=MessageRole.SYSTEM, content=system_prompt),
         LLMMessage(role=MessageRole.USER, content=user_content)
     ]
-    
+
+
+# 截断的响应必须已经包含的字段（只允许缺少最后输出的 reasoning）；difficulty 和 mark 允许为 null
+_SALVAGE_REQUIRED_FIELDS = ("topic_id", "subtopic_id", "question_type", "difficulty", "mark", "confidence")
+_SALVAGE_NON_NULL_FIELDS = ("topic_id", "subtopic_id", "question_type", "confidence")
+
+
+def _is_complete_label(data: dict) -> bool:
+    """截断响应中恢复出的字段是否足以作为标注结果（除 reasoning 外的字段都已输出）"""
+    return (
+        all(field in data for field in _SALVAGE_REQUIRED_FIELDS)
+        and all(data[field] is not None for field in _SALVAGE_NON_NULL_FIELDS)
+        and str(data["question_type"]).lower() in ("short answer", "multiple choice")
+    )
+
+
+async def _query_label(
+    client,
+    messages: List[LLMMessage],
+    question_index: int,
+    question_label: str,
+    existing_mark: Optional[int]
+) -> Tuple[QuestionLabelOutput, Usage]:
+    """发送单题标注请求并解析结果（响应被截断或 JSON 无效时加大 max_tokens 重试）"""
     # 调用 API（带重试机制）
     max_retries = 2
     current_max_tokens = 3000
     
+    limiter = get_rate_limiter()
+    # 预估输入 token：prompt 按 4 字符/token 估算
+    estimated_input_tokens = len(messages[0].content) // 4
+    
     for retry in range(max_retries):
         try:
+            await limiter.acquire(estimated_input_tokens + current_max_tokens)
             response = await client.aquery(
                 messages=messages,
                 temperature=0.0,
@@ -275,53 +458,23 @@ async def label_question_direct(
             
             # 解析响应
             response_data = json.loads(response.content)
-            
-            # 验证 question_type
-            question_type = response_data.get("question_type", "").lower()
-            if question_type not in ["short answer", "multiple choice"]:
-                logger.warning(f"[Label] ⚠️  Invalid question_type: {question_type}, defaulting to 'short answer'")
-                question_type = "short answer"
-            
-            # 构造输出对象
-            label_output = QuestionLabelOutput(
-                question_index=response_data.get("question_index", question_index),
-                question_label=response_data.get("question_label", question_label),
-                topic_id=response_data.get("topic_id"),
-                subtopic_id=response_data.get("subtopic_id"),
-                question_type=question_type,
-                difficulty=response_data.get("difficulty"),
-                mark=response_data.get("mark", existing_mark),
-                confidence=response_data.get("confidence"),
-                reasoning=response_data.get("reasoning", "")
-            )
-            
-            # 手动构造 Usage 对象
-            usage = Usage()
-            if response.usage:
-                usage.requests = 1
-                usage.input_tokens = response.usage.get("prompt_tokens", 0)
-                usage.output_tokens = response.usage.get("completion_tokens", 0)
-                usage.total_tokens = response.usage.get("total_tokens", 0)
-            
-            # 计算耗时
-            duration = time.time() - start_time
-            
-            # 输出日志
-            logger.info(f"[Label] ✓ Labelled question {question_index}: {question_label}")
-            logger.info(f"[Label]    Topic ID: {label_output.topic_id}, Subtopic ID: {label_output.subtopic_id}")
-            logger.info(f"[Label]    Type: {label_output.question_type}, Difficulty: {label_output.difficulty}")
-            logger.info(f"[Label]    Mark: {label_output.mark}, Confidence: {label_output.confidence}")
-            logger.info(f"[Label]    Duration: {duration:.2f}s")
-            logger.info(f"[Label]    API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
-            
-            # 返回带时间的 usage
-            usage_with_duration = UsageWithDuration(usage=usage, duration_seconds=duration)
-            return label_output, usage_with_duration
+            label_output = _build_label_output(response_data, question_index, question_label, existing_mark)
+            return label_output, usage_from_response(response.usage)
             
         except json.JSONDecodeError as e:
             logger.error(f"[Label] Failed to parse JSON (attempt {retry + 1}/{max_retries}): {e}")
             logger.error(f"[Label] Response: {response.content[:500] if response.content else '(empty)'}")
             
+            # 输出因长度限制被截断、且除 reasoning 外的字段都已完整时直接采用，不再重试
+            partial_data = salvage_truncated_json(response.content) if response.finish_reason == 'length' else None
+            if partial_data and _is_complete_label(partial_data):
+                logger.warning(
+                    "[Label] Using truncated response for {} (fields: {})",
+                    question_label, ", ".join(partial_data)
+                )
+                label_output = _build_label_output(partial_data, question_index, question_label, existing_mark)
+                return label_output, usage_from_response(response.usage)
+            
             # 如果还有重试机会
             if retry < max_retries - 1:
                 current_max_tokens = int(current_max_tokens * 1.5)
@@ -333,3 +486,373 @@ async def label_question_direct(
             logger.error(f"[Label] ❌ Failed to label question {question_label}: {e}")
             raise
 
+
+async def label_question_direct(
+    question_index: int,
+    question_label: str,
+    question_latex: str,
+    answer_latex: Optional[str] = None,
+    question_images: Optional[List[ImageInfo]] = None,
+    subject_id: int = None,
+    grade_id: int = None,
+    existing_mark: Optional[int] = None
+) -> Tuple[QuestionLabelOutput, UsageWithDuration]:
+    """
+    标注题目（直接 API 调用）
+    
+    Args:
+        question_index: 题目索引（顺序号，1-based）
+        question_label: 题目标签（如 "10(a)", "Question 21"）
+        question_latex: 题目 LaTeX 代码
+        answer_latex: 答案 LaTeX 代码（可选）
+        question_images: 题目中的图片列表（可选）
+        subject_id: Subject ID（必需，用于获取可用的 subtopics）
+        grade_id: Grade ID（必需，用于获取可用的 subtopics）
+        existing_mark: 已有的分数（可选，如果已提取）
+    
+    Returns:
+        Tuple[QuestionLabelOutput, UsageWithDuration]: (标注输出, API使用统计含时间)
+    """
+    if subject_id is None or grade_id is None:
+        raise ValueError("subject_id and grade_id are required to get available subtopics")
+    
+    # 记录开始时间
+    start_time = time.perf_counter()
+    
+    # 题目中明确标了分数时直接用，模型只需核对
+    if existing_mark is None:
+        existing_mark = extract_mark(question_latex)
+    
+    # 获取可用的 subtopics（同一 subject/grade 的题目共用缓存）
+    subtopics_text = await _get_subtopics_text_cached(subject_id, grade_id)
+    
+    if not subtopics_text:
+        raise ValueError(f"No subtopics found for subject_id={subject_id}, grade_id={grade_id}")
+    
+    # 相同题目（重跑、不同试卷中的重复题目）直接复用缓存的标注
+    cache_key = _label_cache_key(
+        {
+            "question_latex": question_latex,
+            "answer_latex": answer_latex,
+            "question_images": question_images,
+            "existing_mark": existing_mark
+        },
+        subtopics_text
+    )
+    cached = await _get_cached_label_output(
+        {"question_index": question_index, "question_label": question_label}, cache_key
+    )
+    if cached is not None:
+        return cached, UsageWithDuration(usage=Usage(), duration_seconds=time.perf_counter() - start_time)
+    
+    # 创建客户端
+    client = ClientManager.get_agent_client(_LABELLING_MODEL)
+    
+    logger.info(f"[Label] 🏷️  Labelling question {question_label}")
+    
+    label_output, usage = await _query_label(
+        client,
+        _build_label_messages(
+            question_index, question_label, question_latex, answer_latex,
+            question_images, subtopics_text, existing_mark
+        ),
+        question_index, question_label, existing_mark
+    )
+    
+    # 精简提示词的结果置信度偏低时，带上示例重新标注一次，取置信度较高的结果
+    if label_output.confidence is not None and label_output.confidence < settings.labelling_examples_retry_confidence:
+        logger.info(
+            "[Label] Low confidence {} for {}; retrying with examples",
+            label_output.confidence, question_label
+        )
+        try:
+            retry_output, retry_usage = await _query_label(
+                client,
+                _build_label_messages(
+                    question_index, question_label, question_latex, answer_latex,
+                    question_images, subtopics_text, existing_mark, include_examples=True
+                ),
+                question_index, question_label, existing_mark
+            )
+            usage.add(retry_usage)
+            if (retry_output.confidence or 0.0) >= label_output.confidence:
+                label_output = retry_output
+        except Exception as e:
+            logger.warning(f"[Label] Retry with examples failed for {question_label}: {e}")
+    
+    await put_cached_label(cache_key, label_output.model_dump())
+    
+    # 计算耗时
+    duration = time.perf_counter() - start_time
+    
+    # 输出日志
+    logger.info(f"[Label] ✓ Labelled question {question_index}: {question_label}")
+    logger.info(f"[Label]    Topic ID: {label_output.topic_id}, Subtopic ID: {label_output.subtopic_id}")
+    logger.info(f"[Label]    Type: {label_output.question_type}, Difficulty: {label_output.difficulty}")
+    logger.info(f"[Label]    Mark: {label_output.mark}, Confidence: {label_output.confidence}")
+    logger.info(f"[Label]    Duration: {duration:.2f}s")
+    logger.info(f"[Label]    API Usage: {usage.input_tokens} input + {usage.output_tokens} output = {usage.total_tokens} tokens")
+    
+    # 返回带时间的 usage
+    return label_output, UsageWithDuration(usage=usage, duration_seconds=duration)
+
+
+async def label_questions_batch(
+    questions: List[Dict[str, Any]],
+    subject_id: int,
+    grade_id: int,
+    minibatch_size: Optional[int] = None
+) -> List[Tuple[QuestionLabelOutput, UsageWithDuration]]:
+    """
+    批量标注题目：每个小批次一次 API 调用，subtopic 列表和任务说明只发送一次
+    
+    各小批次并发执行；某个小批次的响应无法解析、或结果与题目对不上时，
+    该批次退回逐题调用 label_question_direct。
+    
+    Args:
+        questions: 每项包含 question_index, question_label, question_latex，
+            可选 answer_latex, question_images, existing_mark（与 label_question_direct 参数同名）
+        subject_id: Subject ID
+        grade_id: Grade ID
+        minibatch_size: 每次调用的题目数（默认 settings.labelling_batch_size）
+    
+    Returns:
+        与 questions 顺序一致的 (标注输出, API使用统计含时间) 列表；
+        小批次调用的用量记在该批第一道题上，其余为 0（耗时均为整批耗时）
+    
+    settings.labelling_mode == "batch" 时改走 label_questions_via_batch（OpenAI Batch API）。
+    已有缓存的题目直接返回缓存结果，不参与调用。
+    """
+    if subject_id is None or grade_id is None:
+        raise ValueError("subject_id and grade_id are required to get available subtopics")
+    if not questions:
+        return []
+    
+    start_time = time.perf_counter()
+    subtopics_text = await _get_subtopics_text_cached(subject_id, grade_id)
+    if not subtopics_text:
+        raise ValueError(f"No subtopics found for subject_id={subject_id}, grade_id={grade_id}")
+    questions = [_with_extracted_mark(question) for question in questions]
+    
+    cache_keys = [_label_cache_key(question, subtopics_text) for question in questions]
+    cached_outputs = await asyncio.gather(*[
+        _get_cached_label_output(question, cache_key) for question, cache_key in zip(questions, cache_keys)
+    ])
+    pending = [i for i, cached in enumerate(cached_outputs) if cached is None]
+    if len(pending) < len(questions):
+        cache_usage = UsageWithDuration(usage=Usage(), duration_seconds=time.perf_counter() - start_time)
+        labelled = await label_questions_batch(
+            [questions[i] for i in pending], subject_id, grade_id, minibatch_size
+        ) if pending else []
+        results = [(cached, cache_usage) for cached in cached_outputs]
+        for i, result in zip(pending, labelled):
+            results[i] = result
+        return results
+    
+    if settings.labelling_mode == "batch":
+        return await label_questions_via_batch(questions, subject_id, grade_id)
+    
+    system_message = LLMMessage(role=MessageRole.SYSTEM, content=get_labelling_batch_prompt(subtopics_text))
+    client = ClientManager.get_agent_client(_LABELLING_MODEL)
+    size = max(1, minibatch_size or settings.labelling_batch_size)
+    minibatches = [questions[i:i + size] for i in range(0, len(questions), size)]
+    
+    async def _label_single(question: Dict[str, Any]) -> Tuple[QuestionLabelOutput, UsageWithDuration]:
+        return await label_question_direct(
+            question_index=question["question_index"],
+            question_label=question["question_label"],
+            question_latex=question["question_latex"],
+            answer_latex=question.get("answer_latex"),
+            question_images=question.get("question_images"),
+            subject_id=subject_id,
+            grade_id=grade_id,
+            existing_mark=question.get("existing_mark")
+        )
+    
+    async def _label_minibatch(batch: List[Dict[str, Any]], batch_cache_keys: List[str]) -> List[Tuple[QuestionLabelOutput, UsageWithDuration]]:
+        start_time = time.perf_counter()
+        expected_indices = [question["question_index"] for question in batch]
+        
+        user_content = []
+        for question in batch:
+            user_content.append(MessageContent(type=ContentType.TEXT, text=_format_question_record(question)))
+            for img in question.get("question_images") or []:
+                if getattr(img, 'image_base64', None):
+                    user_content.append(MessageContent(type=ContentType.IMAGE, image_base64=img.image_base64))
+        
+        try:
+            estimated_input_tokens = (len(system_message.content) + sum(len(c.text or "") for c in user_content)) // 4
+            await get_rate_limiter().acquire(estimated_input_tokens + 1500 * len(batch))
+            response = await client.aquery(
+                messages=[system_message, LLMMessage(role=MessageRole.USER, content=user_content)],
+                temperature=0.0,
+                max_tokens=1500 * len(batch),
+                response_format={"type": "json_object"}
+            )
+            results = json.loads(response.content or "").get("results")
+            if not isinstance(results, list) or len(results) != len(batch):
+                raise ValueError(f"expected {len(batch)} results, got {len(results) if isinstance(results, list) else 'none'}")
+            if len(set(expected_indices)) == len(batch):
+                results_by_index = {item.get("question_index"): item for item in results if isinstance(item, dict)}
+                if set(results_by_index) != set(expected_indices):
+                    raise ValueError(f"returned question indices {sorted(results_by_index, key=str)} do not match {expected_indices}")
+                ordered = [results_by_index[index] for index in expected_indices]
+            else:
+                # 输入的题目索引本身重复，无法按索引对应，只能按记录顺序对应
+                ordered = results
+            label_outputs = [
+                _build_label_output(item, question["question_index"], question["question_label"], question.get("existing_mark"))
+                for item, question in zip(ordered, batch)
+            ]
+        except Exception as e:
+            logger.warning(f"[Label] Batched labelling of {len(batch)} questions failed ({e}); falling back to per-question calls")
+            return list(await asyncio.gather(*[_label_single(question) for question in batch]))
+        
+        await asyncio.gather(*[
+            put_cached_label(cache_key, label_output.model_dump())
+            for cache_key, label_output in zip(batch_cache_keys, label_outputs)
+        ])
+        duration = time.perf_counter() - start_time
+        usage = usage_from_response(response.usage)
+        logger.info(
+            "[Label] ✓ Labelled {} questions in one call: {:.2f}s, {} tokens",
+            len(batch), duration, usage.total_tokens
+        )
+        return [
+            (label_output, UsageWithDuration(usage=usage if i == 0 else Usage(), duration_seconds=duration))
+            for i, label_output in enumerate(label_outputs)
+        ]
+    
+    batch_results = await asyncio.gather(*[
+        _label_minibatch(batch, cache_keys[i:i + size]) for batch, i in zip(minibatches, range(0, len(questions), size))
+    ])
+    return [result for results in batch_results for result in results]
+
+
+async def label_questions_concurrent(
+    questions: List[Dict[str, Any]],
+    subject_id: int,
+    grade_id: int,
+    max_concurrent: Optional[int] = None
+) -> List[Union[Tuple[QuestionLabelOutput, UsageWithDuration], BaseException]]:
+    """
+    并发逐题标注（每题一次 label_question_direct 调用）
+    
+    所有调用方共用同一个 "labelling" Semaphore，总并发不超过
+    settings.labelling_max_concurrent；请求速率另由共享限流器控制。
+    
+    Args:
+        questions: 与 label_questions_batch 相同
+        subject_id: Subject ID
+        grade_id: Grade ID
+        max_concurrent: 最大并发数（默认 settings.labelling_max_concurrent，仅首次创建 Semaphore 时生效）
+    
+    Returns:
+        与 questions 顺序一致的结果列表；失败的题目返回对应异常
+    """
+    semaphore = get_shared_semaphore("labelling", max_concurrent or settings.labelling_max_concurrent)
+    
+    async def _run(question: Dict[str, Any]):
+        async with semaphore:
+            return await label_question_direct(
+                question_index=question["question_index"],
+                question_label=question["question_label"],
+                question_latex=question["question_latex"],
+                answer_latex=question.get("answer_latex"),
+                question_images=question.get("question_images"),
+                subject_id=subject_id,
+                grade_id=grade_id,
+                existing_mark=question.get("existing_mark")
+            )
+    
+    return await asyncio.gather(*[_run(question) for question in questions], return_exceptions=True)
+
+
+async def label_questions_via_batch(
+    questions: List[Dict[str, Any]],
+    subject_id: int,
+    grade_id: int,
+    poll_interval: Optional[float] = None
+) -> List[Tuple[QuestionLabelOutput, UsageWithDuration]]:
+    """
+    通过 OpenAI Batch API 标注题目（价格为实时调用的一半，但可能要等待较久）
+    
+    每道题的请求与 label_question_direct 完全相同，写成一个 JSONL 一次提交；
+    缺失或无法解析的结果退回实时的 label_question_direct。
+    
+    Args:
+        questions: 与 label_questions_batch 相同
+        subject_id: Subject ID
+        grade_id: Grade ID
+        poll_interval: 轮询间隔秒数（默认 settings.labelling_batch_poll_seconds）
+    
+    Returns:
+        与 questions 顺序一致的 (标注输出, API使用统计含时间) 列表（耗时为整批等待时间）
+    """
+    if subject_id is None or grade_id is None:
+        raise ValueError("subject_id and grade_id are required to get available subtopics")
+    if not questions:
+        return []
+    
+    start_time = time.perf_counter()
+    subtopics_text = await _get_subtopics_text_cached(subject_id, grade_id)
+    if not subtopics_text:
+        raise ValueError(f"No subtopics found for subject_id={subject_id}, grade_id={grade_id}")
+    questions = [_with_extracted_mark(question) for question in questions]
+    
+    # custom_id 带上位置，避免 question_index 重复时冲突
+    custom_ids = [f"q-{i}-{question['question_index']}" for i, question in enumerate(questions)]
+    requests = {
+        custom_id: _build_label_messages(
+            question["question_index"], question["question_label"], question["question_latex"],
+            question.get("answer_latex"), question.get("question_images"), subtopics_text,
+            question.get("existing_mark")
+        )
+        for custom_id, question in zip(custom_ids, questions)
+    }
+    
+    client = ClientManager.create_batch_client(_LABELLING_MODEL)
+    logger.info(f"[Label] 📦 Submitting {len(requests)} labelling requests via Batch API")
+    try:
+        responses = await client.abatch_query(
+            requests,
+            temperature=0.0,
+            max_tokens=3000,
+            poll_interval=poll_interval or settings.labelling_batch_poll_seconds,
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        logger.warning(f"[Label] Batch API labelling failed ({e}); falling back to realtime calls")
+        responses = {}
+    duration = time.perf_counter() - start_time
+    
+    async def _label(custom_id: str, question: Dict[str, Any]) -> Tuple[QuestionLabelOutput, UsageWithDuration]:
+        response = responses.get(custom_id)
+        if response is not None and response.content:
+            try:
+                label_output = _build_label_output(
+                    json.loads(response.content), question["question_index"],
+                    question["question_label"], question.get("existing_mark")
+                )
+                await put_cached_label(_label_cache_key(question, subtopics_text), label_output.model_dump())
+                return label_output, UsageWithDuration(usage=usage_from_response(response.usage), duration_seconds=duration)
+            except (ValueError, AttributeError) as e:
+                # ValueError 同时覆盖 JSONDecodeError 和 pydantic ValidationError（如 topic_id 为 null、confidence 越界）
+                logger.warning(f"[Label] Failed to parse batch result for {question['question_label']}: {e}")
+        return await label_question_direct(
+            question_index=question["question_index"],
+            question_label=question["question_label"],
+            question_latex=question["question_latex"],
+            answer_latex=question.get("answer_latex"),
+            question_images=question.get("question_images"),
+            subject_id=subject_id,
+            grade_id=grade_id,
+            existing_mark=question.get("existing_mark")
+        )
+    
+    results = await asyncio.gather(*[_label(custom_id, question) for custom_id, question in zip(custom_ids, questions)])
+    logger.info(
+        "[Label] ✓ Batch API labelled {}/{} questions in {:.2f}s",
+        sum(1 for custom_id in custom_ids if custom_id in responses), len(questions), duration
+    )
+    return list(results)
@@ -10,56 +10,46 @@ Workflow Order:
 5. Labelling Agent - Labels questions with topic, subtopic, type, difficulty, and mark
 """
 
-from dataclasses import dataclass
-from agents import Usage
-
-
-@dataclass
-class UsageWithDuration:
-    """Usage statistics with execution duration"""
-    usage: Usage
-    duration_seconds: float
-    
-    @property
-    def requests(self):
-        return self.usage.requests
-    
-    @property
-    def input_tokens(self):
-        return self.usage.input_tokens
-    
-    @property
-    def output_tokens(self):
-        return self.usage.output_tokens
-    
-    @property
-    def total_tokens(self):
-        return self.usage.total_tokens
-
-
-from ._0_classifier_agent import classify_exam_type_direct
+from ._usage import UsageWithDuration
+from ._0_classifier_agent import classify_exam_type_direct, classify_exam_types_direct
 from ._1_question_lister_agent import (
     list_all_questions_with_pages_direct,
     annotate_paper_pages,
     annotate_solution_pages,
 )
-from ._2_question_latex_agent import generate_question_latex_direct
-from ._3_answer_latex_agent import generate_answer_latex_direct
-from ._3dot5_concurrent_latex_agent import generate_question_and_answer_latex_concurrent
-from ._4_image_bbox_corrector_agent import correct_image_bbox
-from ._5_labelling_agent import label_question_direct
+from ._2_question_latex_agent import generate_question_latex_direct, generate_question_latex_batch
+from ._3_answer_latex_agent import generate_answer_latex_direct, generate_answer_latex_batch
+from ._3dot5_concurrent_latex_agent import generate_question_and_answer_latex_concurrent, generate_qa_latex_direct
+from ._4_image_bbox_corrector_agent import (
+    correct_image_bbox,
+    correct_image_bboxes_batch,
+    correct_image_bboxes_single_call,
+    prerender_bbox_pages,
+)
+from ._5_labelling_agent import extract_mark, label_question_direct, label_questions_batch, label_questions_concurrent, label_questions_via_batch
 
 
 __all__ = [
     "UsageWithDuration",
     "classify_exam_type_direct",
+    "classify_exam_types_direct",
     "list_all_questions_with_pages_direct",
     "annotate_paper_pages",
     "annotate_solution_pages",
     "generate_question_latex_direct",
+    "generate_question_latex_batch",
     "generate_answer_latex_direct",
+    "generate_answer_latex_batch",
     "generate_question_and_answer_latex_concurrent",
+    "generate_qa_latex_direct",
     "correct_image_bbox",
+    "correct_image_bboxes_batch",
+    "correct_image_bboxes_single_call",
+    "prerender_bbox_pages",
     "label_question_direct",
+    "extract_mark",
+    "label_questions_batch",
+    "label_questions_concurrent",
+    "label_questions_via_batch",
 ]
 
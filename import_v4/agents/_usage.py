@@ -0,0 +1,29 @@
+"""Usage statistics with execution duration (leaf module shared by all agents)"""
+
+from dataclasses import dataclass
+from typing import Optional
+from agents import Usage
+
+
+@dataclass
+class UsageWithDuration:
+    """Usage statistics with execution duration"""
+    usage: Usage
+    duration_seconds: float
+    time_to_first_token_seconds: Optional[float] = None  # 流式调用时首个 token 的到达时间
+    
+    @property
+    def requests(self):
+        return self.usage.requests
+    
+    @property
+    def input_tokens(self):
+        return self.usage.input_tokens
+    
+    @property
+    def output_tokens(self):
+        return self.usage.output_tokens
+    
+    @property
+    def total_tokens(self):
+        return self.usage.total_tokens
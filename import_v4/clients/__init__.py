@@ -11,6 +11,7 @@ from .openai_client import OpenAIClient
 from .google_client import GoogleClient
 from .xai_client import XaiClient
 from .client_manager import ClientManager
+from .rate_limiter import RateLimiter, get_rate_limiter
 
 __all__ = [
     # Base classes and models
@@ -36,4 +37,8 @@ __all__ = [
 
     # Client manager
     "ClientManager",
+
+    # Rate limiting
+    "RateLimiter",
+    "get_rate_limiter",
 ]
\ No newline at end of file
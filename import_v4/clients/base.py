@@ -2,6 +2,7 @@
 LLM客户端基础架构
 复用自 marking_v2，扩展 Function Calling 支持
 """
+import base64
 import logging
 import threading
 from abc import ABC, abstractmethod
@@ -32,7 +33,16 @@ class MessageContent(BaseModel):
     text: Optional[str] = None
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
+    image_bytes: Optional[bytes] = None  # 原始图片字节（与 image_base64 二选一，发送请求时才编码为 base64）
     file_id: Optional[str] = None  # ⭐ 新增：文件ID（用于file_reference）
+    image_media_type: str = "image/png"  # image_base64 / image_bytes 的 MIME 类型
+    detail: Optional[Literal["low", "high", "auto"]] = None  # Vision 图片精度（仅 OpenAI 支持）
+
+    def get_image_base64(self) -> Optional[str]:
+        """图片的 base64 文本（只提供 image_bytes 时在构建请求时编码）"""
+        if self.image_base64 is None and self.image_bytes is not None:
+            return base64.b64encode(self.image_bytes).decode("ascii")
+        return self.image_base64
 
 
 class LLMMessage(BaseModel):
@@ -87,6 +97,8 @@ class LLMClientConfig(BaseModel):
     max_retries: int = 3
     retry_delay: float = 1.0
     extra_headers: Optional[Dict[str, str]] = None
+    max_connections: int = 100  # HTTP 连接池上限
+    max_keepalive_connections: int = 100  # 保持复用的空闲连接数
 
 
 class BaseModelClient(ABC):
@@ -214,6 +226,51 @@ class BaseModelClient(ABC):
         """
         pass
 
+    async def astream_query(
+        self,
+        messages: List[LLMMessage],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        **kwargs: Any
+    ) -> LLMResponse:
+        """
+        Query the model with a streamed response, assembling content as chunks arrive.
+        Clients without streaming support fall back to aquery().
+        """
+        return await self.aquery(messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+    async def astream_query_with_fallback(
+        self,
+        messages: List[LLMMessage],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        **kwargs: Any
+    ) -> LLMResponse:
+        """
+        Streamed query that falls back to a buffered aquery() when the stream itself fails
+        (e.g. a proxy without server-sent event support). Rate-limit and auth errors are re-raised.
+        """
+        try:
+            return await self.astream_query(messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        except (RateLimitError, AuthenticationError):
+            raise
+        except LLMClientError as e:
+            self.logger.warning(f"{self.model_name} 流式调用失败，回退到非流式: {str(e)}")
+            return await self.aquery(messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+    async def aquery_direct(
+        self,
+        messages: List[LLMMessage],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        **kwargs: Any
+    ) -> LLMResponse:
+        """
+        Query the model over a raw HTTP fast path when the client provides one.
+        Clients without a dedicated fast path fall back to aquery().
+        """
+        return await self.aquery(messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
     async def call_with_image(
         self,
         text_prompt: str,
@@ -2,11 +2,18 @@
 Client Manager for import_v2
 简化版本，专注于 import_v2 的需求
 """
-from typing import Optional
+import asyncio
+import weakref
+from typing import Dict, Optional
 from .openai_client import OpenAIClient
 from .google_client import GoogleClient
 from .xai_client import XaiClient
-from .base import BaseModelClient
+from .base import BaseModelClient, LLMClientConfig
+from ..config.settings import settings
+
+
+# 每个事件循环按模型名复用的 Agent 客户端（底层 httpx 连接池绑定在事件循环上）
+_shared_agent_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, BaseModelClient]]" = weakref.WeakKeyDictionary()
 
 
 class ClientManager:
@@ -37,6 +44,37 @@ class ClientManager:
         """
         return OpenAIClient(model_name=model)
 
+    @classmethod
+    def get_agent_client(cls, model: str = "gpt-5") -> BaseModelClient:
+        """
+        获取共享的主Agent客户端
+        同一事件循环内按模型复用一个客户端，所有调用共用连接池（避免每次调用重新建立 TCP/TLS 连接）
+
+        连接池大小：settings.http_pool_size
+        """
+        loop = asyncio.get_running_loop()
+        clients = _shared_agent_clients.setdefault(loop, {})
+        client = clients.get(model)
+        if client is None:
+            config = LLMClientConfig(
+                max_connections=settings.http_pool_size,
+                max_keepalive_connections=settings.http_pool_size
+            )
+            client = OpenAIClient(model_name=model, config=config)
+            clients[model] = client
+        return client
+
+    @classmethod
+    def create_batch_client(cls, model: str = "gpt-5") -> OpenAIClient:
+        """
+        创建 Batch API 客户端
+        用于不要求实时返回的批量请求（OpenAIClient.abatch_query）
+
+        模型：GPT-5
+        场景：后处理阶段的批量标注（价格为实时调用的一半）
+        """
+        return OpenAIClient(model_name=model)
+
     @classmethod
     def create_metadata_client(cls) -> BaseModelClient:
         """
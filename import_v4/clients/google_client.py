@@ -79,8 +79,8 @@ class GoogleClient(BaseModelClient):
                     elif item.type == ContentType.IMAGE:
                         parts.append({
                             "inline_data": {
-                                "mime_type": "image/png",
-                                "data": item.image_base64
+                                "mime_type": item.image_media_type,
+                                "data": item.get_image_base64()
                             }
                         })
                     elif item.type == ContentType.IMAGE_URL:
@@ -3,13 +3,15 @@ OpenAI Client 实现
 复用自 marking_v2，扩展 Function Calling 支持
 """
 import asyncio
+import json
 import os
 import time
 import logging
 from typing import List, Union, Dict, Any, Iterator, AsyncIterator, Optional, Sequence
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import httpx
 import openai
-from openai import OpenAI, AsyncOpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
 
 # 禁用httpx的HTTP请求日志
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -60,7 +62,15 @@ class OpenAIClient(BaseModelClient):
             client_kwargs["base_url"] = self.config.api_base
 
         self.client = OpenAI(**client_kwargs)
-        self.async_client = AsyncOpenAI(**client_kwargs)
+        # 异步客户端使用可复用的连接池（默认池过小会限制并发吞吐）
+        # SDK 调用和 aquery_direct 共享同一个连接池
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections
+            )
+        )
+        self.async_client = AsyncOpenAI(**client_kwargs, http_client=self.http_client)
 
     def _convert_to_openai_format(self, messages: List[LLMMessage]) -> List[Dict[str, Any]]:
         """Convert LLMMessage objects to OpenAI API format."""
@@ -97,9 +107,12 @@ class OpenAIClient(BaseModelClient):
                     "image_url": {"url": item.image_url}
                 })
             elif item.type == ContentType.IMAGE:
+                image_url = {"url": f"data:{item.image_media_type};base64,{item.get_image_base64()}"}
+                if item.detail:
+                    image_url["detail"] = item.detail
                 formatted_content.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{item.image_base64}"}
+                    "image_url": image_url
                 })
             elif item.type == ContentType.FILE:
                 # ⭐ 新增：文件引用
@@ -131,7 +144,8 @@ class OpenAIClient(BaseModelClient):
                 "arguments": message.function_call.arguments
             }
 
-        return LLMResponse(
+        # 字段均来自 API 响应、类型已确定，跳过 pydantic 校验
+        return LLMResponse.model_construct(
             content=message.content,
             usage=usage,
             model=openai_response.model,
@@ -143,20 +157,50 @@ class OpenAIClient(BaseModelClient):
             }
         )
 
-    async def aquery(
+    def _create_response_from_dict(self, response_data: Dict[str, Any]) -> LLMResponse:
+        """Convert a raw chat-completion JSON body to LLMResponse (used by aquery_direct)."""
+        choice = response_data["choices"][0]
+        message = choice["message"]
+
+        usage = None
+        usage_data = response_data.get("usage")
+        if usage_data:
+            usage = {
+                "prompt_tokens": usage_data.get("prompt_tokens", 0),
+                "completion_tokens": usage_data.get("completion_tokens", 0),
+                "total_tokens": usage_data.get("total_tokens", 0)
+            }
+
+        function_call = None
+        if message.get("function_call"):
+            function_call = {
+                "name": message["function_call"].get("name"),
+                "arguments": message["function_call"].get("arguments")
+            }
+
+        # 字段均来自 API 响应、类型已确定，跳过 pydantic 校验
+        return LLMResponse.model_construct(
+            content=message.get("content"),
+            usage=usage,
+            model=response_data.get("model", self.model_name),
+            finish_reason=choice.get("finish_reason"),
+            function_call=function_call,
+            metadata={
+                "created": response_data.get("created"),
+                "system_fingerprint": response_data.get("system_fingerprint")
+            }
+        )
+
+    def _build_params(
         self,
         messages: List[LLMMessage],
-        temperature: float = 0.0,
-        max_tokens: Optional[int] = None,
-        functions: Optional[List[Dict]] = None,  # ⭐ 新增
-        function_call: Optional[Union[str, Dict]] = "auto",  # ⭐ 新增
+        temperature: float,
+        max_tokens: Optional[int],
+        functions: Optional[List[Dict]],
+        function_call: Optional[Union[str, Dict]],
         **kwargs: Any
-    ) -> LLMResponse:
-        """
-        Asynchronous query to OpenAI with Function Calling support.
-
-        ⭐ 扩展：支持 functions 和 function_call 参数
-        """
+    ) -> Dict[str, Any]:
+        """Build chat-completion request parameters shared by aquery and aquery_direct."""
         openai_messages = self._convert_to_openai_format(messages)
 
         params = {
@@ -186,6 +230,24 @@ class OpenAIClient(BaseModelClient):
             params["functions"] = functions
             params["function_call"] = function_call
 
+        return params
+
+    async def aquery(
+        self,
+        messages: List[LLMMessage],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        functions: Optional[List[Dict]] = None,  # ⭐ 新增
+        function_call: Optional[Union[str, Dict]] = "auto",  # ⭐ 新增
+        **kwargs: Any
+    ) -> LLMResponse:
+        """
+        Asynchronous query to OpenAI with Function Calling support.
+
+        ⭐ 扩展：支持 functions 和 function_call 参数
+        """
+        params = self._build_params(messages, temperature, max_tokens, functions, function_call, **kwargs)
+
         try:
             response = await self.async_client.chat.completions.create(**params)
             llm_response = self._create_response(response)
@@ -200,6 +262,184 @@ class OpenAIClient(BaseModelClient):
         except Exception as e:
             raise self.format_error(e)
 
+    async def astream_query(
+        self,
+        messages: List[LLMMessage],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        functions: Optional[List[Dict]] = None,
+        function_call: Optional[Union[str, Dict]] = "auto",
+        **kwargs: Any
+    ) -> LLMResponse:
+        """
+        Streamed query: content deltas are collected while the body is still
+        downloading, so receive and assembly overlap instead of running back to back.
+        metadata["time_to_first_token"] records seconds until the first content delta.
+        """
+        params = self._build_params(messages, temperature, max_tokens, functions, function_call, **kwargs)
+        params["stream"] = True
+        params["stream_options"] = {"include_usage": True}
+
+        start_time = time.perf_counter()
+        time_to_first_token = None
+        content_parts = []
+        finish_reason = None
+        model = self.model_name
+        usage = None
+
+        try:
+            stream = await self.async_client.chat.completions.create(**params)
+            async for chunk in stream:
+                model = chunk.model or model
+                if chunk.usage:
+                    usage = {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens,
+                        "total_tokens": chunk.usage.total_tokens
+                    }
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start_time
+                    content_parts.append(choice.delta.content)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        except Exception as e:
+            raise self.format_error(e)
+
+        # 字段均来自 API 响应、类型已确定，跳过 pydantic 校验
+        llm_response = LLMResponse.model_construct(
+            content="".join(content_parts) or None,
+            usage=usage,
+            model=model,
+            finish_reason=finish_reason,
+            metadata={"time_to_first_token": time_to_first_token}
+        )
+
+        # Update metrics
+        if llm_response.usage:
+            cost = self.calculate_cost(llm_response.usage)
+            self.update_metrics(llm_response.usage["total_tokens"], cost)
+
+        return llm_response
+
+    async def aquery_direct(
+        self,
+        messages: List[LLMMessage],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        functions: Optional[List[Dict]] = None,
+        function_call: Optional[Union[str, Dict]] = "auto",
+        **kwargs: Any
+    ) -> LLMResponse:
+        """
+        POST /chat/completions directly over the shared httpx pool, skipping the
+        SDK's request/response model layers (same approach as XaiClient).
+        """
+        params = self._build_params(messages, temperature, max_tokens, functions, function_call, **kwargs)
+        url = f"{str(self.async_client.base_url).rstrip('/')}/chat/completions"
+        headers = {"Authorization": f"Bearer {self.async_client.api_key}"}
+
+        try:
+            response = await self.http_client.post(url, json=params, headers=headers, timeout=self.config.timeout)
+            response.raise_for_status()
+            llm_response = self._create_response_from_dict(response.json())
+
+            # Update metrics
+            if llm_response.usage:
+                cost = self.calculate_cost(llm_response.usage)
+                self.update_metrics(llm_response.usage["total_tokens"], cost)
+
+            return llm_response
+
+        except Exception as e:
+            raise self.format_error(e)
+
+    async def abatch_query(
+        self,
+        requests: Dict[str, List[LLMMessage]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+        **kwargs: Any
+    ) -> Dict[str, LLMResponse]:
+        """
+        通过 OpenAI Batch API（/v1/batches）提交一组 chat completion 请求并等待结果
+
+        价格为实时调用的一半，适合不要求低延迟的后处理步骤。请求写成 JSONL 上传，
+        每隔 poll_interval 秒查询一次状态，完成后按 custom_id 返回结果；
+        单个请求失败时该 custom_id 不出现在结果中，由调用方决定如何补救。
+
+        Args:
+            requests: custom_id -> messages
+            temperature, max_tokens, **kwargs: 与 aquery 相同，作用于每个请求
+            poll_interval: 轮询间隔（秒）
+            completion_window: Batch 完成时限（目前只支持 "24h"）
+
+        Returns:
+            custom_id -> LLMResponse
+        """
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._build_params(messages, temperature, max_tokens, None, None, **kwargs)
+            }, ensure_ascii=False)
+            for custom_id, messages in requests.items()
+        ]
+        batch_input = ("\n".join(lines) + "\n").encode("utf-8")
+
+        input_file = None
+        batch = None
+        try:
+            input_file = await self.async_client.files.create(file=("batch_input.jsonl", batch_input), purpose="batch")
+            batch = await self.async_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window=completion_window
+            )
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(poll_interval)
+                batch = await self.async_client.batches.retrieve(batch.id)
+
+            if batch.status != "completed" or not batch.output_file_id:
+                raise LLMClientError(f"Batch {batch.id} ended with status {batch.status}")
+
+            output = await self.async_client.files.content(batch.output_file_id)
+            responses: Dict[str, LLMResponse] = {}
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                llm_response = self._create_response_from_dict(response["body"])
+                responses[record["custom_id"]] = llm_response
+                # Batch API 按实时价格的一半计费
+                if llm_response.usage:
+                    self.update_metrics(llm_response.usage["total_tokens"], self.calculate_cost(llm_response.usage) / 2)
+            return responses
+
+        except LLMClientError:
+            raise
+        except Exception as e:
+            raise self.format_error(e)
+        finally:
+            # 输入 / 输出文件只用于本次 batch，尽力删除
+            file_ids = [input_file.id if input_file else None]
+            if batch is not None:
+                file_ids += [batch.output_file_id, batch.error_file_id]
+            for file_id in filter(None, file_ids):
+                try:
+                    await self.async_client.files.delete(file_id)
+                except Exception:
+                    pass
+
     def calculate_cost(self, usage: Dict[str, int]) -> float:
         """Calculate cost based on OpenAI pricing."""
         model_key = self.model_name.lower()
@@ -230,6 +470,17 @@ class OpenAIClient(BaseModelClient):
             return InvalidRequestError(str(error))
         elif isinstance(error, openai.NotFoundError):
             return ModelNotAvailableError(str(error))
+        elif isinstance(error, httpx.HTTPStatusError):
+            status_code = error.response.status_code
+            if status_code == 429:
+                return RateLimitError(str(error))
+            elif status_code == 401:
+                return AuthenticationError(str(error))
+            elif status_code == 400:
+                return InvalidRequestError(str(error))
+            elif status_code == 404:
+                return ModelNotAvailableError(str(error))
+            return super().format_error(error)
         else:
             return super().format_error(error)
 
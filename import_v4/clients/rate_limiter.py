@@ -0,0 +1,89 @@
+"""
+Preemptive rate limiter for LLM fan-out
+按 RPM / TPM 预算在发送请求前排队，而不是等到 429 再退避重试
+"""
+import asyncio
+import time
+import weakref
+from typing import Optional
+
+from ..config.settings import settings
+
+
+class RateLimiter:
+    """
+    请求数 + token 数双令牌桶
+
+    两个桶都按分钟额度连续回填；acquire() 在预算不足时按需等待，
+    等待者按到达顺序依次放行。额度为 0 表示不限制。
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._request_budget = min(
+                float(self.requests_per_minute),
+                self._request_budget + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self._token_budget = min(
+                float(self.tokens_per_minute),
+                self._token_budget + elapsed * self.tokens_per_minute / 60
+            )
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """
+        为一次请求预留预算（不足时等待）
+
+        Args:
+            estimated_tokens: 预估的输入 + 输出 token 数（超过 TPM 时按 TPM 计）
+        """
+        if not self.enabled:
+            return
+
+        tokens = min(estimated_tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._request_budget < 1:
+                    wait = (1 - self._request_budget) * 60 / self.requests_per_minute
+                if self.tokens_per_minute and self._token_budget < tokens:
+                    wait = max(wait, (tokens - self._token_budget) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            if self.requests_per_minute:
+                self._request_budget -= 1
+            if self.tokens_per_minute:
+                self._token_budget -= tokens
+
+
+# 每个事件循环一个限流器（asyncio.Lock 绑定在事件循环上）
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, RateLimiter]" = weakref.WeakKeyDictionary()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取当前事件循环的限流器（额度取自 settings.llm_requests_per_minute / llm_tokens_per_minute）"""
+    loop = asyncio.get_running_loop()
+    limiter: Optional[RateLimiter] = _limiters.get(loop)
+    if limiter is None:
+        limiter = RateLimiter(settings.llm_requests_per_minute, settings.llm_tokens_per_minute)
+        _limiters[loop] = limiter
+    return limiter
@@ -16,19 +16,63 @@ class Settings(BaseSettings):
     max_turns_per_question: int = 15
     max_latex_fix_attempts: int = 2
     
+    # HTTP 连接池配置
+    http_pool_size: int = 256  # 共享 Agent 客户端的最大连接数 / 保持复用的空闲连接数（应不小于并发 LLM 请求数）
+    
+    # LLM 限流配置（发送前按预算排队，避免触发 429；0 表示不限制，按账号 tier 配置）
+    llm_requests_per_minute: int = 0
+    llm_tokens_per_minute: int = 0
+    
     # 文件上传配置
     file_upload_purpose: str = "assistants"
     auto_cleanup_files: bool = False  # 是否自动清理上传的文件
+    reuse_uploaded_files: bool = True  # 同一进程内相同内容的带标记 PDF 复用已上传的 file_id（进程退出时统一删除）
     
     # 分类器配置
     classifier_max_turns: int = 5
     classification_sample_pages: int = 3  # 用于分类的页面数量（取倒数第2、4、6页，或最后3页）
+    classifier_image_max_edge: int = 1024  # 分类图片最长边（像素），超过则缩小
+    classifier_image_quality: int = 75  # 分类图片 JPEG 压缩质量
+    classifier_cache_enabled: bool = True  # 是否缓存分类结果（相同页面图片 + 相同提示词版本直接复用）
+    classifier_cache_dir: str = "~/.cache/pdf2latex/classifier"  # 分类结果缓存目录（每个缓存键一个 JSON 文件）
+    classifier_concurrency: int = 16  # 批量分类时的最大并发请求数
+    classifier_stagger_ms: int = 150  # 批量分类时相邻请求的启动间隔（毫秒），错开图片上传与推理阶段
+    fast_classify_parse: bool = False  # 分类结果可从响应中直接识别时跳过 JSON 解析（不记录 reasoning）
     
     # PDF 渲染配置
     pdf_render_quality: str = "medium"  # low (1.0x), medium (1.5x), high (2.0x)
+    marked_pdf_cache_dir: str = "~/.cache/pdf2latex/marked_pdfs"  # 带页码标记 PDF 的缓存目录（按源文件 SHA-256 命名）
     
     # Lister配置
     lister_max_turns: int = 10
+    annotation_chunk_size: int = 40  # 页码标注每次 LLM 调用最多包含的题目数（过多会触及 max_tokens 被截断）
+    annotation_concurrency: int = 6  # 页码标注分批调用的最大并发数
+    
+    # LaTeX 生成配置
+    latex_max_concurrent: int = 16  # question / answer LaTeX 生成共享的最大并发 LLM 请求数
+    latex_cache_enabled: bool = True  # 是否缓存 LaTeX 生成结果（相同文件 + 题目 + 提示词版本直接复用）
+    latex_cache_dir: str = "~/.cache/pdf2latex/latex"  # LaTeX 生成结果缓存目录
+    latex_cache_force_refresh: bool = False  # 忽略已有缓存重新生成（仍会写入新结果）
+    combined_qa_latex: bool = False  # 每道题用一次 LLM 调用同时生成 question + answer LaTeX（减少一半请求数）
+    latex_stream_responses: bool = True  # 流式接收 LaTeX 响应（边生成边接收，失败时自动回退到非流式）
+    latex_max_output_tokens: int = 32000  # LaTeX 生成重试时 max_tokens 的上限（达到上限仍被截断则不再重试）
+    
+    # 图片 bbox 修正配置
+    bbox_max_concurrent: int = 4  # 批量修正图片 bbox 时的最大并发数（每张图片会迭代多次调用 LLM）
+    bbox_page_max_edge: int = 1536  # 发给 LLM 的整页图片最长边（像素），超过则降低渲染倍率（0 表示不限制）
+    bbox_save_rendered_page: bool = False  # 是否把发给 LLM 的整页图片保存到图片目录（仅用于调试查看）
+    bbox_crop_jpeg_quality: int = 85  # 修正迭代中发给 LLM 的截图 JPEG 质量（0 表示使用无损 PNG；保存到磁盘的最终截图始终为 PNG）
+    
+    # Labelling 配置
+    subtopics_cache_ttl_seconds: int = 600  # subtopic 列表在进程内的缓存时间（秒），同一份试卷的题目共用
+    labelling_batch_size: int = 8  # 批量标注时每次 LLM 调用包含的题目数
+    labelling_max_concurrent: int = 16  # 逐题并发标注时的最大并发数
+    labelling_examples_retry_confidence: float = 0.7  # 单题标注置信度低于该值时带上 few-shot 示例重试一次（0 表示不重试）
+    labelling_mode: str = "realtime"  # "realtime"：实时调用；"batch"：走 OpenAI Batch API（半价，可能需要等待较久）
+    labelling_batch_poll_seconds: int = 30  # Batch API 状态轮询间隔（秒）
+    label_cache_enabled: bool = True  # 是否缓存标注结果（相同题目 + 答案 + subtopic 列表 + 模型直接复用）
+    label_cache_dir: str = "~/.cache/pdf2latex/labels"  # 标注结果缓存目录
+    labelling_min_question_chars: int = 20  # 题目没有图片且 LaTeX 少于该字符数时跳过 labelling（0 表示只跳过空 LaTeX）
     
     # 输出配置
     output_dir: str = "output"
@@ -3,6 +3,8 @@
 from .schemas import (
     ImageInfo,
     BboxCorrectionOutput,
+    BboxCorrectionItem,
+    BboxBatchCorrectionOutput,
     ExamTypeOutput,
     QuestionItem,
     QuestionList,
@@ -12,11 +14,14 @@ from .schemas import (
     ProcessedExam,
     QuestionLatexOutput,
     AnswerLatexOutput,
+    QALatexOutput,
 )
 
 __all__ = [
     "ImageInfo",
     "BboxCorrectionOutput",
+    "BboxCorrectionItem",
+    "BboxBatchCorrectionOutput",
     "ExamTypeOutput",
     "QuestionItem",
     "QuestionList",
@@ -26,5 +31,6 @@ __all__ = [
     "ProcessedExam",
     "QuestionLatexOutput",
     "AnswerLatexOutput",
+    "QALatexOutput",
 ]
 
@@ -27,6 +27,18 @@ class BboxCorrectionOutput(BaseModel):
     reasoning: str = Field(..., description="Reasoning for decision")
 
 
+class BboxCorrectionItem(BboxCorrectionOutput):
+    """多图合并修正中单张截图的修正结果"""
+    item_index: int = Field(..., description="Index of the item this result belongs to")
+
+
+class BboxBatchCorrectionOutput(BaseModel):
+    """多图合并修正输出（一次调用校验同一页的多张截图）"""
+    model_config = ConfigDict(extra="forbid")
+    
+    results: List[BboxCorrectionItem] = Field(..., description="One result per item")
+
+
 # ============ 分类器输出 ============
 
 class ExamTypeOutput(BaseModel):
@@ -174,6 +186,14 @@ class AnswerLatexOutput(BaseModel):
     error_message: Optional[str] = Field(None, description="Error if compilation failed")
 
 
+class QALatexOutput(BaseModel):
+    """题目 + 答案 LaTeX 合并生成输出（单次 LLM 调用）"""
+    model_config = ConfigDict(extra="forbid")
+    
+    question: QuestionLatexOutput = Field(..., description="Question LaTeX output")
+    answer: AnswerLatexOutput = Field(..., description="Answer LaTeX output")
+
+
 # ============ Labelling Agent 输出 ============
 
 class QuestionLabelOutput(BaseModel):
@@ -1,11 +1,16 @@
 """Preprocessing module"""
 
-from .pdf_renderer import preprocess_for_classification, add_page_markers_to_pdf
-from .subtopic_fetcher import get_subtopics_by_subject_grade
+from .pdf_renderer import preprocess_for_classification, add_page_markers_to_pdf, add_page_markers_cached, render_pages_parallel, file_sha256
+from .subtopic_fetcher import get_subtopics_by_subject_grade, Subtopic, normalize_subtopics
 
 __all__ = [
     "preprocess_for_classification",
     "add_page_markers_to_pdf",
-    "get_subtopics_by_subject_grade"
+    "add_page_markers_cached",
+    "render_pages_parallel",
+    "file_sha256",
+    "get_subtopics_by_subject_grade",
+    "Subtopic",
+    "normalize_subtopics"
 ]
 
@@ -2,6 +2,11 @@
 
 import fitz  # PyMuPDF
 import base64
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger
@@ -87,6 +92,84 @@ class PDFRenderer:
         return base_tokens + (total_tiles * tokens_per_tile)
 
 
+def fit_render_scale(width: float, height: float, scale: float, max_edge: int = 0) -> float:
+    """
+    按最长边上限调整渲染倍率
+    
+    Args:
+        width, height: 页面尺寸（PDF points）
+        scale: 原始渲染倍率
+        max_edge: 渲染结果最长边上限（像素），<= 0 表示不限制
+    """
+    longest_edge = max(width, height) * scale
+    if 0 < max_edge < longest_edge:
+        return scale * max_edge / longest_edge
+    return scale
+
+
+def _render_pages_worker(pdf_path: str, page_numbers: List[int], scale: float, max_edge: int) -> List[Dict]:
+    """在子进程中渲染一组页面（1-based 页码；每个进程只打开一次 PDF）"""
+    doc = fitz.open(pdf_path)
+    try:
+        results = []
+        for page_num in page_numbers:
+            page = doc[page_num - 1]
+            page_scale = fit_render_scale(page.rect.width, page.rect.height, scale, max_edge)
+            pix = page.get_pixmap(matrix=fitz.Matrix(page_scale, page_scale))
+            img_bytes = pix.tobytes("png")
+            results.append({
+                "page_number": page_num,
+                "image_base64": base64.b64encode(img_bytes).decode('utf-8'),
+                "estimated_tokens": PDFRenderer._estimate_vision_tokens(pix.width, pix.height),
+                "file_size_kb": len(img_bytes) / 1024,
+                "width": pix.width,
+                "height": pix.height
+            })
+        return results
+    finally:
+        doc.close()
+
+
+def render_pages_parallel(
+    pdf_path: str,
+    page_numbers: List[int],
+    quality: str = None,
+    max_edge: int = 0
+) -> Dict[int, Dict]:
+    """
+    多进程并行渲染多个页面
+    
+    页面按进程数交错分组（每个进程打开一次 PDF），结果以 base64 字符串返回，
+    不在进程间传递 PIL 图片。只有一个页面（或单核）时直接在当前进程渲染。
+    
+    Args:
+        pdf_path: Path to PDF file
+        page_numbers: Page numbers (1-based)
+        quality: low / medium / high（默认 settings.pdf_render_quality）
+        max_edge: 渲染结果最长边上限（像素），<= 0 表示不限制
+    
+    Returns:
+        页码 -> 与 PDFRenderer.render_page 相同结构的 dict
+    """
+    pages = sorted(set(page_numbers))
+    if not pages:
+        return {}
+    
+    scale = PDFRenderer(quality).scale
+    max_workers = min(os.cpu_count() or 1, len(pages), 8)
+    if max_workers <= 1:
+        results = _render_pages_worker(pdf_path, pages, scale, max_edge)
+    else:
+        chunks = [pages[i::max_workers] for i in range(max_workers)]
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for chunk_results in pool.map(_render_pages_worker, repeat(pdf_path), chunks, repeat(scale), repeat(max_edge)):
+                results.extend(chunk_results)
+    
+    logger.debug(f"Rendered {len(results)} pages of {pdf_path} with {max_workers} worker(s)")
+    return {result["page_number"]: result for result in results}
+
+
 async def preprocess_for_classification(paper_pdf_path: str) -> Dict:
     """
     轻量级预处理：渲染指定页面用于分类
@@ -177,8 +260,6 @@ def add_page_markers_to_pdf(input_pdf_path: str, output_pdf_path: str, zero_base
     Returns:
         Path to output PDF
     """
-    import tempfile
-    
     logger.info(f"Adding page markers to PDF: {input_pdf_path}")
     logger.info(f"  Using {'0-based' if zero_based else '1-based'} indexing")
     
@@ -217,6 +298,54 @@ def add_page_markers_to_pdf(input_pdf_path: str, output_pdf_path: str, zero_base
     return output_pdf_path
 
 
+def file_sha256(path: str) -> str:
+    """计算文件内容的 SHA-256（Python 3.11+ 使用 hashlib.file_digest）"""
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        hasher = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+def add_page_markers_cached(input_pdf_path: str, zero_based: bool = True) -> str:
+    """
+    Add page markers with a persistent cache keyed by the source PDF content.
+    
+    The marked PDF is stored in settings.marked_pdf_cache_dir; repeated runs on
+    the same PDF reuse it instead of re-rendering every page.
+    
+    Args:
+        input_pdf_path: Path to input PDF
+        zero_based: If True, use 0-based indexing (0, 1, 2...); otherwise 1-based
+    
+    Returns:
+        Path to the cached PDF with markers
+    """
+    digest = file_sha256(input_pdf_path)
+    cache_dir = Path(settings.marked_pdf_cache_dir).expanduser()
+    cached_path = cache_dir / f"marked_{'0' if zero_based else '1'}_{digest}.pdf"
+    
+    if cached_path.exists():
+        logger.info(f"Using cached marked PDF for {input_pdf_path}: {cached_path}")
+        return str(cached_path)
+    
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    # 先写唯一的临时文件再原子替换：并发写入同一条目（如试卷和答案是同一个 PDF）互不干扰，也不会读到写了一半的 PDF
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=f"{cached_path.stem}.", suffix=".tmp.pdf")
+    os.close(fd)
+    try:
+        add_page_markers_to_pdf(input_pdf_path, tmp_path, zero_based=zero_based)
+        os.replace(tmp_path, cached_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    
+    return str(cached_path)
+
+
 def _generate_page_marker_image(page_index: int, output_path: Path):
     """Generate a page marker image with page index."""
     from PIL import Image, ImageDraw, ImageFont
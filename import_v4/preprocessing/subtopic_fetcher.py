@@ -1,11 +1,36 @@
 """Subtopic fetcher for preprocessing module"""
 
-from typing import Dict, Any, List
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional
 from loguru import logger
 
 from ....management.topic_operations import get_all_subtopics
 
 
+@dataclass(frozen=True, slots=True)
+class Subtopic:
+    """统一字段名后的 subtopic 记录"""
+    topic_id: Optional[int]
+    topic_name: Optional[str]
+    subtopic_id: Optional[int]
+    subtopic_name: Optional[str]
+    
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Subtopic":
+        """从数据库记录构造（支持 topicid/topic_id 和 topicname/topic_name 两种字段名）"""
+        return cls(
+            topic_id=record.get("topicid") or record.get("topic_id"),
+            topic_name=record.get("topic_name") or record.get("topicname"),
+            subtopic_id=record.get("subtopicid") or record.get("subtopic_id"),
+            subtopic_name=record.get("subtopic_name") or record.get("subtopicname")
+        )
+
+
+def normalize_subtopics(records: List[Dict[str, Any]]) -> List[Subtopic]:
+    """把 get_all_subtopics 返回的记录统一转换为 Subtopic（只在取回时转换一次）"""
+    return [Subtopic.from_record(record) for record in records]
+
+
 async def get_subtopics_by_subject_grade(
     subject_id: int,
     grade_id: int
@@ -28,15 +53,7 @@ async def get_subtopics_by_subject_grade(
     )
     
     # 返回简化的列表，包含 topic_id, topic_name, subtopic_id 和 subtopic_name
-    result = [
-        {
-            "topic_id": s.get("topicid") or s.get("topic_id"),
-            "topic_name": s.get("topic_name") or s.get("topicname"),
-            "subtopic_id": s.get("subtopicid") or s.get("subtopic_id"),
-            "subtopic_name": s.get("subtopic_name") or s.get("subtopicname")
-        }
-        for s in subtopics
-    ]
+    result = [asdict(s) for s in normalize_subtopics(subtopics)]
     
     logger.info(f"Retrieved {len(result)} subtopics")
     return result
@@ -1,17 +1,40 @@
 """Utilities module"""
 
 from .logger import setup_logger
-from .usage_tracker import UsageTracker, extract_usage_from_result, StepUsage
+from .usage_tracker import UsageTracker, extract_usage_from_result, usage_from_response, accumulate_usage, StepUsage
 from .image_extractor import extract_images_from_pdf
 from .latex_export import LatexExportUtility, LatexExportError
+from .concurrency import get_shared_semaphore, create_eager_task
+from .json_cache import cache_entry_path, read_json_entry, write_json_entry
+from .latex_cache import latex_cache_key, get_cached_latex, put_cached_latex, coalesce_in_flight, register_file_content, file_content_id
+from .label_parsing import extract_mark, salvage_truncated_json
+from .label_cache import label_cache_key, get_cached_label, put_cached_label
 
 __all__ = [
     "setup_logger",
     "UsageTracker",
     "extract_usage_from_result",
+    "usage_from_response",
+    "accumulate_usage",
     "StepUsage",
     "extract_images_from_pdf",
     "LatexExportUtility",
     "LatexExportError",
+    "get_shared_semaphore",
+    "create_eager_task",
+    "cache_entry_path",
+    "read_json_entry",
+    "write_json_entry",
+    "latex_cache_key",
+    "get_cached_latex",
+    "put_cached_latex",
+    "coalesce_in_flight",
+    "register_file_content",
+    "file_content_id",
+    "extract_mark",
+    "salvage_truncated_json",
+    "label_cache_key",
+    "get_cached_label",
+    "put_cached_label",
 ]
 
@@ -0,0 +1,50 @@
+"""Shared concurrency limits for LLM fan-out"""
+
+import asyncio
+import weakref
+from typing import Any, Coroutine, TypeVar
+
+
+T = TypeVar("T")
+
+
+# Python 3.12+ 提供 eager_task_factory：任务创建时立即同步执行到第一个真正的挂起点
+_eager_task_factory = getattr(asyncio, "eager_task_factory", None)
+
+# 每个事件循环一组按名称共享的 Semaphore（Semaphore 绑定在事件循环上）
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def get_shared_semaphore(name: str, limit: int) -> asyncio.Semaphore:
+    """
+    获取当前事件循环中按名称共享的 Semaphore（首次调用时按 limit 创建）
+    
+    同名的调用方（如 question / answer LaTeX 生成）共用同一个并发上限。
+    
+    Args:
+        name: Semaphore 名称
+        limit: 最大并发数（仅首次创建时生效）
+    
+    Returns:
+        asyncio.Semaphore
+    """
+    loop = asyncio.get_running_loop()
+    semaphores = _semaphores.setdefault(loop, {})
+    semaphore = semaphores.get(name)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, limit))
+        semaphores[name] = semaphore
+    return semaphore
+
+
+def create_eager_task(coro: Coroutine[Any, Any, T]) -> "asyncio.Task[T]":
+    """
+    创建任务并立即执行协程的第一步（Python 3.12+）
+    
+    信号量有空位、缓存命中等不需要挂起的前半段直接在当前调用中完成，
+    省去一次事件循环调度；只作用于这个任务，不修改事件循环的 task factory。
+    旧版本 Python 退回 asyncio.create_task。
+    """
+    if _eager_task_factory is None:
+        return asyncio.create_task(coro)
+    return _eager_task_factory(asyncio.get_running_loop(), coro)
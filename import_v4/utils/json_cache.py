@@ -0,0 +1,44 @@
+"""File-per-key JSON cache entries shared by the on-disk result caches"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+
+def cache_entry_path(cache_dir: str, key: str) -> Path:
+    """缓存条目路径：{cache_dir}/{key[:2]}/{key}.json（按键前缀分目录，避免单个目录文件过多）"""
+    return Path(cache_dir).expanduser() / key[:2] / f"{key}.json"
+
+
+def read_json_entry(path: Path) -> Optional[dict]:
+    """读取一个缓存条目（不存在或已损坏时返回 None）"""
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Failed to read cache entry {path}: {e}")
+        return None
+
+
+def write_json_entry(path: Path, value: dict) -> None:
+    """
+    写入一个缓存条目
+    
+    每次写入使用唯一的临时文件再原子替换：同一进程的多个线程或多个进程并发写入同一条目时，
+    读者只会看到某一次完整的写入结果。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False
+    ) as tmp_file:
+        tmp_file.write(json.dumps(value, ensure_ascii=False))
+    try:
+        os.replace(tmp_file.name, path)
+    except OSError:
+        Path(tmp_file.name).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,55 @@
+"""Question labelling result cache"""
+
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+
+from loguru import logger
+
+from ..config.settings import settings
+from .json_cache import cache_entry_path, read_json_entry, write_json_entry
+
+
+def label_cache_key(
+    question_latex: str,
+    answer_latex: Optional[str],
+    subtopics_text: str,
+    model: str,
+    prompt_version: str,
+    existing_mark: Optional[int] = None,
+    images_base64: Optional[List[str]] = None
+) -> str:
+    """
+    标注缓存键：blake2b(提示词版本 | 模型 | 题目 LaTeX | 答案 LaTeX | subtopic 列表哈希 | 已有分数 | 图片)
+
+    只与题目内容有关（与题号、文件无关），不同试卷中重复出现的相同题目也能命中；
+    subtopic 列表或模型变化时自动失效。
+    """
+    subtopics_hash = hashlib.blake2b(subtopics_text.encode("utf-8"), digest_size=16).hexdigest()
+    raw = f"{prompt_version}|{model}|{question_latex}|{answer_latex or ''}|{subtopics_hash}|{existing_mark}"
+    hasher = hashlib.blake2b(raw.encode("utf-8"), digest_size=32)
+    for image_base64 in images_base64 or []:
+        hasher.update(image_base64.encode("ascii"))
+    return hasher.hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return cache_entry_path(settings.label_cache_dir, key)
+
+
+async def get_cached_label(key: str) -> Optional[dict]:
+    """读取缓存的标注输出（未启用缓存或未命中时返回 None）"""
+    if not settings.label_cache_enabled:
+        return None
+    return await asyncio.to_thread(read_json_entry, _cache_path(key))
+
+
+async def put_cached_label(key: str, value: dict) -> None:
+    """写入标注输出缓存（写入失败只记录警告）"""
+    if not settings.label_cache_enabled:
+        return
+    try:
+        await asyncio.to_thread(write_json_entry, _cache_path(key), value)
+    except OSError as e:
+        logger.warning(f"Failed to write label cache: {e}")
@@ -0,0 +1,40 @@
+"""Pure parsing helpers for question labelling (no LLM / IO dependencies)"""
+
+import re
+import json
+from typing import Optional
+
+# 题目中的分数标注，如 [5]、[8 marks]（前面紧跟字母或反斜杠的是 LaTeX 可选参数，如 \sqrt[3]、\\[2]，不算）
+_MARK_RE = re.compile(r"(?<![A-Za-z\\])\[(\d{1,2})\s*(?:marks?)?\]", re.IGNORECASE)
+
+
+def extract_mark(question_latex: str) -> Optional[int]:
+    """
+    用正则从题目 LaTeX 中提取分数（如 [5]、[8 marks]）
+    
+    只有恰好一处分数标注时才返回；没有或有多处（如多个小题各自标分）时返回 None，交给模型判断。
+    """
+    matches = _MARK_RE.findall(question_latex or "")
+    return int(matches[0]) if len(matches) == 1 else None
+
+
+def salvage_truncated_json(content: str) -> Optional[dict]:
+    """
+    从被截断的 JSON 对象中取出已经完整输出的字段
+    
+    从后往前依次在逗号处截断并补上 "}" 尝试解析，返回能解析出的最长前缀；
+    输出字段按提示词中的顺序排列，reasoning 在最后，因此截断通常只丢失 reasoning。
+    """
+    start = content.find("{")
+    if start < 0:
+        return None
+    end = len(content)
+    while True:
+        end = content.rfind(",", start, end)
+        if end < 0:
+            return None
+        try:
+            data = json.loads(content[start:end] + "}")
+        except json.JSONDecodeError:
+            continue
+        return data if isinstance(data, dict) else None
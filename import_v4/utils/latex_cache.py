@@ -0,0 +1,126 @@
+"""LaTeX generation result cache"""
+
+import asyncio
+import hashlib
+import weakref
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+from ..config.settings import settings
+from .json_cache import cache_entry_path, read_json_entry, write_json_entry
+
+
+T = TypeVar("T")
+
+# 每个事件循环中正在生成的 LaTeX：缓存键 -> Future（相同请求只调用一次 LLM）
+_in_flight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Future]]" = weakref.WeakKeyDictionary()
+
+# 已上传文件 ID -> 文件内容标识（源 PDF 的 SHA-256）；file_id 每次运行都不同，缓存键改用内容标识
+_file_content_ids: dict[str, str] = {}
+
+
+def register_file_content(file_id: str, content_id: str) -> None:
+    """登记上传文件的内容标识（上传时调用），使 LaTeX 缓存在重新上传后仍能命中"""
+    _file_content_ids[file_id] = content_id
+
+
+def file_content_id(file_id: str) -> str:
+    """文件 ID 对应的内容标识；未登记时退回 file_id 本身（缓存只在本次运行内有效）"""
+    return _file_content_ids.get(file_id, file_id)
+
+
+def latex_cache_key(
+    kind: str,
+    file_id: str,
+    question_label: str,
+    question_index: int,
+    pages: List[int],
+    prompt_version: str,
+    model: str
+) -> str:
+    """
+    LaTeX 缓存键：sha256(类型 | 文件内容标识 | 题号 | 题目索引 | 页码 | 提示词版本 | 模型)
+    
+    file_id 经 register_file_content 登记过时使用源 PDF 的内容哈希，跨运行也能命中。
+    
+    Args:
+        kind: "question" or "answer"
+        file_id: 已上传的 PDF 文件 ID（或已解析好的内容标识）
+        question_label: 题目标签
+        question_index: 题目索引
+        pages: 页码列表
+        prompt_version: 提示词版本（提示词修改时递增，使旧缓存失效）
+        model: 生成使用的模型名
+    """
+    raw = (
+        f"{kind}|{file_content_id(file_id)}|{question_label}|{question_index}|"
+        f"{','.join(map(str, pages))}|{prompt_version}|{model}"
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return cache_entry_path(settings.latex_cache_dir, key)
+
+
+async def get_cached_latex(key: str) -> Optional[dict]:
+    """读取缓存的 LaTeX 输出（未启用缓存、强制刷新或未命中时返回 None）"""
+    if not settings.latex_cache_enabled or settings.latex_cache_force_refresh:
+        return None
+    return await asyncio.to_thread(read_json_entry, _cache_path(key))
+
+
+async def put_cached_latex(key: str, value: dict) -> None:
+    """写入 LaTeX 输出缓存（写入失败只记录警告）"""
+    if not settings.latex_cache_enabled:
+        return
+    try:
+        await asyncio.to_thread(write_json_entry, _cache_path(key), value)
+    except OSError as e:
+        logger.warning(f"Failed to write LaTeX cache: {e}")
+
+
+async def coalesce_in_flight(key: str, factory: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+    """
+    合并相同 key 的并发请求：第一个调用者执行 factory，其余调用者等待同一个结果
+    
+    Args:
+        key: 请求键（通常为 latex_cache_key）
+        factory: 实际执行请求的协程工厂
+    
+    Returns:
+        (结果, 是否为共享结果)；共享结果的调用方不应重复统计 usage
+    """
+    loop = asyncio.get_running_loop()
+    pending = _in_flight.setdefault(loop, {})
+    
+    while True:
+        future = pending.get(key)
+        if future is None:
+            break
+        try:
+            return await asyncio.shield(future), True
+        except asyncio.CancelledError:
+            # 执行者被取消时重新竞争执行；自己被取消则继续向上抛出
+            if not future.cancelled():
+                raise
+    
+    future = loop.create_future()
+    # 没有等待者时也标记异常已读取，避免 "exception was never retrieved" 警告
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    pending[key] = future
+    try:
+        result = await factory()
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result, False
+    finally:
+        pending.pop(key, None)
+        if not future.done():
+            # 执行者被取消：唤醒等待者重新竞争执行
+            future.cancel()
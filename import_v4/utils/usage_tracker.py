@@ -1,6 +1,6 @@
 """Usage tracking and cost calculation utilities"""
 
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 from dataclasses import dataclass, field
 from agents import Usage
 
@@ -187,3 +187,51 @@ def extract_usage_from_result(result) -> Usage:
     
     return total_usage
 
+
+def usage_from_response(response_usage: Optional[Dict[str, int]]) -> Usage:
+    """
+    从 LLMResponse.usage 字典构造 Usage 对象（一次性传入所有字段，避免逐个属性赋值）
+    
+    Args:
+        response_usage: LLMResponse.usage（可能为 None）
+    
+    Returns:
+        Usage 对象；response_usage 为空时返回空的 Usage()
+    """
+    if not response_usage:
+        return Usage()
+    
+    return Usage(
+        requests=1,
+        input_tokens=response_usage.get("prompt_tokens", 0),
+        output_tokens=response_usage.get("completion_tokens", 0),
+        total_tokens=response_usage.get("total_tokens", 0)
+    )
+
+
+def accumulate_usage(target: Usage, parts: Iterable[Usage]) -> Usage:
+    """
+    将多个 Usage 的 token 计数一次性累加到 target（先求和再写回，避免逐个 add）
+    
+    只累加 requests / input_tokens / output_tokens / total_tokens，
+    适用于直接调用 API 构造的 Usage（不含 token details）。
+    
+    Args:
+        target: 累加目标
+        parts: 需要累加的 Usage
+    
+    Returns:
+        target
+    """
+    requests = input_tokens = output_tokens = total_tokens = 0
+    for part in parts:
+        requests += part.requests
+        input_tokens += part.input_tokens
+        output_tokens += part.output_tokens
+        total_tokens += part.total_tokens
+    
+    target.requests += requests
+    target.input_tokens += input_tokens
+    target.output_tokens += output_tokens
+    target.total_tokens += total_tokens
+    return target
@@ -11,14 +11,19 @@ from loguru import logger
 
 from .config.settings import settings
 from .models.schemas import QuestionList, QuestionListWithPages
-from .preprocessing.pdf_renderer import preprocess_for_classification, add_page_markers_to_pdf
+from .preprocessing.pdf_renderer import preprocess_for_classification, add_page_markers_to_pdf, file_sha256
 from .services.file_uploader import (
     upload_pdfs_get_file_ids,
     cleanup_files,
     FileUploadResult
 )
 from .agents._0_classifier_agent import classify_exam_type_direct
-from .agents._1_question_lister_agent import list_all_questions_direct, list_all_questions_with_pages_direct, calculate_cost
+from .agents._1_question_lister_agent import (
+    list_all_questions_direct,
+    list_all_questions_with_pages_direct,
+    calculate_cost,
+    get_marked_file_id,
+)
 from .agents import (
     generate_question_and_answer_latex_concurrent,
     label_question_direct,
@@ -26,6 +31,7 @@ from .agents import (
 from .utils.usage_tracker import UsageTracker
 from .utils.image_extractor import extract_images_from_pdf
 from .utils.latex_export import LatexExportUtility
+from .utils.latex_cache import register_file_content
 from openai import AsyncOpenAI
 
 
@@ -61,7 +67,7 @@ async def run_file_based_workflow_to_lister(
             "processing_time_seconds": float
         }
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     # === Setup ===
     if exam_id is None:
@@ -190,7 +196,7 @@ async def run_file_based_workflow_to_lister(
             logger.info(f"   Saved question list to: {question_list_file}")
         
         # === 最终总结 ===
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
         
         # 获取 usage 汇总
         usage_summary = usage_tracker.get_summary()
@@ -313,7 +319,7 @@ async def run_complete_workflow(
             "api_usage": dict
         }
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     # === Setup ===
     if exam_id is None:
@@ -344,6 +350,7 @@ async def run_complete_workflow(
     solution_marked_file_id = None
     paper_marked_path = None
     solution_marked_path = None
+    marked_files_shared = False  # 带标记 PDF 是否来自 lister 的共享上传缓存（共享时不在这里删除）
     openai_client = None
     
     # 创建 Usage Tracker
@@ -459,28 +466,49 @@ async def run_complete_workflow(
         
         # Note: openai_client already created in Step 3
         
-        # Add page markers to PDFs for LaTeX generation
-        temp_dir = output_dir / "temp_marked_pdfs"
-        temp_dir.mkdir(parents=True, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        paper_marked_path = temp_dir / f"paper_marked_{timestamp}.pdf"
-        solution_marked_path = temp_dir / f"solution_marked_{timestamp}.pdf"
-        
-        logger.info("Adding page markers to PDFs...")
-        add_page_markers_to_pdf(paper_pdf_path, str(paper_marked_path), zero_based=True)
-        add_page_markers_to_pdf(solution_pdf_path, str(solution_marked_path), zero_based=True)
-        
-        # Upload marked PDFs
-        with open(paper_marked_path, 'rb') as f:
-            paper_marked_file = await openai_client.files.create(file=f, purpose="assistants")
-        with open(solution_marked_path, 'rb') as f:
-            solution_marked_file = await openai_client.files.create(file=f, purpose="assistants")
-        
-        paper_marked_file_id = paper_marked_file.id
-        solution_marked_file_id = solution_marked_file.id
-        
-        logger.info(f"✓ Uploaded marked PDFs")
+        if settings.reuse_uploaded_files:
+            # 直接复用 Step 4 已上传的带标记 PDF（内容相同），不再重新渲染和上传；
+            # 这些文件由 lister 的上传缓存在进程退出时统一删除
+            paper_marked_file_id, solution_marked_file_id = await asyncio.gather(
+                get_marked_file_id(paper_pdf_path, "paper"),
+                get_marked_file_id(solution_pdf_path, "solution")
+            )
+            marked_files_shared = True
+            logger.info(f"✓ Reusing marked PDFs uploaded in Step 4")
+        else:
+            # Add page markers to PDFs for LaTeX generation
+            temp_dir = output_dir / "temp_marked_pdfs"
+            temp_dir.mkdir(parents=True, exist_ok=True)
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            paper_marked_path = temp_dir / f"paper_marked_{timestamp}.pdf"
+            solution_marked_path = temp_dir / f"solution_marked_{timestamp}.pdf"
+            
+            logger.info("Adding page markers to PDFs...")
+            # 在线程中并行渲染，避免阻塞事件循环
+            await asyncio.gather(
+                asyncio.to_thread(add_page_markers_to_pdf, paper_pdf_path, str(paper_marked_path), True),
+                asyncio.to_thread(add_page_markers_to_pdf, solution_pdf_path, str(solution_marked_path), True)
+            )
+            
+            # Upload marked PDFs
+            with open(paper_marked_path, 'rb') as f:
+                paper_marked_file = await openai_client.files.create(file=f, purpose="assistants")
+            with open(solution_marked_path, 'rb') as f:
+                solution_marked_file = await openai_client.files.create(file=f, purpose="assistants")
+            
+            paper_marked_file_id = paper_marked_file.id
+            solution_marked_file_id = solution_marked_file.id
+            
+            # 用源 PDF 的内容哈希作为 LaTeX 缓存的文件标识（与 add_page_markers_cached 的缓存文件名一致）
+            paper_sha256, solution_sha256 = await asyncio.gather(
+                asyncio.to_thread(file_sha256, paper_pdf_path),
+                asyncio.to_thread(file_sha256, solution_pdf_path)
+            )
+            register_file_content(paper_marked_file_id, f"marked_0_{paper_sha256}")
+            register_file_content(solution_marked_file_id, f"marked_0_{solution_sha256}")
+            
+            logger.info(f"✓ Uploaded marked PDFs")
         logger.info(f"  Paper marked file ID: {paper_marked_file_id}")
         logger.info(f"  Solution marked file ID: {solution_marked_file_id}")
         
@@ -523,37 +551,29 @@ async def run_complete_workflow(
                 images_dir = output_dir / "extracted_images" / f"question_{question_item.question_index}"
                 images_dir.mkdir(parents=True, exist_ok=True)
                 
-                # Extract question images
-                if q_latex.question_images:
-                    logger.info(f"  Extracting {len(q_latex.question_images)} question images...")
-                    updated_q_images = extract_images_from_pdf(
-                        pdf_path=paper_pdf_path,
-                        images_info=q_latex.question_images,
+                # Extract question / answer images（PyMuPDF 截图放到线程中并行执行，不阻塞其他题目的 LLM 调用）
+                async def _extract(pdf_path, images_info, prefix, kind):
+                    if not images_info:
+                        return images_info
+                    logger.info(f"  Extracting {len(images_info)} {kind} images...")
+                    updated_images = await asyncio.to_thread(
+                        extract_images_from_pdf,
+                        pdf_path=pdf_path,
+                        images_info=images_info,
                         output_dir=images_dir,
-                        prefix=f"q{question_item.question_index}_image"
+                        prefix=prefix
                     )
                     # Update image paths to absolute paths
-                    for img in updated_q_images:
+                    for img in updated_images:
                         if img.image_path:
                             img.image_path = str(images_dir / img.image_path)
-                    q_latex.question_images = updated_q_images
-                    logger.info(f"  ✓ Extracted {len(updated_q_images)} question images")
+                    logger.info(f"  ✓ Extracted {len(updated_images)} {kind} images")
+                    return updated_images
                 
-                # Extract answer images
-                if a_latex.answer_images:
-                    logger.info(f"  Extracting {len(a_latex.answer_images)} answer images...")
-                    updated_a_images = extract_images_from_pdf(
-                        pdf_path=solution_pdf_path,
-                        images_info=a_latex.answer_images,
-                        output_dir=images_dir,
-                        prefix=f"s{question_item.question_index}_image"
-                    )
-                    # Update image paths to absolute paths
-                    for img in updated_a_images:
-                        if img.image_path:
-                            img.image_path = str(images_dir / img.image_path)
-                    a_latex.answer_images = updated_a_images
-                    logger.info(f"  ✓ Extracted {len(updated_a_images)} answer images")
+                q_latex.question_images, a_latex.answer_images = await asyncio.gather(
+                    _extract(paper_pdf_path, q_latex.question_images, f"q{question_item.question_index}_image", "question"),
+                    _extract(solution_pdf_path, a_latex.answer_images, f"s{question_item.question_index}_image", "answer")
+                )
                 
                 # Note: LaTeX outputs will be collected after all questions are processed
                 
@@ -685,9 +705,9 @@ async def run_complete_workflow(
         ]
         
         # Execute all tasks concurrently
-        concurrent_start = time.time()
+        concurrent_start = time.perf_counter()
         results = await asyncio.gather(*tasks, return_exceptions=True)
-        concurrent_duration = time.time() - concurrent_start
+        concurrent_duration = time.perf_counter() - concurrent_start
         
         # Process results
         all_questions_results = []
@@ -740,7 +760,7 @@ async def run_complete_workflow(
         logger.info(f"{'='*80}")
         
         # === Final Summary ===
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
         
         # Get workflow usage summary
         workflow_usage_summary = usage_tracker.get_summary()
@@ -871,7 +891,7 @@ async def run_complete_workflow(
         
     finally:
         # Clean up uploaded marked PDFs
-        if paper_marked_file_id and openai_client:
+        if paper_marked_file_id and openai_client and not marked_files_shared:
             try:
                 await openai_client.files.delete(paper_marked_file_id)
                 await openai_client.files.delete(solution_marked_file_id)
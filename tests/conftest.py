@@ -0,0 +1,29 @@
+"""
+Shared pytest configuration
+
+import_v4 的包级 __init__ 会导入整个工作流（agents SDK、PyMuPDF、外层 management 包等）；
+这里把 import_v4 及其子包注册为不执行 __init__ 的空包，测试只加载被测的叶子模块。
+"""
+
+import os
+import sys
+import types
+from pathlib import Path
+
+# settings 在导入时校验 API Key；测试不发出真实请求，给一个占位值即可
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+_IMPORT_V4_DIR = Path(__file__).resolve().parent.parent / "import_v4"
+
+
+def _register_bare_package(name: str, path: Path) -> None:
+    if name in sys.modules:
+        return
+    package = types.ModuleType(name)
+    package.__path__ = [str(path)]
+    sys.modules[name] = package
+
+
+_register_bare_package("import_v4", _IMPORT_V4_DIR)
+for _subpackage in ("utils", "clients"):
+    _register_bare_package(f"import_v4.{_subpackage}", _IMPORT_V4_DIR / _subpackage)
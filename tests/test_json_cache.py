@@ -0,0 +1,45 @@
+"""Tests for the file-per-key JSON cache helpers"""
+
+import threading
+
+from import_v4.utils.json_cache import cache_entry_path, read_json_entry, write_json_entry
+
+
+class TestJsonCache:
+    """Test reading and writing JSON cache entries"""
+    
+    def test_round_trip(self, tmp_path):
+        """Test that a written entry is read back under its key-prefix directory"""
+        path = cache_entry_path(str(tmp_path), "abcdef")
+        write_json_entry(path, {"exam_type": "type1"})
+        assert path == tmp_path / "ab" / "abcdef.json"
+        assert read_json_entry(path) == {"exam_type": "type1"}
+    
+    def test_missing_or_corrupt_entry(self, tmp_path):
+        """Test that missing and corrupt entries read as None"""
+        path = cache_entry_path(str(tmp_path), "abcdef")
+        assert read_json_entry(path) is None
+        path.parent.mkdir(parents=True)
+        path.write_text("{not json", encoding="utf-8")
+        assert read_json_entry(path) is None
+    
+    def test_concurrent_writes_same_key(self, tmp_path):
+        """Test that concurrent same-key writes from threads leave one complete entry"""
+        path = cache_entry_path(str(tmp_path), "abcdef")
+        errors = []
+        
+        def _write(i):
+            try:
+                write_json_entry(path, {"i": i, "padding": "x" * 100_000})
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=_write, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert read_json_entry(path)["i"] in range(20)
+        assert list(path.parent.iterdir()) == [path]
@@ -0,0 +1,75 @@
+"""Tests for the question labelling parsing helpers"""
+
+import pytest
+from import_v4.utils.label_parsing import extract_mark, salvage_truncated_json
+
+
+class TestExtractMark:
+    """Test mark extraction from question LaTeX"""
+    
+    @pytest.mark.parametrize("question_latex, expected", [
+        (r"Solve $x^2 = 4$. [5]", 5),
+        (r"Prove the identity. [8 marks]", 8),
+        (r"State the theorem. [1 Mark]", 1),
+    ])
+    def test_single_mark(self, question_latex, expected):
+        """Test that a single mark annotation is extracted"""
+        assert extract_mark(question_latex) == expected
+    
+    @pytest.mark.parametrize("question_latex", [
+        r"Simplify $\sqrt[3]{27}$.",
+        r"First line\\[2]second line",
+        r"Use the command \item[3] here.",
+    ])
+    def test_latex_optional_arguments_ignored(self, question_latex):
+        """Test that LaTeX optional arguments are not mistaken for marks"""
+        assert extract_mark(question_latex) is None
+    
+    def test_optional_argument_alongside_mark(self):
+        """Test that an optional argument does not hide the real mark"""
+        assert extract_mark(r"Evaluate $\sqrt[3]{8}$. [4]") == 4
+    
+    def test_multiple_marks_returns_none(self):
+        """Test that multiple mark annotations are left to the model"""
+        assert extract_mark(r"(a) Find $x$. [2] (b) Find $y$. [3]") is None
+    
+    @pytest.mark.parametrize("question_latex", ["", None, "No marks here.", "[100]"])
+    def test_no_mark(self, question_latex):
+        """Test inputs without a recognisable mark annotation"""
+        assert extract_mark(question_latex) is None
+
+
+class TestSalvageTruncatedJson:
+    """Test recovery of fields from length-truncated JSON responses"""
+    
+    def test_drops_truncated_trailing_field(self):
+        """Test that the complete prefix is kept and the cut-off field dropped"""
+        content = (
+            '{"question_index": 3, "topic_id": 1, "subtopic_id": 42, '
+            '"question_type": "short answer", "reasoning": "abc, def'
+        )
+        assert salvage_truncated_json(content) == {
+            "question_index": 3,
+            "topic_id": 1,
+            "subtopic_id": 42,
+            "question_type": "short answer",
+        }
+    
+    def test_ignores_leading_text(self):
+        """Test that text before the opening brace is skipped"""
+        content = 'Here is the label: {"topic_id": 2, "confidence": 0.9, "reason'
+        assert salvage_truncated_json(content) == {"topic_id": 2, "confidence": 0.9}
+    
+    def test_commas_inside_strings(self):
+        """Test that commas inside a truncated string value are not mistaken for field boundaries"""
+        content = '{"topic_id": 2, "question_type": "a, b", "reasoning": "x, y, z'
+        assert salvage_truncated_json(content) == {"topic_id": 2, "question_type": "a, b"}
+    
+    @pytest.mark.parametrize("content", [
+        "nothing",
+        '{"a": "x, y',
+        '{"a": {"b": 1, "c',
+    ])
+    def test_unrecoverable(self, content):
+        """Test inputs without any complete top-level field"""
+        assert salvage_truncated_json(content) is None
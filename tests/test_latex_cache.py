@@ -0,0 +1,106 @@
+"""Tests for in-flight request coalescing in the LaTeX cache"""
+
+import asyncio
+
+import pytest
+from import_v4.utils.latex_cache import coalesce_in_flight
+
+
+class TestCoalesceInFlight:
+    """Test coalesce_in_flight"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_result(self):
+        """Test that concurrent callers with the same key run the factory once"""
+        calls = 0
+        release = asyncio.Event()
+        
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "latex"
+        
+        runner = asyncio.create_task(coalesce_in_flight("key-shared", factory))
+        waiter = asyncio.create_task(coalesce_in_flight("key-shared", factory))
+        await asyncio.sleep(0)
+        release.set()
+        
+        assert await runner == ("latex", False)
+        assert await waiter == ("latex", True)
+        assert calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_different_keys_not_coalesced(self):
+        """Test that different keys each run their own factory"""
+        async def factory():
+            await asyncio.sleep(0)
+            return "latex"
+        
+        results = await asyncio.gather(
+            coalesce_in_flight("key-a", factory),
+            coalesce_in_flight("key-b", factory),
+        )
+        assert results == [("latex", False), ("latex", False)]
+    
+    @pytest.mark.asyncio
+    async def test_waiter_takes_over_when_runner_cancelled(self):
+        """Test that a waiter re-runs the factory after the runner is cancelled"""
+        calls = 0
+        started = asyncio.Event()
+        
+        async def slow_factory():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.Event().wait()
+        
+        async def fast_factory():
+            nonlocal calls
+            calls += 1
+            return "latex"
+        
+        runner = asyncio.create_task(coalesce_in_flight("key-cancel", slow_factory))
+        await started.wait()
+        waiter = asyncio.create_task(coalesce_in_flight("key-cancel", fast_factory))
+        await asyncio.sleep(0)
+        
+        runner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await runner
+        
+        assert await waiter == ("latex", False)
+        assert calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_exception_propagates_to_all_waiters(self):
+        """Test that a factory error is raised in the runner and every waiter"""
+        calls = 0
+        release = asyncio.Event()
+        
+        async def factory():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            raise RuntimeError("upstream failed")
+        
+        tasks = [asyncio.create_task(coalesce_in_flight("key-error", factory)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_key_released_after_completion(self):
+        """Test that a later call with the same key runs the factory again"""
+        calls = 0
+        
+        async def factory():
+            nonlocal calls
+            calls += 1
+            return calls
+        
+        assert await coalesce_in_flight("key-again", factory) == (1, False)
+        assert await coalesce_in_flight("key-again", factory) == (2, False)
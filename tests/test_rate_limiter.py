@@ -0,0 +1,98 @@
+"""Tests for the preemptive LLM rate limiter"""
+
+import pytest
+from import_v4.clients import rate_limiter as rate_limiter_module
+from import_v4.clients.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    """Controllable replacement for time.monotonic / asyncio.sleep"""
+    
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+    
+    def monotonic(self):
+        return self.now
+    
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Patch the limiter's clock and sleep with a fake clock"""
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limiter_module.asyncio, "sleep", fake.sleep)
+    return fake
+
+
+class TestRateLimiter:
+    """Test the RateLimiter token buckets"""
+    
+    @pytest.mark.asyncio
+    async def test_disabled_when_unlimited(self, clock):
+        """Test that zero limits never wait"""
+        limiter = RateLimiter(0, 0)
+        assert limiter.enabled is False
+        for _ in range(100):
+            await limiter.acquire(10_000)
+        assert clock.sleeps == []
+    
+    @pytest.mark.asyncio
+    async def test_burst_within_budget(self, clock):
+        """Test that requests within the per-minute budget do not wait"""
+        limiter = RateLimiter(requests_per_minute=3, tokens_per_minute=0)
+        for _ in range(3):
+            await limiter.acquire(100)
+        assert clock.sleeps == []
+    
+    @pytest.mark.asyncio
+    async def test_request_budget_wait(self, clock):
+        """Test the wait once the request budget is exhausted"""
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=0)
+        for _ in range(60):
+            await limiter.acquire(0)
+        await limiter.acquire(0)
+        # 每秒回填 1 个请求额度
+        assert clock.sleeps == [pytest.approx(1.0)]
+    
+    @pytest.mark.asyncio
+    async def test_partial_refill_shortens_wait(self, clock):
+        """Test that elapsed time is credited before computing the wait"""
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=0)
+        for _ in range(60):
+            await limiter.acquire(0)
+        clock.now += 0.25
+        await limiter.acquire(0)
+        assert clock.sleeps == [pytest.approx(0.75)]
+    
+    @pytest.mark.asyncio
+    async def test_token_budget_wait(self, clock):
+        """Test the wait computed from the token deficit"""
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=6000)
+        await limiter.acquire(6000)
+        await limiter.acquire(1500)
+        # 每秒回填 100 token，缺 1500 token 需要 15 秒
+        assert clock.sleeps == [pytest.approx(15.0)]
+    
+    @pytest.mark.asyncio
+    async def test_wait_uses_larger_deficit(self, clock):
+        """Test that the longer of the request and token waits is used"""
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+        for _ in range(60):
+            await limiter.acquire(100)
+        await limiter.acquire(300)
+        # 请求额度需要 1 秒，token 额度需要 3 秒
+        assert clock.sleeps == [pytest.approx(3.0)]
+    
+    @pytest.mark.asyncio
+    async def test_estimate_capped_at_tpm(self, clock):
+        """Test that an estimate above the TPM limit is charged as the full minute budget"""
+        limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=1000)
+        await limiter.acquire(50_000)
+        assert clock.sleeps == []
+        await limiter.acquire(50_000)
+        assert clock.sleeps == [pytest.approx(60.0)]